@@ -1,8 +1,92 @@
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.html import format_html
 
 # Register your models here.
 
-from .models import Author, Genre, Book, BookInstance, Language
+from . import holds
+from .models import Author, Genre, Book, BookInstance, Hold, Language
+from .pagination import EstimatedCountPaginator
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """An inline formset that shows one page of the related rows instead of all of them.
+
+    A bound formset edits exactly the rows that were rendered (by their submitted ids), so rows
+    added by someone else in the meantime cannot shift the page under the form.
+    """
+    per_page = 20
+    page = 1
+    ordering = None
+    changelist_url = None
+    previous_query = next_query = None
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            queryset = super().get_queryset()
+            if self.ordering:
+                queryset = queryset.order_by(*self.ordering)
+            if self.is_bound:
+                pk_name = self.model._meta.pk.name
+                ids = [self.data.get(f'{self.add_prefix(i)}-{pk_name}') for i in range(self.initial_form_count())]
+                queryset = queryset.filter(pk__in=[pk for pk in ids if pk])
+            else:
+                start = (self.page - 1) * self.per_page
+                queryset = queryset[start:start + self.per_page]
+            self._queryset = queryset
+        return self._queryset
+
+    @property
+    def total(self):
+        if not hasattr(self, '_total'):
+            self._total = self.queryset.count() if self.instance.pk is not None else 0
+        return self._total
+
+    @property
+    def first_row(self):
+        return min(self.total, (self.page - 1) * self.per_page + 1)
+
+    @property
+    def last_row(self):
+        return min(self.total, self.page * self.per_page)
+
+    @property
+    def has_previous(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+
+class PaginatedInlineMixin:
+    """InlineModelAdmin mixin rendering PaginatedInlineFormSet pages, picked with ?<prefix>-page=N"""
+    formset = PaginatedInlineFormSet
+    template = 'admin/catalog/edit_inline/paginated_tabular.html'
+    per_page = 20
+    ordering = None
+
+    def get_changelist_url(self, obj):
+        """URL of the full list of obj's related rows (optional)"""
+        return None
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        param = f'{formset.get_default_prefix()}-page'
+        page = request.GET.get(param, '')
+        formset.page = max(1, int(page)) if page.isdigit() else 1
+        formset.per_page = self.per_page
+        formset.ordering = self.ordering
+        formset.changelist_url = self.get_changelist_url(obj) if obj is not None else None
+
+        def query(page):
+            params = request.GET.copy()
+            params[param] = page
+            return '?' + params.urlencode()
+        formset.previous_query = query(formset.page - 1)
+        formset.next_query = query(formset.page + 1)
+        return formset
 
 # admin.site.register(Book)
 # admin.site.register(Author)
@@ -11,34 +95,78 @@ admin.site.register(Genre)
 admin.site.register(Language)
 # Define the admin class
 
-class BookInline(admin.TabularInline):
+class BookInline(PaginatedInlineMixin, admin.TabularInline):
     model = Book
+    ordering = ('title', 'id')
     def get_extra(self, request,obj=None, **kwargs):
         return 0
+
+    def get_changelist_url(self, obj):
+        return reverse('admin:catalog_book_changelist') + f'?author__id__exact={obj.pk}'
+
 class AuthorAdmin(admin.ModelAdmin):
     list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
     fields = ['first_name','last_name',('date_of_birth','date_of_death')]
+    # Needed by the author autocomplete on the book form
+    search_fields = ('last_name', 'first_name')
     inlines = [BookInline]
 
 # Register the admin class with the associated model
 admin.site.register(Author, AuthorAdmin)
 
-class BooksInstanceInline(admin.TabularInline):
+class BooksInstanceInline(PaginatedInlineMixin, admin.TabularInline):
     model = BookInstance
+    ordering = ('status', 'due_back', 'id')
+    # A search box per copy rather than a <select> of every user on each row
+    autocomplete_fields = ['borrower']
     def get_extra(self, request, obj=None, **kwargs):
         return 0
 
+    def get_queryset(self, request):
+        # Each row's label (BookInstance.__str__) shows the book title
+        return super().get_queryset(request).select_related('book', 'borrower')
+
+    def get_changelist_url(self, obj):
+        return reverse('admin:catalog_bookinstance_changelist') + f'?book__id__exact={obj.pk}'
+
 # Register the Admin classes for Book using the decorator
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     list_display = ('title','author','display_genre')
+    # Join the author and prefetch the genres, rather than two queries per row
+    list_select_related = ('author',)
+    search_fields = ('title', 'isbn')
+    autocomplete_fields = ['author']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ('copy_summary',)
     inlines = [BooksInstanceInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('genre')
+
+    def copy_summary(self, obj):
+        """Copies by status, from the Book counters rather than by loading the copies"""
+        if obj.pk is None:
+            return '-'
+        url = reverse('admin:catalog_bookinstance_changelist') + f'?book__id__exact={obj.pk}'
+        return format_html('{} available, {} on loan, {} in maintenance, {} reserved (<a href="{}">list them</a>)',
+                           obj.copies_available, obj.copies_on_loan, obj.copies_maintenance,
+                           obj.copies_reserved, url)
+    copy_summary.short_description = 'Copies'
+
 # Register the Admin Classes for BookInstance using the decorator
 @admin.register(BookInstance)
 class BookInstanceAdmin(admin.ModelAdmin):
     list_display = ('book','status', 'borrower', 'due_back','id')
     list_filter = ('status','due_back')
+    list_select_related = ('book', 'borrower')
+    # Copies are the biggest table: estimate the unfiltered count and skip the second,
+    # unfiltered COUNT(*) behind the "N total" link of a filtered list
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Search boxes instead of <select>s listing every book and every user
+    autocomplete_fields = ['book', 'borrower']
     fieldsets = (
         (None, {
             'fields': (
@@ -49,4 +177,22 @@ class BookInstanceAdmin(admin.ModelAdmin):
             'fields': ('status','due_back','borrower')
         }),
     )
-    
\ No newline at end of file
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    """Holds are placed by patrons (and queues changed through catalog/holds.py, which keeps the
+    sequence numbers gap-free), so the admin lists them and can cancel them"""
+    list_display = ('book', 'patron', 'status', 'sequence', 'placed_at', 'pickup_by')
+    list_filter = ('status',)
+    list_select_related = ('book', 'patron')
+    readonly_fields = ('book', 'patron', 'status', 'sequence', 'copy', 'placed_at', 'ready_at', 'pickup_by')
+    actions = ['cancel_holds']
+
+    def has_add_permission(self, request):
+        return False
+
+    def cancel_holds(self, request, queryset):
+        for hold in queryset.filter(status__in=(Hold.WAITING, Hold.READY)):
+            holds.cancel_hold(hold)
+    cancel_holds.short_description = 'Cancel the selected holds'
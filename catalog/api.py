@@ -0,0 +1,267 @@
+"""Read-only JSON API over the catalog: books, authors, copies and loans.
+
+Rows are read with values() rather than as model instances, and only the columns asked for:
+?fields=title,author.last_name picks fields (a dotted name selects a field of a related
+object), and ?include=author,copies.book expands relations. Each expanded relation is loaded
+with one query for the whole page (WHERE key IN (...)), so a request costs one query per
+relation path, however many rows it returns or how deep the includes go.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import PermissionDenied, ValidationError
+
+from catalog.models import Author, Book, BookInstance, Genre
+from catalog.pagination import CursorPaginator
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# How many relations deep ?include= may go (e.g. copies.book.author is 3)
+MAX_INCLUDE_DEPTH = 3
+
+
+class ApiError(Exception):
+    """A malformed API request; the message is returned to the client with a 400 status"""
+
+
+class Relation:
+    """A relation ?include= can expand.
+
+    A to-one relation reads the target id from the parent's `key` column (e.g. author_id).
+    A to-many relation selects the target rows whose `remote` lookup is one of the parent ids.
+    """
+
+    def __init__(self, resource, key=None, remote=None):
+        self.resource_name = resource
+        self.key = key
+        self.remote = remote
+
+    @property
+    def many(self):
+        return self.remote is not None
+
+    @property
+    def resource(self):
+        return RESOURCES[self.resource_name]
+
+
+class Resource:
+    """What the API exposes for one model.
+
+    fields maps each public field name to its values() lookup, queryset(request) returns the
+    rows the request may see, and ordering is a unique sequence of fields used for the
+    keyset pagination of lists and the order of expanded to-many relations.
+    """
+
+    def __init__(self, queryset, fields, relations=None, ordering=('id',)):
+        self.queryset = queryset
+        self.fields = fields
+        self.relations = relations or {}
+        self.ordering = tuple(ordering)
+
+
+def loans_queryset(request):
+    """Copies on loan: all of them for librarians, otherwise only the signed-in user's"""
+    if not request.user.is_authenticated:
+        raise PermissionDenied('Sign in to see loans')
+    loans = BookInstance.objects.filter(status__exact='o')
+    if not request.user.has_perm('catalog.can_mark_returned'):
+        loans = loans.filter(borrower=request.user)
+    return loans
+
+
+COPY_FIELDS = {
+    'id': 'id',
+    'book': 'book_id',
+    'imprint': 'imprint',
+    'status': 'status',
+    'due_back': 'due_back',
+}
+
+RESOURCES = {
+    'books': Resource(
+        lambda request: Book.objects.all(),
+        {
+            'id': 'id',
+            'title': 'title',
+            'isbn': 'isbn',
+            'summary': 'summary',
+            'author': 'author_id',
+            'language': 'language__name',
+            'copies_available': 'copies_available',
+            'copies_on_loan': 'copies_on_loan',
+            'copies_maintenance': 'copies_maintenance',
+            'copies_reserved': 'copies_reserved',
+            'updated_at': 'updated_at',
+        },
+        {
+            'author': Relation('authors', key='author_id'),
+            'genres': Relation('genres', remote='book'),
+            'copies': Relation('copies', remote='book_id'),
+        },
+        ordering=('title', 'id'),
+    ),
+    'authors': Resource(
+        lambda request: Author.objects.all(),
+        {
+            'id': 'id',
+            'first_name': 'first_name',
+            'last_name': 'last_name',
+            'date_of_birth': 'date_of_birth',
+            'date_of_death': 'date_of_death',
+            'updated_at': 'updated_at',
+        },
+        {'books': Relation('books', remote='author_id')},
+        ordering=('last_name', 'first_name', 'id'),
+    ),
+    'genres': Resource(
+        lambda request: Genre.objects.all(),
+        {'id': 'id', 'name': 'name'},
+        ordering=('name', 'id'),
+    ),
+    # Copies never show who borrowed them; loans do, but only to the borrower or a librarian
+    'copies': Resource(
+        lambda request: BookInstance.objects.all(),
+        COPY_FIELDS,
+        {'book': Relation('books', key='book_id')},
+    ),
+    'loans': Resource(
+        loans_queryset,
+        dict(COPY_FIELDS, borrower='borrower__username'),
+        {'book': Relation('books', key='book_id')},
+        ordering=('due_back', 'id'),
+    ),
+}
+
+# The resources with their own endpoints (genres are only reachable through ?include=)
+ENDPOINTS = ('books', 'authors', 'copies', 'loans')
+
+
+class Selection:
+    """The fields and expanded relations requested for one resource: a node of ?fields/?include"""
+
+    def __init__(self, resource, depth=0):
+        self.resource = resource
+        self.depth = depth
+        self.fields = None  # None selects every field
+        self.includes = {}
+
+    def include(self, name):
+        """Return the Selection for relation name, expanding it if it is not already"""
+        relation = self.resource.relations.get(name)
+        if relation is None:
+            raise ApiError('Unknown relation "%s"; expected one of: %s'
+                           % (name, ', '.join(self.resource.relations) or 'none'))
+        if name not in self.includes:
+            if self.depth >= MAX_INCLUDE_DEPTH:
+                raise ApiError('Includes may only be %s relations deep' % MAX_INCLUDE_DEPTH)
+            self.includes[name] = Selection(relation.resource, self.depth + 1)
+        return self.includes[name]
+
+    def walk(self, path):
+        selection = self
+        for name in path:
+            selection = selection.include(name)
+        return selection
+
+    def add_field(self, name):
+        if name in self.resource.fields:
+            if self.fields is None:
+                self.fields = []
+            if name not in self.fields:
+                self.fields.append(name)
+        elif name in self.resource.relations:
+            self.include(name)
+        else:
+            raise ApiError('Unknown field "%s"; expected one of: %s'
+                           % (name, ', '.join(list(self.resource.fields) + list(self.resource.relations))))
+
+    def output(self):
+        """(public name, values() lookup) for each field in the response; id is always there"""
+        names = self.resource.fields if self.fields is None else ['id'] + self.fields
+        return [(name, self.resource.fields[name]) for name in dict.fromkeys(names)]
+
+    def columns(self, *extra):
+        """The values() lookups to fetch: the output fields, plus the ordering and relation keys"""
+        columns = [lookup for name, lookup in self.output()]
+        columns += self.resource.ordering
+        columns += [self.resource.relations[name].key for name in self.includes
+                    if not self.resource.relations[name].many]
+        columns += extra
+        return list(dict.fromkeys(columns))
+
+
+def parse_selection(resource, params):
+    """Build the Selection tree for resource from the ?fields= and ?include= parameters"""
+    selection = Selection(resource)
+    for path in _names(params.get('include')):
+        selection.walk(path.split('.'))
+    for path in _names(params.get('fields')):
+        *relations, field = path.split('.')
+        selection.walk(relations).add_field(field)
+    return selection
+
+
+def _names(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def serialize(request, selection, rows):
+    """Turn values() rows into response dicts, expanding the includes one query per relation"""
+    data = [{name: row[lookup] for name, lookup in selection.output()} for row in rows]
+    for name, child in selection.includes.items():
+        relation = selection.resource.relations[name]
+        queryset = relation.resource.queryset(request)
+
+        if relation.many:
+            parent_ids = {row['id'] for row in rows}
+            child_rows = list(queryset
+                              .filter(**{relation.remote + '__in': parent_ids})
+                              .order_by(*relation.resource.ordering)
+                              .values(*child.columns(relation.remote))) if parent_ids else []
+            children = defaultdict(list)
+            for child_row, item in zip(child_rows, serialize(request, child, child_rows)):
+                children[child_row[relation.remote]].append(item)
+            for row, item in zip(rows, data):
+                item[name] = children.get(row['id'], [])
+        else:
+            keys = {row[relation.key] for row in rows} - {None}
+            child_rows = list(queryset.filter(id__in=keys).values(*child.columns())) if keys else []
+            children = {child_row['id']: item
+                        for child_row, item in zip(child_rows, serialize(request, child, child_rows))}
+            for row, item in zip(rows, data):
+                item[name] = children.get(row[relation.key])
+    return data
+
+
+def get_resource(name):
+    if name not in ENDPOINTS:
+        raise ApiError('Unknown resource "%s"' % name)
+    return RESOURCES[name]
+
+
+def page_size(params):
+    try:
+        size = int(params.get('page_size', PAGE_SIZE))
+    except ValueError:
+        raise ApiError('page_size must be a number')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def list_page(request, name):
+    """Return (data, next cursor, previous cursor) for one keyset page of a resource"""
+    resource = get_resource(name)
+    selection = parse_selection(resource, request.GET)
+    queryset = resource.queryset(request).values(*selection.columns())
+    page = CursorPaginator(queryset, page_size(request.GET), resource.ordering).page(request.GET.get('cursor'))
+    return serialize(request, selection, page.object_list), page.next_cursor, page.previous_cursor
+
+
+def detail(request, name, pk):
+    """Return the serialized object, or None if there is no such object"""
+    resource = get_resource(name)
+    selection = parse_selection(resource, request.GET)
+    try:
+        rows = list(resource.queryset(request).filter(id=pk).values(*selection.columns()))
+    except (ValidationError, ValueError):
+        return None
+    return serialize(request, selection, rows)[0] if rows else None
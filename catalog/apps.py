@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CatalogConfig(AppConfig):
     name = 'catalog'
+
+    def ready(self):
+        # Connect the signal handlers (counter cache invalidation etc.)
+        from catalog import signals
@@ -0,0 +1,433 @@
+"""Benchmark harness for the catalog: a seeded data generator and timed page scenarios.
+
+CatalogGenerator bulk-loads a synthetic catalog (authors, genres, languages, books, copies and
+borrowers) of a chosen size. The same seed and size always produce the same rows, including
+the copies' UUIDs, so reports from different commits measure the same data.
+
+run_benchmarks() requests every catalog URL and the admin changelists through the Django test
+client and reports latency percentiles, query counts and peak Python memory per scenario as
+a JSON-serializable dict. compare_reports() lists the scenarios that got slower or started
+running more queries than in a baseline report. Used by `manage.py generate_catalog` and
+`manage.py benchmark_catalog`. load_test() drives a running server over HTTP instead, for
+`manage.py load_test_catalog`.
+"""
+import datetime
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from catalog.cache import bump_versions
+from catalog.counters import invalidate_catalog_counts, rebuild_availability
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.search import get_search_backend
+
+FIRST_NAMES = ('Ada', 'Chinua', 'Ursula', 'Jorge', 'Toni', 'Italo', 'Wole', 'Octavia', 'Haruki', 'Zadie',
+               'Ngozi', 'Gabriel', 'Doris', 'Ama', 'Kazuo', 'Elena')
+LAST_NAMES = ('Achebe', 'Le Guin', 'Borges', 'Morrison', 'Calvino', 'Soyinka', 'Butler', 'Murakami',
+              'Smith', 'Adichie', 'Marquez', 'Lessing', 'Aidoo', 'Ishiguro', 'Ferrante', 'Okri')
+WORDS = ('river', 'night', 'house', 'stone', 'wizard', 'garden', 'city', 'war', 'memory', 'storm',
+         'silence', 'harvest', 'empire', 'island', 'letter', 'mirror', 'forest', 'journey', 'light',
+         'shadow', 'kingdom', 'secret', 'machine', 'winter', 'market', 'daughter', 'thunder', 'lagos',
+         'the', 'of', 'a', 'and', 'in', 'last', 'lost', 'little', 'broken', 'golden', 'hidden', 'long')
+GENRES = ('Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'Horror', 'History', 'Biography', 'Poetry',
+          'Drama', 'Thriller', 'Travel', 'Philosophy', 'Religion', 'Science', 'Cooking', 'Art')
+LANGUAGES = ('English', 'French', 'Yoruba', 'Igbo', 'Hausa', 'Spanish', 'Portuguese', 'German', 'Japanese',
+             'Arabic', 'Swahili', 'Italian')
+
+LIBRARIAN = 'bench-librarian'
+BORROWER_PREFIX = 'bench-borrower-'
+
+
+class CatalogGenerator:
+    """Generate a reproducible synthetic catalog with bulk inserts.
+
+    Only copies is required; the other sizes are derived from it (ten copies per book, five
+    books per author, a hundred copies per borrower). Copies are 70% available, 20% on loan
+    (due within a month either side of today), 5% in maintenance and 5% reserved.
+    """
+
+    def __init__(self, copies, books=None, authors=None, borrowers=None, genres=len(GENRES),
+                 languages=len(LANGUAGES), seed=0, batch_size=5000, today=None, index=True, progress=None):
+        self.copies = copies
+        self.books = books or max(1, copies // 10)
+        self.authors = authors or max(1, self.books // 5)
+        self.borrowers = borrowers or max(1, copies // 100)
+        self.genres = genres
+        self.languages = languages
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.today = today or datetime.date.today()
+        self.index = index
+        self.progress = progress
+
+    def run(self):
+        """Insert the catalog; returns the number of rows created per model"""
+        with transaction.atomic():
+            self.create_users()
+            genre_ids = self.bulk_insert(Genre, (Genre(name=self.label(GENRES, n)) for n in range(self.genres)))
+            language_ids = self.bulk_insert(
+                Language, (Language(name=self.label(LANGUAGES, n)) for n in range(self.languages)))
+            author_ids = self.bulk_insert(Author, (self.make_author(n) for n in range(self.authors)))
+        book_ids = self.bulk_insert(Book, (self.make_book(n, author_ids, language_ids) for n in range(self.books)))
+        self.link_genres(book_ids, genre_ids)
+        borrower_ids = list(User.objects.filter(username__startswith=BORROWER_PREFIX).values_list('pk', flat=True))
+        self.create_copies(book_ids, borrower_ids)
+
+        # bulk_create skips the signal receivers, so rebuild the derived data in one go
+        rebuild_availability()
+        if self.index:
+            backend = get_search_backend(write=True)
+            with transaction.atomic(using=backend.using):
+                backend.index()
+        invalidate_catalog_counts()
+        bump_versions('books', 'authors', 'genres', 'languages')
+        return {'authors': self.authors, 'books': self.books, 'copies': self.copies, 'genres': self.genres,
+                'languages': self.languages, 'borrowers': self.borrowers}
+
+    @staticmethod
+    def label(names, n):
+        """names[n], numbered once the names run out: 'Fantasy', ..., 'Fantasy 2'"""
+        cycle, index = divmod(n, len(names))
+        return names[index] + (f' {cycle + 1}' if cycle else '')
+
+    def create_users(self):
+        """The librarian and the borrowers, keeping those left in the database by an earlier run"""
+        User.objects.get_or_create(username=LIBRARIAN, defaults={'is_staff': True, 'is_superuser': True,
+                                                                 'password': make_password(None)})
+        User.objects.bulk_create((User(username=f'{BORROWER_PREFIX}{n}') for n in range(self.borrowers)),
+                                 ignore_conflicts=True)
+
+    def bulk_insert(self, model, objects):
+        """bulk_create objects, returning the new primary keys in insertion order"""
+        first = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        self.insert_all(model, objects)
+        # Only PostgreSQL returns primary keys from bulk inserts, so read them back
+        return list(model.objects.filter(pk__gt=first).order_by('pk').values_list('pk', flat=True))
+
+    def insert_all(self, model, objects):
+        """bulk_create objects batch_size at a time, one transaction per batch"""
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                self.flush(model, batch)
+                batch = []
+        self.flush(model, batch)
+
+    def flush(self, model, batch):
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            if self.progress:
+                self.progress(model, len(batch))
+
+    def words(self, low, high):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high)))
+
+    def make_author(self, n):
+        born = self.rng.randint(1850, 1995)
+        return Author(first_name=self.rng.choice(FIRST_NAMES), last_name=self.label(LAST_NAMES, n),
+                      date_of_birth=datetime.date(born, self.rng.randint(1, 12), self.rng.randint(1, 28)),
+                      date_of_death=(datetime.date(born + self.rng.randint(30, 90), 1, 1)
+                                     if born < 1940 and self.rng.random() < 0.7 else None))
+
+    def make_book(self, n, author_ids, language_ids):
+        return Book(title=self.words(1, 5).capitalize(), summary=self.words(20, 60).capitalize() + '.',
+                    isbn=f'978{n:010d}', author_id=self.rng.choice(author_ids),
+                    language_id=self.rng.choice(language_ids))
+
+    def link_genres(self, book_ids, genre_ids):
+        BookGenre = Book.genre.through
+        self.insert_all(BookGenre, (BookGenre(book_id=book_id, genre_id=genre_id) for book_id in book_ids
+                                     for genre_id in self.rng.sample(genre_ids, min(len(genre_ids),
+                                                                                   self.rng.randint(1, 3)))))
+
+    def make_copy(self, book_ids, borrower_ids):
+        status = self.rng.choices('aomr', weights=(70, 20, 5, 5))[0]
+        on_loan = status == 'o'
+        return BookInstance(
+            id=uuid.UUID(int=self.rng.getrandbits(128), version=4),
+            book_id=self.rng.choice(book_ids),
+            imprint=f'{self.rng.choice(LAST_NAMES)} Press, {self.rng.randint(1950, 2020)}',
+            status=status,
+            borrower_id=self.rng.choice(borrower_ids) if on_loan else None,
+            due_back=self.today + datetime.timedelta(days=self.rng.randint(-30, 30)) if on_loan else None,
+        )
+
+    def create_copies(self, book_ids, borrower_ids):
+        self.insert_all(BookInstance, (self.make_copy(book_ids, borrower_ids) for _ in range(self.copies)))
+
+
+class Scenario:
+    """A page to time: a GET of path, as user (None for an anonymous visitor)"""
+
+    def __init__(self, name, path, user=None, url_name=None):
+        self.name = name
+        self.path = path
+        self.user = user
+        self.url_name = url_name or name
+
+
+def default_scenarios():
+    """A scenario for every URL in catalog/urls.py and each admin changelist, on the current data"""
+    from django.urls import reverse
+
+    librarian = User.objects.filter(is_superuser=True).order_by('pk').first()
+    loan = BookInstance.objects.filter(status__exact='o').order_by('due_back', 'pk').first()
+    borrower = loan.borrower if loan else librarian
+    book = Book.objects.order_by('pk').first()
+    author = Author.objects.order_by('pk').first()
+    last_page = max(1, math.ceil(Book.objects.count() / 3))
+    copy_id = loan.pk if loan else BookInstance.objects.order_by('pk').values_list('pk', flat=True).first()
+
+    scenarios = [
+        Scenario('index', reverse('index')),
+        Scenario('books', reverse('books')),
+        Scenario('books-last-page', f"{reverse('books')}?page={last_page}", url_name='books'),
+        Scenario('books-cursor', f"{reverse('books')}?cursor=", url_name='books'),
+        Scenario('search', f"{reverse('search')}?q=river+night", url_name='search'),
+        Scenario('authors', reverse('authors')),
+        Scenario('my-borrowed', reverse('my-borrowed'), borrower),
+        Scenario('all-borrowed', reverse('all-borrowed'), librarian),
+        Scenario('circulation-desk', reverse('circulation-desk'), librarian),
+        Scenario('author-create', reverse('author-create'), librarian),
+        Scenario('book-create', reverse('book-create'), librarian),
+        Scenario('export-catalog', reverse('export-catalog', kwargs={'dataset': 'books', 'format': 'csv'}),
+                 librarian),
+        Scenario('export-catalog-gzip', reverse('export-catalog-gzip', kwargs={'dataset': 'books', 'format': 'jsonl'}),
+                 librarian),
+        Scenario('api-list', f"{reverse('api-list', args=['books'])}?include=author,genres"),
+        Scenario('metrics', reverse('metrics'), librarian),
+    ]
+    if book:
+        scenarios += [
+            Scenario('book-detail', reverse('book-detail', args=[book.pk])),
+            Scenario('book-update', reverse('book-update', args=[book.pk]), librarian),
+            Scenario('book-delete', reverse('book-delete', args=[book.pk]), librarian),
+            Scenario('api-detail', f"{reverse('api-detail', args=['books', book.pk])}?include=copies"),
+            Scenario('book-hold', reverse('book-hold', args=[book.pk]), borrower),
+            Scenario('admin-book-change', reverse('admin:catalog_book_change', args=[book.pk]), librarian),
+        ]
+    if author:
+        scenarios += [
+            Scenario('author-detail', reverse('author-detail', args=[author.pk])),
+            Scenario('author-update', reverse('author-update', args=[author.pk]), librarian),
+            Scenario('author-delete', reverse('author-delete', args=[author.pk]), librarian),
+        ]
+    if copy_id:
+        scenarios.append(Scenario('renew-book-librarian', reverse('renew-book-librarian', args=[copy_id]),
+                                  librarian))
+    for model in ('book', 'author', 'bookinstance', 'hold', 'genre', 'language'):
+        scenarios.append(Scenario(f'admin-{model}-changelist', reverse(f'admin:catalog_{model}_changelist'),
+                                  librarian, url_name=f'admin:catalog_{model}_changelist'))
+    scenarios.append(Scenario('admin-bookinstance-on-loan',
+                              reverse('admin:catalog_bookinstance_changelist') + '?status__exact=o', librarian,
+                              url_name='admin:catalog_bookinstance_changelist'))
+    return scenarios
+
+
+def percentile(timings, percent):
+    """Nearest-rank percentile of a sorted list"""
+    return timings[max(0, min(len(timings) - 1, math.ceil(percent / 100 * len(timings)) - 1))]
+
+
+def fetch(client, path):
+    """GET path, reading streamed responses to the end; returns the status code"""
+    response = client.get(path)
+    if response.streaming:
+        for chunk in response.streaming_content:
+            pass
+    return response.status_code
+
+
+def run_benchmarks(scenarios=None, repeat=20, warmup=2, warm_cache=False, progress=None):
+    """Time each scenario and return the report dict.
+
+    Each scenario is requested warmup times untimed, then repeat times timed, then once more
+    under CaptureQueriesContext and tracemalloc (which would skew the timings) to count its
+    queries and peak Python memory. Unless warm_cache, the cache is cleared before every
+    request so the report measures rendering rather than cache hits.
+    """
+    scenarios = default_scenarios() if scenarios is None else scenarios
+    clients = {}
+    results = {}
+    for scenario in scenarios:
+        key = scenario.user.pk if scenario.user else None
+        if key not in clients:
+            clients[key] = Client()
+            if scenario.user:
+                clients[key].force_login(scenario.user)
+        client = clients[key]
+
+        for _ in range(warmup):
+            fetch(client, scenario.path)
+        timings = []
+        for _ in range(repeat):
+            if not warm_cache:
+                cache.clear()
+            start = time.perf_counter()
+            status = fetch(client, scenario.path)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+
+        if not warm_cache:
+            cache.clear()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            fetch(client, scenario.path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[scenario.name] = {
+            'path': scenario.path,
+            'url_name': scenario.url_name,
+            'user': scenario.user.username if scenario.user else None,
+            'status': status,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries': len(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+        if progress:
+            progress(scenario.name, results[scenario.name])
+
+    return {'meta': report_meta(repeat, warmup, warm_cache), 'scenarios': results}
+
+
+# The pages profile_templates reports on by default: the detail and list templates
+PROFILED_SCENARIOS = ('book-detail', 'author-detail', 'books', 'authors', 'all-borrowed', 'my-borrowed')
+
+
+def profile_scenarios(scenarios, repeat=5):
+    """Render each scenario repeat times (from a cold cache) under profile_renders(); returns {name: RenderProfile}"""
+    from catalog.templating import profile_renders
+
+    clients = {}
+    profiles = {}
+    for scenario in scenarios:
+        key = scenario.user.pk if scenario.user else None
+        if key not in clients:
+            clients[key] = Client()
+            if scenario.user:
+                clients[key].force_login(scenario.user)
+        with profile_renders() as profile:
+            for _ in range(repeat):
+                cache.clear()
+                fetch(clients[key], scenario.path)
+        profiles[scenario.name] = profile
+    return profiles
+
+
+def report_meta(repeat, warmup, warm_cache):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'repeat': repeat,
+        'warmup': warmup,
+        'warm_cache': warm_cache,
+        'rows': {model._meta.model_name: model.objects.count()
+                 for model in (Author, Book, BookInstance, Genre, Language)},
+    }
+
+
+def compare_reports(baseline, current, tolerance=0.2, noise_ms=2.0):
+    """Return a description of each regression of current against baseline.
+
+    A scenario regresses when it runs more queries, or when its p95 grows by more than
+    tolerance (a fraction) and by more than noise_ms milliseconds.
+    """
+    regressions = []
+    for name, now in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        if now['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {now['queries']} queries")
+        slower = now['p95_ms'] - before['p95_ms']
+        if slower > noise_ms and now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f}ms -> {now['p95_ms']:.1f}ms")
+    return regressions
+
+
+# The read-only pages load_test() requests by default
+LOAD_TEST_SCENARIOS = ('index', 'books', 'book-detail', 'authors', 'author-detail')
+
+
+def load_test(base_url, paths, concurrency=16, duration=10.0, workers=1):
+    """Request paths of a running server round-robin from concurrency threads for duration seconds.
+
+    Unlike run_benchmarks() this goes through a real server (e.g. gunicorn with sync workers
+    or with uvicorn workers), so it measures how many requests each worker keeps in flight.
+    Returns throughput (also per server worker), latency percentiles and the error count.
+    """
+    base_url = base_url.rstrip('/')
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    timings = []
+    errors = Counter()
+
+    def client(offset):
+        n = offset
+        while time.perf_counter() < deadline:
+            url = base_url + paths[n % len(paths)]
+            n += 1
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    response.read()
+            except (OSError, urllib.error.URLError) as e:
+                with lock:
+                    errors[getattr(e, 'code', None) or type(e).__name__] += 1
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                timings.append(elapsed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    throughput = len(timings) / elapsed
+    return {
+        'url': base_url,
+        'concurrency': concurrency,
+        'workers': workers,
+        'requests': len(timings),
+        'errors': dict(errors),
+        'requests_per_second': round(throughput, 1),
+        'requests_per_second_per_worker': round(throughput / workers, 1),
+        'p50_ms': round(percentile(timings, 50), 3) if timings else None,
+        'p95_ms': round(percentile(timings, 95), 3) if timings else None,
+    }
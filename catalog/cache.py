@@ -0,0 +1,164 @@
+"""Caching for the public catalog pages: server-side page and fragment caching, and conditional GET.
+
+Cached entries are keyed by *versions*: small cache entries holding a random token per scope
+(e.g. 'book:12' or 'authors'). The signal receivers in catalog/signals.py replace the token of
+every scope a write affects, which orphans all entries built from the old token, so nothing
+has to be found and deleted. Works with any cache backend, including the local-memory and
+file-based ones configured in settings.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from catalog.models import CatalogDeletion
+from catalog.routers import read_from_replica
+
+VERSION_KEY = 'catalog:version:%s'
+# Present for CATALOG_REPLICA_STICKY_SECONDS after a write
+WRITTEN_KEY = 'catalog:written'
+
+
+def page_cache_timeout():
+    return getattr(settings, 'CATALOG_PAGE_CACHE_TIMEOUT', 60 * 10)
+
+
+def get_versions(*scopes):
+    """Return the current version token of each scope, creating tokens that are missing"""
+    keys = [VERSION_KEY % scope for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        # Versions outlive the entries keyed on them, so they are stored without expiry
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def get_version(scope):
+    return get_versions(scope)[0]
+
+
+def bump_versions(*scopes):
+    """Give each scope a new version, invalidating everything cached under the old one"""
+    cache.set_many({VERSION_KEY % scope: uuid.uuid4().hex for scope in scopes}, None)
+    note_write()
+
+
+def note_write():
+    """Note that the catalog changed, so the replicas may lag behind for a while"""
+    if settings.CATALOG_REPLICAS:
+        cache.set(WRITTEN_KEY, True, settings.CATALOG_REPLICA_STICKY_SECONDS)
+
+
+def cacheable_read():
+    """Whether what the current request read may be stored in the shared caches.
+
+    Not if it came from a replica within CATALOG_REPLICA_STICKY_SECONDS of a write: the
+    replica may not have the write yet, and the entry would be stored under the new versions.
+    """
+    return not (read_from_replica() and cache.get(WRITTEN_KEY) is not None)
+
+
+def mark_deleted(model_name):
+    """Note in CatalogDeletion that a row of model_name was deleted now.
+
+    A deleted row leaves no updated_at behind, so MAX(updated_at) alone can stay the same (or go
+    back) after a delete; the list pages fold this time into their validators. It is kept in the
+    database rather than the cache so every process sees it, and no eviction loses it.
+    """
+    now = timezone.now()
+    if CatalogDeletion.objects.filter(model=model_name).update(deleted_at=now):
+        return
+    try:
+        with transaction.atomic():
+            CatalogDeletion.objects.create(model=model_name, deleted_at=now)
+    except IntegrityError:
+        # Created by a concurrent delete
+        CatalogDeletion.objects.filter(model=model_name).update(deleted_at=now)
+
+
+def last_deleted(*model_names):
+    """When a row of any of model_names was last deleted, if ever"""
+    return CatalogDeletion.objects.filter(model__in=model_names).aggregate(latest=Max('deleted_at'))['latest']
+
+
+def page_cache_key(request, scopes):
+    versions = ':'.join(get_versions(*scopes))
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return f'catalog:page:{path}:{hashlib.md5(versions.encode()).hexdigest()}'
+
+
+class AnonymousPageCacheMixin:
+    """Serve GET requests from anonymous users out of the cache.
+
+    Views list the version scopes their page depends on in get_cache_scopes(). Signed-in users
+    always get a fresh render, since the sidebar and permissions differ per user.
+    """
+
+    def get_cache_scopes(self):
+        raise NotImplementedError('AnonymousPageCacheMixin requires get_cache_scopes()')
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = page_cache_key(request, self.get_cache_scopes())
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            def store(response):
+                if cacheable_read():
+                    cache.set(key, (response.content, response['Content-Type']), page_cache_timeout())
+            if hasattr(response, 'add_post_render_callback'):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+        return response
+
+
+class ConditionalGetMixin:
+    """Answer If-None-Match / If-Modified-Since with 304 Not Modified before the view runs.
+
+    Views implement get_last_modified() with one cheap query returning the newest updated_at
+    among the rows their page shows. The ETag adds the user and the full path to it, since
+    the same page renders differently for each signed-in user and each page of a list.
+    """
+
+    def get_last_modified(self):
+        raise NotImplementedError('ConditionalGetMixin requires get_last_modified()')
+
+    def dispatch(self, request, *args, **kwargs):
+        last_modified = []
+
+        def get_last_modified(request, *args, **kwargs):
+            # Shared by the ETag and Last-Modified functions so the query runs once
+            if not last_modified:
+                last_modified.append(self.get_last_modified())
+            return last_modified[0]
+
+        def get_etag(request, *args, **kwargs):
+            updated_at = get_last_modified(request)
+            if updated_at is None:
+                return None
+            fingerprint = f'{updated_at.isoformat()}:{request.user.pk}:{request.get_full_path()}'
+            return hashlib.md5(fingerprint.encode('utf-8')).hexdigest()
+
+        view = condition(etag_func=get_etag, last_modified_func=get_last_modified)(super().dispatch)
+        return view(request, *args, **kwargs)
+
+
+def latest(*timestamps):
+    """The newest of some possibly missing timestamps"""
+    present = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(present) if present else None
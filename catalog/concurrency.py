@@ -0,0 +1,72 @@
+"""Run the independent queries of a request at the same time.
+
+Django 3.0 calls every view synchronously, also under ASGI (where each request runs in a
+thread of its own, see locallibrary/asgi.py), so a view cannot await its queries. gather()
+gets the same overlap from a small pool of threads, each with its own database connection:
+a page that needs four unrelated aggregates waits for the slowest one instead of the sum.
+Those connections stay open, so the pool counts against the database's connection limit
+(see DATABASE_MAX_CONNECTIONS in the settings).
+
+Inside a transaction the calls run one after the other on the caller's connection, because
+other connections cannot see its uncommitted rows (this is also what happens under TestCase).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import contextvars
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+
+from catalog.metrics import current_metrics
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.CATALOG_QUERY_THREADS,
+                                           thread_name_prefix='catalog-query')
+        return _executor
+
+
+def gather(*calls):
+    """Call each of calls (functions without arguments) concurrently; returns their results in order"""
+    if len(calls) < 2 or settings.CATALOG_QUERY_THREADS < 1 or connection.in_atomic_block:
+        return [call() for call in calls]
+    metrics = current_metrics()
+    # Each call runs in a copy of the caller's context, which carries e.g. the database routing state
+    futures = [executor().submit(contextvars.copy_context().run, run_in_thread, call, metrics)
+               for call in calls[1:]]
+    # The caller's thread takes the first call rather than waiting idle
+    results = [calls[0]()]
+    return results + [future.result() for future in futures]
+
+
+def run_in_thread(call, metrics=None):
+    """Run call in a pool thread, counting its queries in the request's metrics"""
+    # Pool threads see no request_started/request_finished, so apply CONN_MAX_AGE here
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            if metrics is not None:
+                for db in connections.all():
+                    stack.enter_context(db.execute_wrapper(metrics.execute))
+            return call()
+    finally:
+        close_old_connections()
+
+
+def set_prefetched(instance, name, objects):
+    """Store objects as the related objects of instance.<name>, as prefetch_related(name) would have"""
+    manager = getattr(instance, name)
+    cache_name = getattr(manager, 'prefetch_cache_name', None) or manager.field.remote_field.get_cache_name()
+    queryset = manager.all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[cache_name] = queryset
@@ -0,0 +1,90 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from catalog.cache import cacheable_read, note_write
+from catalog.concurrency import gather
+from catalog.models import Author, Book, BookInstance, Genre
+
+# Cache key holding the record counts shown on the home page
+CATALOG_COUNTS_KEY = 'catalog:index-counts'
+
+# Upper bound on staleness for processes that did not see the write (e.g. other gunicorn workers)
+CATALOG_COUNTS_TIMEOUT = 60 * 5
+
+
+def compute_catalog_counts():
+    """Count the main catalog objects, folding the filtered counts into conditional aggregates"""
+    # Four independent queries, run concurrently (see catalog/concurrency.py)
+    book_counts, instance_counts, num_authors, num_genre = gather(
+        lambda: Book.objects.aggregate(
+            num_books=Count('id'),
+            num_books_count=Count('id', filter=Q(title__contains='The')),
+        ),
+        lambda: BookInstance.objects.aggregate(
+            num_instances=Count('id'),
+            num_instances_available=Count('id', filter=Q(status__exact='a')),
+        ),
+        Author.objects.count,
+        Genre.objects.count,
+    )
+
+    counts = {
+        'num_authors': num_authors,
+        'num_genre': num_genre,
+    }
+    counts.update(book_counts)
+    counts.update(instance_counts)
+    return counts
+
+
+def get_catalog_counts():
+    """Return the home page counts from the counter cache, recomputing them on a miss"""
+    counts = cache.get(CATALOG_COUNTS_KEY)
+    if counts is None:
+        counts = compute_catalog_counts()
+        if cacheable_read():
+            cache.set(CATALOG_COUNTS_KEY, counts, CATALOG_COUNTS_TIMEOUT)
+    return counts
+
+
+def invalidate_catalog_counts():
+    """Drop the cached counts so the next request recomputes them"""
+    cache.delete(CATALOG_COUNTS_KEY)
+    note_write()
+
+
+def availability_subqueries(instance_model=BookInstance, counter_fields=BookInstance.STATUS_COUNTER_FIELDS):
+    """Map each Book availability column to a subquery counting that book's copies in the matching status"""
+    subqueries = {}
+    for status, field in counter_fields.items():
+        copies = (instance_model.objects.filter(book=OuterRef('pk'), status=status)
+                  .order_by().values('book').annotate(total=Count('pk')).values('total'))
+        subqueries[field] = Coalesce(Subquery(copies, output_field=IntegerField()), 0)
+    return subqueries
+
+
+def rebuild_availability(books=None):
+    """Recount the availability columns of books (all books by default) in one UPDATE"""
+    if books is None:
+        books = Book.objects.all()
+    return books.update(**availability_subqueries())
+
+
+def recount_availability(book_ids):
+    """Recount the availability columns of the books of book_ids, with their rows locked.
+
+    Taking the locks first has concurrent recounts of a book run one after the other, each
+    counting the copies as committed when it got the lock, so the last one is always right,
+    whatever the saving instances had loaded.
+    """
+    book_ids = sorted({pk for pk in book_ids if pk is not None})
+    if not book_ids:
+        return 0
+    books = Book.objects.filter(pk__in=book_ids)
+    # Part of the caller's transaction when there is one; a savepoint would only add queries
+    with transaction.atomic(savepoint=False):
+        # In pk order, so two transactions locking the same books cannot deadlock
+        list(books.select_for_update().order_by('pk').values_list('pk', flat=True))
+        return rebuild_availability(books)
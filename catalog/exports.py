@@ -0,0 +1,116 @@
+"""Streaming exports of the catalog and the loan ledger.
+
+Rows are read with values_list(...).iterator(chunk_size=...) and written out one at a time by
+generators, optionally through an incremental gzip compressor, so memory use stays flat
+however large the table is. Used by the export views and `manage.py export_catalog`.
+"""
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from catalog.models import Author, Book, BookInstance
+
+# Rows fetched from the database per round trip (and per server-side cursor fetch on PostgreSQL)
+CHUNK_SIZE = 2000
+
+# dataset name: (queryset factory, [(column header, values_list lookup)])
+DATASETS = {
+    'books': (lambda: Book.objects.order_by('pk'), [
+        ('id', 'pk'), ('title', 'title'), ('isbn', 'isbn'), ('summary', 'summary'),
+        ('author_id', 'author_id'), ('author_last_name', 'author__last_name'),
+        ('author_first_name', 'author__first_name'), ('language', 'language__name'),
+        ('copies_available', 'copies_available'), ('copies_on_loan', 'copies_on_loan'),
+        ('copies_maintenance', 'copies_maintenance'), ('copies_reserved', 'copies_reserved'),
+    ]),
+    'copies': (lambda: BookInstance.objects.order_by('pk'), [
+        ('id', 'pk'), ('book_id', 'book_id'), ('title', 'book__title'), ('isbn', 'book__isbn'),
+        ('imprint', 'imprint'), ('status', 'status'), ('due_back', 'due_back'),
+        ('borrower_id', 'borrower_id'), ('borrower', 'borrower__username'),
+    ]),
+    'authors': (lambda: Author.objects.order_by('pk'), [
+        ('id', 'pk'), ('last_name', 'last_name'), ('first_name', 'first_name'),
+        ('date_of_birth', 'date_of_birth'), ('date_of_death', 'date_of_death'),
+    ]),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """A file-like object whose write() just returns the value, for csv.writer in a generator"""
+
+    def write(self, value):
+        return value
+
+
+def dataset_rows(dataset, chunk_size=CHUNK_SIZE):
+    """Return (headers, row iterator) for a dataset"""
+    queryset, columns = DATASETS[dataset]
+    rows = queryset().values_list(*[lookup for header, lookup in columns]).iterator(chunk_size=chunk_size)
+    return [header for header, lookup in columns], rows
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(headers, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+def json_lines(headers, rows):
+    """A JSON array written one element at a time"""
+    separator = '[\n'
+    for line in jsonl_lines(headers, rows):
+        yield separator + line.rstrip('\n')
+        separator = ',\n'
+    yield '[]\n' if separator == '[\n' else '\n]\n'
+
+
+WRITERS = {
+    'csv': csv_lines,
+    'json': json_lines,
+    'jsonl': jsonl_lines,
+}
+
+
+def joined_chunks(lines, chunk_size=64 * 1024):
+    """Group small text lines into roughly chunk_size pieces, so the server makes fewer writes"""
+    pending = []
+    pending_size = 0
+    for line in lines:
+        pending.append(line)
+        pending_size += len(line)
+        if pending_size >= chunk_size:
+            yield ''.join(pending)
+            pending, pending_size = [], 0
+    if pending:
+        yield ''.join(pending)
+
+
+def gzip_chunks(lines):
+    """Gzip-compress an iterable of text lines incrementally, yielding bytes"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in joined_chunks(lines):
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export(dataset, format, compress=False, chunk_size=CHUNK_SIZE):
+    """Yield the dataset serialized as format, as text chunks (or gzip bytes if compress)"""
+    headers, rows = dataset_rows(dataset, chunk_size)
+    lines = WRITERS[format](headers, rows)
+    return gzip_chunks(lines) if compress else joined_chunks(lines)
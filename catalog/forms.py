@@ -1,25 +1,90 @@
 from django import forms
 import datetime
+import uuid
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
 
+def validate_renewal_date(data):
+    """The due date rules for a loan, shared by RenewBookForm and the batch loan service"""
+    # CHeck if a date is not in the past
+    if data < datetime.date.today():
+        raise ValidationError(_('Invalid Date - renewal in past'))
+
+    # Check if a date is in the allowed range(+4 weeks from today)
+    if data > datetime.date.today() +datetime.timedelta(weeks=4):
+        raise ValidationError(_("invalid Date - Renwal more than 4 weeks ahead"))
+
+
 class RenewBookForm(forms.Form):
     renewal_date = forms.DateField(help_text="Enter a date between now and 4 weeks (default 3).")
+    # The BookInstance.version the librarian was shown, so a renewal made by someone else
+    # in the meantime is detected rather than overwritten
+    version = forms.IntegerField(required=False, widget=forms.HiddenInput)
 
     # Django provides numerous places where you can validate your data. The easiest way to validate a single field is to override the method clean_<fieldname>() for the field you want to check. So for example, we can validate that entered renewal_date values are between now and 4 weeks by implementing clean_renewal_date() as shown below.
     def clean_renewal_date(self):
         data = self.cleaned_data['renewal_date']
+        validate_renewal_date(data)
+        return data
+
 
-        # CHeck if a date is not in the past
-        if data < datetime.date.today():
-            raise ValidationError(_('Invalid Date - renewal in past'))
-        
-        # Check if a date is in the allowed range(+4 weeks from today)
-        if data > datetime.date.today() +datetime.timedelta(weeks=4):
-            raise ValidationError(_("invalid Date - Renwal more than 4 weeks ahead"))
+class CirculationForm(forms.Form):
+    """A cart of scanned copies to check out, return or renew together"""
+    ACTIONS = (
+        ('checkout', 'Check out'),
+        ('return', 'Return'),
+        ('renew', 'Renew'),
+    )
+    MAX_COPIES = 500
 
+    action = forms.ChoiceField(choices=ACTIONS)
+    copies = forms.CharField(widget=forms.Textarea(attrs={'rows': 10}),
+                             help_text='Scan or paste copy IDs, one per line.')
+    borrower = forms.CharField(required=False, help_text='Username of the borrower (check out only).')
+    due_back = forms.DateField(required=False,
+                               help_text='Between now and 4 weeks (default 3). Not used for returns.')
+
+    def clean_copies(self):
+        ids, invalid = [], []
+        for token in self.cleaned_data['copies'].replace(',', ' ').split():
+            try:
+                ids.append(uuid.UUID(token))
+            except ValueError:
+                invalid.append(token)
+        if invalid:
+            raise ValidationError(_('Not copy IDs: %(ids)s'), params={'ids': ', '.join(invalid[:10])})
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            raise ValidationError(_('Scan at least one copy'))
+        if len(ids) > self.MAX_COPIES:
+            raise ValidationError(_('At most %(max)s copies at a time'), params={'max': self.MAX_COPIES})
+        return ids
+
+    def clean_borrower(self):
+        username = self.cleaned_data['borrower'].strip()
+        if not username:
+            return None
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise ValidationError(_('No user %(username)s'), params={'username': username})
+
+    def clean_due_back(self):
+        data = self.cleaned_data['due_back']
+        if data is not None:
+            validate_renewal_date(data)
         return data
 
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        if action == 'checkout' and not cleaned_data.get('borrower') and 'borrower' not in self.errors:
+            self.add_error('borrower', _('Check outs need a borrower'))
+        if action == 'renew' and not cleaned_data.get('due_back') and 'due_back' not in self.errors:
+            self.add_error('due_back', _('Renewals need a due date'))
+        return cleaned_data
+
 # A basic ModelForm containing the same field as our original RenewBookForm is shown below. All you need to do to create the form is add class Meta with the associated model (BookInstance) and a list of the model fields to include in the form (you can include all fields using fields = '__all__', or you can use exclude (instead of fields) to specify the fields not to include from the model).
 
 """ from django.forms import ModelForm
@@ -0,0 +1,128 @@
+"""Holds: a first-come, first-served queue of patrons per Book, served as copies come back.
+
+Each waiting hold has a sequence number. The waiting holds of a book are numbered without
+gaps: a new hold takes the next number, the head leaves when a copy is set aside for it, and
+cancelling renumbers only the holds behind it. So a hold's position is its sequence minus the
+head's plus one, and the head is one lookup in the (book, status, sequence) index, however
+long the queue. Changes to a queue's numbering lock the book's row, one queue at a time.
+
+allocate() sets a returned copy aside for the head of its book's queue. The hold is claimed
+with a single UPDATE of the first waiting hold (picked by a subquery that skips holds other
+transactions have locked, on PostgreSQL), so two copies coming back at once go to two
+different patrons. Django 3.0 has no UPDATE ... RETURNING, so the claimed hold is then read
+back through the copy it now holds. The copy becomes Reserved for the patron, who has until
+pickup_by to borrow it; expire_holds() passes uncollected copies on to the next patron.
+"""
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Max, Subquery
+from django.utils import timezone
+
+from catalog import loans
+from catalog.counters import invalidate_catalog_counts
+from catalog.models import Book, BookInstance, Hold
+
+# How long a copy set aside for a patron waits to be borrowed
+HOLD_PICKUP_PERIOD = datetime.timedelta(days=7)
+
+
+def lock_queue(book_id):
+    """Lock the book's row, serializing changes to its queue until the transaction ends"""
+    list(Book.objects.select_for_update().filter(pk=book_id).values_list('pk'))
+
+
+def place_hold(book, patron):
+    """Queue patron for a copy of book, setting one aside right away if any is on the shelf"""
+    with transaction.atomic():
+        lock_queue(book.pk)
+        if Hold.objects.filter(book=book, patron=patron, status__in=(Hold.WAITING, Hold.READY)).exists():
+            raise ValidationError('You already have a hold on this book.')
+        last = Hold.objects.filter(book=book, status=Hold.WAITING).aggregate(last=Max('sequence'))['last']
+        hold = Hold.objects.create(book=book, patron=patron, sequence=(last or 0) + 1)
+        allocate(BookInstance.objects.filter(book=book, status='a').values_list('pk', flat=True)[:1])
+    hold.refresh_from_db()
+    return hold
+
+
+def cancel_hold(hold):
+    """Cancel a waiting or ready hold; a copy it held goes to the next patron in the queue"""
+    with transaction.atomic():
+        lock_queue(hold.book_id)
+        hold = Hold.objects.select_for_update().get(pk=hold.pk)
+        if not hold.is_active:
+            return hold
+        previous_status = hold.status
+        hold.status = Hold.CANCELLED
+        hold.save(update_fields=['status'])
+        if previous_status == Hold.WAITING:
+            # Close the gap, so the positions behind it stay sequence arithmetic
+            (Hold.objects.filter(book=hold.book_id, status=Hold.WAITING, sequence__gt=hold.sequence)
+             .update(sequence=F('sequence') - 1))
+        elif hold.copy_id is not None:
+            release([hold.copy_id])
+    return hold
+
+
+def allocate(copy_ids, today=None):
+    """Set each available copy of copy_ids aside for the head of its book's queue; returns the holds served"""
+    pickup_by = (today or datetime.date.today()) + HOLD_PICKUP_PERIOD
+    served = []
+    with transaction.atomic():
+        copies = list(BookInstance.objects.select_for_update(skip_locked=True)
+                      .filter(pk__in=list(copy_ids), status='a', book__isnull=False)
+                      .values_list('pk', 'book_id'))
+        now = timezone.now()
+        for copy_id, book_id in copies:
+            head = (Hold.objects.select_for_update(skip_locked=True)
+                    .filter(book=book_id, status=Hold.WAITING).order_by('sequence').values('pk')[:1])
+            claimed = Hold.objects.filter(pk=Subquery(head), status=Hold.WAITING).update(
+                status=Hold.READY, copy=copy_id, ready_at=now, pickup_by=pickup_by)
+            if not claimed:
+                continue
+            hold = Hold.objects.get(copy=copy_id, status=Hold.READY)
+            # Like loans.process(), write the copy directly and bump its version by hand
+            BookInstance.objects.filter(pk=copy_id).update(
+                status='r', borrower=hold.patron_id, due_back=None, updated_at=now, version=F('version') + 1)
+            served.append(hold)
+        if served:
+            invalidate_catalog_counts()
+            loans.refresh_copy_books({hold.book_id for hold in served})
+    return served
+
+
+def release(copy_ids):
+    """Put reserved copies back on the shelf and offer them to the next patrons in line"""
+    with transaction.atomic():
+        copies = BookInstance.objects.filter(pk__in=copy_ids, status='r')
+        book_ids = set(copies.values_list('book_id', flat=True))
+        copies.update(status='a', borrower=None, updated_at=timezone.now(), version=F('version') + 1)
+        invalidate_catalog_counts()
+        loans.refresh_copy_books(book_ids)
+        return allocate(copy_ids)
+
+
+def fulfill(copy_ids, borrower):
+    """Mark the holds of borrower that had copies of copy_ids set aside as fulfilled"""
+    return (Hold.objects.filter(copy__in=copy_ids, patron=borrower, status=Hold.READY)
+            .update(status=Hold.FULFILLED))
+
+
+def expire_holds(today=None):
+    """Expire ready holds not collected by their pickup_by date, passing their copies on; returns how many"""
+    today = today or datetime.date.today()
+    with transaction.atomic():
+        expired = list(Hold.objects.select_for_update(skip_locked=True)
+                       .filter(status=Hold.READY, pickup_by__lt=today).values_list('pk', 'copy_id'))
+        if expired:
+            Hold.objects.filter(pk__in=[pk for pk, copy_id in expired]).update(status=Hold.EXPIRED)
+            release([copy_id for pk, copy_id in expired if copy_id is not None])
+    return len(expired)
+
+
+def allocate_waiting(today=None):
+    """Serve the queues from every copy on the shelf (e.g. returned through the admin); returns the holds served"""
+    copy_ids = (BookInstance.objects.filter(status='a', book__hold__status=Hold.WAITING)
+                .values_list('pk', flat=True).distinct())
+    return allocate(list(copy_ids), today)
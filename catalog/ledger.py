@@ -0,0 +1,136 @@
+"""The loan ledger: an append-only history of checkouts, renewals and returns.
+
+A BookInstance only holds the current loan of a copy (its borrower and due_back are
+overwritten), so each change of a loan also adds a LoanEvent row. events_for() derives the
+events from the values a copy was loaded with and its current ones; a save() records them
+from a post_save receiver (see catalog/signals.py), the batch operations of catalog/loans.py
+with one bulk_create per batch. Nothing updates or deletes the rows except drop_history().
+
+On PostgreSQL (11 or later) catalog_loanevent is partitioned by month (in UTC) of
+occurred_at, so years of history stay out of the hot catalog_bookinstance table and each
+month is a table of its own. ensure_partitions() creates the coming months' partitions ahead
+of time; rows of a month without one go to the default partition and are moved once it
+exists. drop_history() removes whole months with DROP TABLE, leaving nothing to vacuum;
+elsewhere it deletes the rows. `manage.py maintain_loan_history` runs both.
+"""
+import datetime
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from catalog.models import LoanEvent
+
+TABLE = LoanEvent._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+# The fields a loan lives in
+LOAN_FIELDS = {'status', 'borrower', 'due_back'}
+
+
+def events_for(copy, occurred_at=None):
+    """Unsaved LoanEvents for the change of copy's loan since it was loaded (or, if new, created)"""
+    loaded = getattr(copy, '_loaded_values', {})
+    old_status, old_borrower_id, old_due_back = loaded.get('status'), loaded.get('borrower'), loaded.get('due_back')
+    occurred_at = occurred_at or timezone.now()
+    events = []
+
+    def event(kind, borrower_id, due_back=None):
+        events.append(LoanEvent(kind=kind, occurred_at=occurred_at, copy_id=copy.pk, book_id=copy.book_id,
+                                borrower_id=borrower_id, due_back=due_back))
+    on_loan = copy.status == 'o'
+    new_borrower = on_loan and (old_status != 'o' or copy.borrower_id != old_borrower_id)
+    if old_status == 'o' and (not on_loan or new_borrower):
+        event(LoanEvent.RETURN, old_borrower_id)
+    if new_borrower:
+        event(LoanEvent.CHECKOUT, copy.borrower_id, copy.due_back)
+    elif on_loan and copy.due_back != old_due_back:
+        event(LoanEvent.RENEWAL, copy.borrower_id, copy.due_back)
+    return events
+
+
+def record(copies, occurred_at=None):
+    """Add the loan events of the changed copies with one INSERT; returns them"""
+    occurred_at = occurred_at or timezone.now()
+    events = [event for copy in copies for event in events_for(copy, occurred_at)]
+    if events:
+        LoanEvent.objects.bulk_create(events)
+    return events
+
+
+def month_start(day, months=0):
+    """Midnight UTC on the first of day's month, moved by months"""
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    return datetime.datetime(year, month + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def is_partitioned(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def partitions(using=DEFAULT_DB_ALIAS):
+    """{first of the month: table name} of the monthly partitions"""
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                       'WHERE pg_inherits.inhparent = %s::regclass', [TABLE])
+        names = [name for (name,) in cursor.fetchall()]
+    months = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months[datetime.datetime(int(match[1]), int(match[2]), 1, tzinfo=datetime.timezone.utc)] = name
+    return months
+
+
+def ensure_partitions(months_ahead=3, now=None, using=DEFAULT_DB_ALIAS):
+    """Create the partitions of this month and the next months_ahead months that are missing;
+    returns their names"""
+    if not is_partitioned(using):
+        return []
+    now = now or timezone.now()
+    existing = partitions(using)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    created = []
+    for n in range(months_ahead + 1):
+        start, end = month_start(now, n), month_start(now, n + 1)
+        if start in existing:
+            continue
+        name = f'{TABLE}_p{start:%Y%m}'
+        # Bounds as plain literals: PostgreSQL 11 does not take expressions (such as casts) there
+        bounds = [start.isoformat(' '), end.isoformat(' ')]
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(TABLE)} INCLUDING DEFAULTS)')
+            # Rows of the month that went to the default partition meanwhile; attaching checks none is left
+            cursor.execute(f'WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} '
+                           f'WHERE occurred_at >= %s AND occurred_at < %s RETURNING *) '
+                           f'INSERT INTO {quote(name)} SELECT * FROM moved', bounds)
+            # Creates the partition's copies of the primary key and indexes
+            cursor.execute(f'ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)} '
+                           f'FOR VALUES FROM (%s) TO (%s)', bounds)
+        created.append(name)
+    return created
+
+
+def drop_history(months=None, now=None, using=DEFAULT_DB_ALIAS):
+    """Remove the events from before the last months whole months (default CATALOG_LOAN_HISTORY_MONTHS)
+    and this one; returns the number of partitions dropped and of other rows deleted"""
+    months = settings.CATALOG_LOAN_HISTORY_MONTHS if months is None else months
+    cutoff = month_start(now or timezone.now(), -months)
+    if not is_partitioned(using):
+        return 0, LoanEvent.objects.using(using).filter(occurred_at__lt=cutoff).delete()[0]
+    quote = connections[using].ops.quote_name
+    dropped = [name for start, name in partitions(using).items() if start < cutoff]
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for name in dropped:
+            cursor.execute(f'DROP TABLE {quote(name)}')
+        # Only rows from before ensure_partitions() ran, normally none
+        cursor.execute(f'DELETE FROM {quote(DEFAULT_PARTITION)} WHERE occurred_at < %s', [cutoff])
+        deleted = cursor.rowcount
+    return len(dropped), deleted
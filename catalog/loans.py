@@ -0,0 +1,169 @@
+"""Batch circulation: check out, return and renew many copies in one transaction.
+
+Each operation locks the requested copies with SELECT ... FOR UPDATE SKIP LOCKED, so two desks
+working on overlapping carts never wait on each other: a copy another transaction holds is
+reported as skipped instead. The changes are written with one bulk_update. bulk_update skips
+the model signals, so refresh_copy_books() brings the availability counters, updated_at
+timestamps and cache versions of the affected books up to date afterwards.
+
+SQLite has no row locks; Django ignores select_for_update() there and SQLite serializes
+the writing transactions instead.
+
+Every checkout, renewal and return is also added to the loan ledger (see catalog/ledger.py).
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from catalog import holds, ledger
+from catalog.cache import bump_versions
+from catalog.counters import invalidate_catalog_counts, recount_availability
+from catalog.forms import validate_renewal_date
+from catalog.models import Book, BookInstance, ConcurrentUpdate
+
+# Default loan period, as proposed by the renewal form
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+
+class LoanResult:
+    """The copies an operation changed, and why each other requested copy was skipped"""
+
+    def __init__(self, copies=(), skipped=None):
+        self.copies = list(copies)
+        self.skipped = skipped or {}
+
+    def __repr__(self):
+        return f'<LoanResult: {len(self.copies)} changed, {len(self.skipped)} skipped>'
+
+
+def lendable_to(borrower):
+    """Copies on the shelf, or reserved for borrower by a hold"""
+    return Q(status='a') | Q(status='r', borrower=borrower)
+
+
+def checkout(copy_ids, borrower, due_back=None):
+    """Lend available copies, or copies reserved for borrower, to borrower until due_back (default three weeks)"""
+    due_back = due_back or datetime.date.today() + LOAN_PERIOD
+    validate_renewal_date(due_back)
+
+    def lend(copy):
+        copy.status = 'o'
+        copy.borrower = borrower
+        copy.due_back = due_back
+    # savepoint=False: commit the holds with the loans, without a savepoint of its own
+    with transaction.atomic(savepoint=False):
+        result = process(copy_ids, ('a', 'r'), lend, ['status', 'borrower', 'due_back'],
+                         condition=lendable_to(borrower))
+        holds.fulfill([copy.pk for copy in result.copies], borrower)
+    return result
+
+
+def return_copies(copy_ids):
+    """Mark copies on loan as returned, setting them aside for the next patrons with holds on their books"""
+    def give_back(copy):
+        copy.status = 'a'
+        copy.borrower = None
+        copy.due_back = None
+    with transaction.atomic(savepoint=False):
+        result = process(copy_ids, ('o',), give_back, ['status', 'borrower', 'due_back'])
+        served = {hold.copy_id: hold for hold in holds.allocate([copy.pk for copy in result.copies])}
+    for copy in result.copies:
+        if copy.pk in served:
+            copy.status = 'r'
+            copy.borrower = served[copy.pk].patron
+    return result
+
+
+def renew(copy_ids, due_back):
+    """Move the due date of copies on loan to due_back"""
+    validate_renewal_date(due_back)
+
+    def extend(copy):
+        copy.due_back = due_back
+    return process(copy_ids, ('o',), extend, ['due_back'])
+
+
+def lend_copy(copy_id, borrower, due_back=None, attempts=3):
+    """Check out one copy with an optimistic-locking save, retrying if another save wins the race.
+
+    Returns the copy, or None if it is not (or no longer) available to lend.
+    """
+    due_back = due_back or datetime.date.today() + LOAN_PERIOD
+    validate_renewal_date(due_back)
+    for attempt in range(attempts):
+        copy = BookInstance.objects.filter(lendable_to(borrower), pk=copy_id).first()
+        if copy is None:
+            return None
+        copy.status = 'o'
+        copy.borrower = borrower
+        copy.due_back = due_back
+        try:
+            with transaction.atomic():
+                copy.save()
+                holds.fulfill([copy.pk], borrower)
+        except ConcurrentUpdate:
+            if attempt == attempts - 1:
+                raise
+        else:
+            return copy
+
+
+def process(copy_ids, statuses, change, fields, condition=None):
+    """Lock the copies of copy_ids in one of statuses (and matching condition, a Q), change() each
+    and save them in one bulk_update"""
+    copy_ids = list(dict.fromkeys(copy_ids))
+    with transaction.atomic():
+        copies = BookInstance.objects.select_for_update(skip_locked=True).filter(pk__in=copy_ids, status__in=statuses)
+        if condition is not None:
+            copies = copies.filter(condition)
+        copies = list(copies.order_by('pk'))
+        previous_book_ids = {copy.book_id for copy in copies}
+        now = timezone.now()
+        for copy in copies:
+            change(copy)
+            # auto_now and the version bump are only applied by save(); the rows are locked here
+            copy.updated_at = now
+            copy.version += 1
+        if copies:
+            BookInstance.objects.bulk_update(copies, fields + ['updated_at', 'version'])
+            ledger.record(copies, now)
+            for copy in copies:
+                copy._loaded_values = copy.field_values()
+            if 'status' in fields:
+                invalidate_catalog_counts()
+            refresh_copy_books(previous_book_ids, counters='status' in fields)
+        skipped = skipped_reasons(set(copy_ids) - {copy.pk for copy in copies}, statuses)
+    return LoanResult(copies, skipped)
+
+
+def skipped_reasons(copy_ids, statuses):
+    """Explain why the copies of copy_ids were not processed"""
+    if not copy_ids:
+        return {}
+    found = dict(BookInstance.objects.filter(pk__in=copy_ids).values_list('pk', 'status'))
+    labels = dict(BookInstance.LOAN_STATUS)
+    reasons = {}
+    for pk in copy_ids:
+        if pk not in found:
+            reasons[pk] = 'No such copy'
+        elif found[pk] not in statuses:
+            reasons[pk] = f'Copy is {labels.get(found[pk], "in an unknown state").lower()}'
+        elif found[pk] == 'r':
+            reasons[pk] = 'Copy is reserved for another patron'
+        else:
+            reasons[pk] = 'Copy is being processed by someone else'
+    return reasons
+
+
+def refresh_copy_books(book_ids, counters=True):
+    """Do for the books of bulk-updated copies what the BookInstance signals do for a save()"""
+    book_ids = [pk for pk in book_ids if pk is not None]
+    if not book_ids:
+        return
+    books = Book.objects.filter(pk__in=book_ids)
+    if counters:
+        recount_availability(book_ids)
+    books.update(updated_at=timezone.now())
+    bump_versions(*[f'book:{pk}' for pk in book_ids])
@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmarks import compare_reports, default_scenarios, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Time every catalog page and admin changelist on the current data (see generate_catalog) '
+            'and write a JSON report with p50/p95/p99 latency, query counts and peak memory. '
+            'With --compare, exit with an error if any page regressed against an earlier report. '
+            'Pages render with the production settings, so run collectstatic first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per page')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per page first')
+        parser.add_argument('--output', help='Write the JSON report to this file (default: stdout)')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Only run these scenarios')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the page cache between requests (default: clear it before each one)')
+        parser.add_argument('--compare', metavar='BASELINE', help='A previous report to check for regressions')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed p95 slowdown against the baseline, as a fraction (default 0.2)')
+
+    def handle(self, *args, **options):
+        scenarios = default_scenarios()
+        if options['only']:
+            unknown = set(options['only']) - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError('Unknown scenarios: ' + ', '.join(sorted(unknown)))
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['only']]
+
+        report = run_benchmarks(scenarios, repeat=options['repeat'], warmup=options['warmup'],
+                                warm_cache=options['warm_cache'], progress=self.report_progress)
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            if baseline['meta'].get('rows') != report['meta']['rows']:
+                self.stderr.write(self.style.WARNING('The baseline was measured on different data'))
+            regressions = compare_reports(baseline, report, tolerance=options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against %s:\n  %s' % (options['compare'], '\n  '.join(regressions)))
+            self.stderr.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
+
+    def report_progress(self, name, result):
+        self.stderr.write('{name}: p50 {p50_ms:.1f}ms p95 {p95_ms:.1f}ms p99 {p99_ms:.1f}ms, {queries} queries, '
+                          '{peak_memory_kb:.0f} KiB (HTTP {status})'.format(name=name, **result))
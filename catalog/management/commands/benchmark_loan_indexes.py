@@ -0,0 +1,95 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from catalog.benchmarks import CatalogGenerator
+from catalog.models import BookInstance
+
+
+class Command(BaseCommand):
+    help = ('Seed BookInstance rows and report query plans and latencies for the loan list filters '
+            'with and without the BookInstance indexes. Run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, default=1000000, help='Number of copies to seed (default 1,000,000)')
+        parser.add_argument('--books', type=int, default=10000, help='Number of books to spread the copies over')
+        parser.add_argument('--borrowers', type=int, default=1000, help='Number of borrowing users')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-seed', action='store_true', help='Benchmark the rows already in the database')
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            if BookInstance.objects.exists():
+                raise CommandError('BookInstance table is not empty; use --no-seed or a scratch database')
+            self.seed(options)
+
+        borrower = User.objects.filter(bookinstance__status='o').first()
+        on_loan = BookInstance.objects.filter(status__exact='o')
+        available = BookInstance.objects.filter(status__exact='a')
+        # name: (queryset whose plan is reported, the call that is timed)
+        queries = {
+            'all-borrowed': (on_loan.order_by('due_back', 'id')[:3],
+                             lambda: list(on_loan.order_by('due_back', 'id')[:3])),
+            'my-borrowed': (on_loan.filter(borrower=borrower).order_by('due_back')[:3],
+                            lambda: list(on_loan.filter(borrower=borrower).order_by('due_back')[:3])),
+            'available-count': (available.order_by().only('id'), available.count),
+        }
+
+        before = self.measure_without_indexes(queries, options['repeat'])
+        after = self.measure(queries, options['repeat'])
+
+        for name in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, results in (('without indexes', before), ('with indexes', after)):
+                plan, timings = results[name]
+                self.stdout.write(f'  {label}: p50 {timings[len(timings) // 2]:.2f}ms, max {timings[-1]:.2f}ms')
+                for line in plan.splitlines():
+                    self.stdout.write(f'      {line}')
+
+    def seed(self, options):
+        """Generate the catalog with CatalogGenerator: most copies available, a fifth on loan"""
+        CatalogGenerator(options['copies'], books=options['books'], borrowers=options['borrowers'],
+                         seed=options['seed'], batch_size=options['batch_size'], index=False).run()
+
+    def measure_without_indexes(self, queries, repeat):
+        """measure() with the BookInstance indexes dropped; they are back when this returns or raises"""
+        indexes = BookInstance._meta.indexes
+        if not connection.features.can_rollback_ddl:
+            # MySQL commits DDL at once, so add them back whatever happens
+            self.remove_indexes(indexes)
+            try:
+                return self.measure(queries, repeat)
+            finally:
+                with connection.schema_editor() as editor:
+                    for index in indexes:
+                        editor.add_index(BookInstance, index)
+        # Dropped in a transaction that is rolled back, so even a Ctrl-C or a lost connection
+        # leaves them in place (the table stays locked against other writers meanwhile).
+        # SQLite only lets a schema editor into a transaction with foreign key checks already off.
+        with connection.constraint_checks_disabled(), transaction.atomic():
+            self.remove_indexes(indexes)
+            results = self.measure(queries, repeat)
+            transaction.set_rollback(True)
+        return results
+
+    def remove_indexes(self, indexes):
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.remove_index(BookInstance, index)
+
+    def measure(self, queries, repeat):
+        """Return {name: (plan, sorted latencies in ms)} for each query"""
+        results = {}
+        for name, (queryset, run) in queries.items():
+            plan = queryset.explain()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = (plan, sorted(timings))
+        return results
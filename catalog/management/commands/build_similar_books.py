@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from catalog.recommendations import MEASURES, build, changed_since, refresh
+
+
+class Command(BaseCommand):
+    help = ('Compute the similar books shown on each book page, for the whole catalog or (with book ids '
+            'or --since) only where the given books changed. Run it nightly, and after catalog imports.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('book_ids', nargs='*', type=int, help='Refresh only for changes to these books')
+        parser.add_argument('--since', type=float, metavar='HOURS',
+                            help='Refresh only for the books changed in the last HOURS hours')
+        parser.add_argument('--top', type=int, help='Similar books kept per book (default: CATALOG_SIMILAR_BOOKS)')
+        parser.add_argument('--measure', choices=MEASURES, default='cosine')
+
+    def handle(self, *args, **options):
+        book_ids = options['book_ids']
+        if options['since'] is not None:
+            book_ids += changed_since(timezone.now() - datetime.timedelta(hours=options['since']))
+        if book_ids or options['since'] is not None:
+            changed = refresh(book_ids, k=options['top'], measure=options['measure'])
+        else:
+            changed = build(k=options['top'], measure=options['measure'])
+        self.stdout.write(self.style.SUCCESS(f'{changed} similar book lists changed'))
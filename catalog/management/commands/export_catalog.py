@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from catalog.exports import CHUNK_SIZE, DATASETS, WRITERS, export
+
+
+class Command(BaseCommand):
+    help = 'Stream a catalog dataset (books, copies or authors) to a file or stdout as CSV or JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows fetched per query round trip')
+
+    def handle(self, *args, **options):
+        chunks = export(options['dataset'], options['format'], compress=options['gzip'],
+                        chunk_size=options['chunk_size'])
+        if options['output'] and options['gzip']:
+            output = open(options['output'], 'wb')
+        elif options['output']:
+            output = open(options['output'], 'w', encoding='utf-8', newline='')
+        else:
+            output = sys.stdout.buffer if options['gzip'] else self.stdout
+
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.visits import cache_is_shared, flush_visits
+
+
+class Command(BaseCommand):
+    help = ('Add the page visits counted in the cache to the PageVisits table. '
+            'Run it every few minutes (e.g. from cron) so quiet pages are recorded too. '
+            'Needs a cache server with an atomic incr(), such as memcached or Redis.')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError('With this cache each process counts its own visits, so this command would '
+                               'see none pending. Configure memcached or Redis.')
+        flushed = flush_visits()
+        self.stdout.write(self.style.SUCCESS(f'{flushed} visits flushed'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmarks import CatalogGenerator
+from catalog.models import Book, BookInstance
+
+
+class Command(BaseCommand):
+    help = ('Fill an empty database with a reproducible synthetic catalog for benchmarking '
+            '(e.g. --copies 10000 up to --copies 10000000). Run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, default=10000, help='Number of copies (default 10,000)')
+        parser.add_argument('--books', type=int, help='Number of books (default: copies / 10)')
+        parser.add_argument('--authors', type=int, help='Number of authors (default: books / 5)')
+        parser.add_argument('--borrowers', type=int, help='Number of borrowing users (default: copies / 100)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per transaction')
+        parser.add_argument('--no-index', action='store_true', help='Skip building the search index')
+
+    def handle(self, *args, **options):
+        if Book.objects.exists() or BookInstance.objects.exists():
+            raise CommandError('The catalog is not empty; generate into a scratch database')
+        self.inserted = {}
+        generator = CatalogGenerator(
+            options['copies'], books=options['books'], authors=options['authors'], borrowers=options['borrowers'],
+            seed=options['seed'], batch_size=options['batch_size'], index=not options['no_index'],
+            progress=self.report_progress)
+        sizes = generator.run()
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            'Generated {authors} authors, {books} books, {copies} copies, {genres} genres, {languages} languages '
+            'and {borrowers} borrowers'.format(**sizes)))
+
+    def report_progress(self, model, count):
+        name = model._meta.verbose_name_plural
+        self.inserted[name] = self.inserted.get(name, 0) + count
+        self.stdout.write(f'Inserted {self.inserted[name]} {name}', ending='\r')
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.imports import IMPORT_STATUSES, READERS, CatalogImporter, open_records
+
+
+class Command(BaseCommand):
+    help = ('Bulk import books and copies from a CSV, JSON Lines or MARC 21 file. '
+            'Books are matched by ISBN and authors by name; each record adds its copies.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='File format (default: guessed from the extension)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Records per transaction')
+        parser.add_argument('--status', default='m', choices=IMPORT_STATUSES,
+                            help='Status for copies whose record has none (default: m, maintenance)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or self.guess_format(path)
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+
+        importer = CatalogImporter(batch_size=options['batch_size'], default_status=options['status'],
+                                   progress=self.report_progress)
+        stats = importer.run(open_records(path, format))
+        self.stdout.write(self.style.SUCCESS(
+            'Imported {records} records: {books} new books, {authors} new authors, {genres} new genres, '
+            '{languages} new languages, {copies} copies ({skipped} records skipped without title or ISBN, '
+            'or with bad copies or status)'
+            .format(**stats)))
+
+    def guess_format(self, path):
+        extension = os.path.splitext(path)[1].lower().lstrip('.')
+        formats = {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl', 'mrc': 'marc', 'marc': 'marc'}
+        if extension not in formats:
+            raise CommandError(f'Cannot tell the format of {path}; pass --format')
+        return formats[extension]
+
+    def report_progress(self, stats, copies_per_second):
+        self.stdout.write(f"{stats['records']} records, {stats['copies']} copies ({copies_per_second:.0f} copies/s)")
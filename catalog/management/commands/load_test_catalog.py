@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmarks import LOAD_TEST_SCENARIOS, default_scenarios, load_test
+
+
+class Command(BaseCommand):
+    help = ('Load a running server with concurrent requests for the read-only catalog pages and report its '
+            'throughput per worker. To compare the deployment modes, start the same number of workers each way:\n'
+            '  gunicorn locallibrary.wsgi -w 2 -b :8001\n'
+            '  DJANGO_SERVER=asgi gunicorn locallibrary.asgi -c gunicorn.conf.py -w 2 -b :8002\n'
+            'then run: load_test_catalog http://127.0.0.1:8001 http://127.0.0.1:8002 --workers 2')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', metavar='URL', help='Base URL of each server to load')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes of each server')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per server')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', default=LOAD_TEST_SCENARIOS,
+                            help='Pages to request, by benchmark scenario name')
+
+    def handle(self, *args, **options):
+        # The pages are found in this process's database, which should be the servers' too
+        scenarios = {scenario.name: scenario for scenario in default_scenarios()}
+        unknown = set(options['only']) - set(scenarios)
+        if unknown:
+            raise CommandError('Unknown scenarios: ' + ', '.join(sorted(unknown)))
+        paths = [scenarios[name].path for name in options['only'] if scenarios[name].user is None]
+        if not paths:
+            raise CommandError('Only pages for anonymous visitors can be load tested')
+
+        results = []
+        for url in options['urls']:
+            result = load_test(url, paths, concurrency=options['concurrency'], duration=options['duration'],
+                               workers=options['workers'])
+            self.stderr.write('{url}: {requests_per_second} req/s ({requests_per_second_per_worker} per worker), '
+                              'p50 {p50_ms}ms p95 {p95_ms}ms, {requests} requests, errors {errors}'.format(**result))
+            results.append(result)
+        self.stdout.write(json.dumps(results, indent=2))
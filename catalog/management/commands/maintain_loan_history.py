@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from catalog.ledger import drop_history, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = ('Create the loan history partitions of the coming months (PostgreSQL) and drop the history '
+            'older than CATALOG_LOAN_HISTORY_MONTHS. Run it once a day.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help='Months to create partitions for')
+        parser.add_argument('--keep-months', type=int, help='Whole months of history to keep '
+                                                            '(default: CATALOG_LOAN_HISTORY_MONTHS)')
+
+    def handle(self, *args, **options):
+        created = ensure_partitions(options['months_ahead'])
+        dropped, deleted = drop_history(options['keep_months'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(created)} partitions created, {dropped} dropped; {deleted} older events deleted'))
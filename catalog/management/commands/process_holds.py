@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from catalog.holds import allocate_waiting, expire_holds
+
+
+class Command(BaseCommand):
+    help = ('Expire the holds whose copies were not borrowed in time, passing the copies on, and set aside '
+            'copies on the shelf (e.g. returned through the admin) for waiting holds. Run it once a day.')
+
+    def handle(self, *args, **options):
+        expired = expire_holds()
+        served = allocate_waiting()
+        self.stdout.write(self.style.SUCCESS(f'{expired} holds expired; {len(served)} copies set aside'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmarks import PROFILED_SCENARIOS, default_scenarios, profile_scenarios
+
+
+class Command(BaseCommand):
+    help = ('Render the book and author detail pages and the list pages on the current data and report '
+            'the time spent in each template and {% block %} (inclusive of what they include or extend).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Renders per page')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', default=PROFILED_SCENARIOS,
+                            help='Pages to profile, by benchmark scenario name')
+
+    def handle(self, *args, **options):
+        scenarios = {scenario.name: scenario for scenario in default_scenarios()}
+        unknown = set(options['only']) - set(scenarios)
+        if unknown:
+            raise CommandError('Unknown scenarios: ' + ', '.join(sorted(unknown)))
+
+        profiles = profile_scenarios([scenarios[name] for name in options['only']], repeat=options['repeat'])
+        for name, profile in profiles.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name} ({scenarios[name].path})'))
+            for kind, label, count, total_ms in profile.rows():
+                self.stdout.write(f'  {total_ms / count:8.2f}ms  {kind:8}  {label}  (x{count})')
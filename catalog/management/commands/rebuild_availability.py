@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.counters import rebuild_availability
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Recount the denormalized per-book availability columns from the BookInstance table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('book_ids', nargs='*', type=int, help='Only rebuild these books (default: all)')
+
+    def handle(self, *args, **options):
+        books = Book.objects.all()
+        if options['book_ids']:
+            books = books.filter(pk__in=options['book_ids'])
+
+        with transaction.atomic():
+            updated = rebuild_availability(books)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt availability counters for {updated} books'))
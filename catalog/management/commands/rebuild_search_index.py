@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for books (all books, or only the given ids)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('book_ids', nargs='*', type=int, help='Only reindex these books (default: all)')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(write=True)
+        with transaction.atomic(using=backend.using):
+            backend.index(options['book_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index with {type(backend).__name__}'))
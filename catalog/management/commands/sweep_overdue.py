@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from catalog.overdue import BATCH_SIZE, sweep
+
+
+class Command(BaseCommand):
+    help = ('Email a reminder to every borrower with overdue loans and record the overdue counts '
+            'shown on the librarian pages. Run it once a day (e.g. from cron or Heroku Scheduler).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Loans read per query')
+        parser.add_argument('--no-email', action='store_true', help='Only record the counts')
+
+    def handle(self, *args, **options):
+        summary = sweep(batch_size=options['batch_size'], send=not options['no_email'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{summary.overdue_loans} overdue loans for {summary.borrowers} borrowers; '
+            f'{summary.reminders_sent} reminders sent'))
@@ -0,0 +1,193 @@
+"""Per-request SQL and template instrumentation.
+
+RequestMetricsMiddleware counts and times the SQL queries of each request, including how many
+repeat a statement the request already ran (the usual sign of an N+1 loop), and times template
+rendering through the DjangoTemplates backend below. Each response gets a Server-Timing header.
+The totals for each URL name are kept in memory and served in the Prometheus text format by
+the metrics view. Each server process keeps its own totals.
+
+The per-query cost is one wrapper call and a dict increment, so it can stay on in production
+(set CATALOG_REQUEST_METRICS = False to remove the middleware).
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# The RequestMetrics of the request being handled, if any
+_current = contextvars.ContextVar('catalog_request_metrics', default=None)
+
+
+def current_metrics():
+    """The RequestMetrics of the request being handled, or None"""
+    return _current.get()
+
+
+class RequestMetrics:
+    """The queries, database time and template time of one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        # Statements are parameterized, so the SQL text is the query's fingerprint
+        self.statements = Counter()
+        # Queries can also run in catalog.concurrency's pool threads
+        self._lock = threading.Lock()
+
+    def execute(self, execute, sql, params, many, context):
+        """A database execute_wrapper (see django.db.backends.base.base.BaseDatabaseWrapper)"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self._lock:
+                self.db_time += time.perf_counter() - start
+                self.queries += 1
+                self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        """Queries that repeated a statement already run in this request"""
+        return self.queries - len(self.statements)
+
+    def repeated(self):
+        """(sql, times run) for each statement run more than once, most repeated first"""
+        return [(sql, count) for sql, count in self.statements.most_common() if count > 1]
+
+    def server_timing(self, duration):
+        """The Server-Timing header value (durations in milliseconds)"""
+        return ('total;dur=%.1f, db;dur=%.1f;desc="%d queries, %d repeated", template;dur=%.1f'
+                % (duration * 1000, self.db_time * 1000, self.queries, self.duplicates,
+                   self.template_time * 1000))
+
+
+class MetricsRegistry:
+    """Running totals per URL name, rendered as Prometheus counters"""
+
+    # (metric name, help text, RequestMetrics total)
+    METRICS = (
+        ('catalog_requests_total', 'Requests served', 'requests'),
+        ('catalog_request_seconds_total', 'Time spent serving requests', 'seconds'),
+        ('catalog_db_queries_total', 'SQL queries run', 'queries'),
+        ('catalog_db_duplicate_queries_total', 'SQL queries repeating a statement of the same request',
+         'duplicates'),
+        ('catalog_db_seconds_total', 'Time spent in SQL queries', 'db_seconds'),
+        ('catalog_template_seconds_total', 'Time spent rendering templates (including their queries)',
+         'template_seconds'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = defaultdict(Counter)
+
+    def record(self, view, duration, metrics):
+        with self._lock:
+            totals = self._totals[view]
+            totals['requests'] += 1
+            totals['seconds'] += duration
+            totals['queries'] += metrics.queries
+            totals['duplicates'] += metrics.duplicates
+            totals['db_seconds'] += metrics.db_time
+            totals['template_seconds'] += metrics.template_time
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+    def render(self):
+        """The totals in the Prometheus text exposition format"""
+        with self._lock:
+            totals = {view: Counter(counts) for view, counts in self._totals.items()}
+        lines = []
+        for name, help_text, key in self.METRICS:
+            lines.append(f'# HELP {name} {help_text}, by URL name')
+            lines.append(f'# TYPE {name} counter')
+            for view in sorted(totals):
+                lines.append('%s{view="%s"} %s' % (name, _escape(view), _number(totals[view][key])))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return str(value) if isinstance(value, int) else '%.6f' % value
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    """Instrument every request: Server-Timing header, registry totals and a log of repeated queries.
+
+    Put it near the top of MIDDLEWARE so the session and user lookups are counted too.
+    Queries run while a streaming response is being sent are not counted.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CATALOG_REQUEST_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        registry.record(view, duration, metrics)
+        response['Server-Timing'] = metrics.server_timing(duration)
+        if metrics.duplicates:
+            logger.info('%s %s ran %d queries, %d repeated: %s', request.method, request.path,
+                        metrics.queries, metrics.duplicates, metrics.repeated()[:5])
+        return response
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """The Django template backend, timing each render for RequestMetricsMiddleware"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class TimedTemplate:
+    """Wraps a backend template, adding its render time to the current request's metrics"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
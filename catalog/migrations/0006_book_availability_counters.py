@@ -0,0 +1,59 @@
+# Generated by Django 3.0.6 on 2026-10-18 16:57
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+STATUS_COUNTER_FIELDS = {
+    'm': 'copies_maintenance',
+    'o': 'copies_on_loan',
+    'a': 'copies_available',
+    'r': 'copies_reserved',
+}
+
+
+def count_existing_copies(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    counts = {}
+    for status, field in STATUS_COUNTER_FIELDS.items():
+        copies = (BookInstance.objects.filter(book=OuterRef('pk'), status=status)
+                  .order_by().values('book').annotate(total=Count('pk')).values('total'))
+        counts[field] = Coalesce(Subquery(copies, output_field=IntegerField()), 0)
+    Book.objects.update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_auto_20200517_1553'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bookinstance',
+            options={'ordering': ['due_back'], 'permissions': (('can_mark_returned', 'Set book as returned'),)},
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_maintenance',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_on_loan',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_reserved',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_copies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 3.0.6 on 2026-10-18 17:00
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import sqlite3
+
+
+# Books indexed per INSERT while filling the index for the existing books
+BATCH_SIZE = 1000
+
+# The search text of the books with BATCH_SIZE consecutive ids, as catalog/search.py indexes it
+BOOKS = 'FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id WHERE b.id >= %s AND b.id < %s'
+AUTHOR_NAME = "COALESCE(a.first_name, '') || ' ' || COALESCE(a.last_name, '')"
+GENRE_NAMES = ('(SELECT {concat} FROM catalog_book_genre bg JOIN catalog_genre g ON g.id = bg.genre_id '
+               'WHERE bg.book_id = b.id)')
+POSTGRES_FILL = f"""
+    INSERT INTO catalog_booksearchdocument (book_id, document)
+    SELECT b.id, setweight(to_tsvector(%s::regconfig, COALESCE(b.title, '') || ' ' || COALESCE(b.isbn, '')), 'A')
+        || setweight(to_tsvector(%s::regconfig, {AUTHOR_NAME}), 'B')
+        || setweight(to_tsvector(%s::regconfig, COALESCE({GENRE_NAMES.format(concat="string_agg(g.name, ' ')")}, '')), 'C')
+        || setweight(to_tsvector(%s::regconfig, COALESCE(b.summary, '')), 'D')
+    {BOOKS}"""
+SQLITE_FILL = f"""
+    INSERT INTO catalog_book_fts (rowid, title, isbn, authors, genres, summary)
+    SELECT b.id, b.title, b.isbn, {AUTHOR_NAME}, {GENRE_NAMES.format(concat="group_concat(g.name, ' ')")}, b.summary
+    {BOOKS}"""
+
+
+def fill_search_index(schema_editor, insert, params=()):
+    """Index the books already in the database, BATCH_SIZE ids at a time"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(id), MAX(id) FROM catalog_book')
+        low, high = cursor.fetchone()
+        if low is None:
+            return
+        for start in range(low, high + 1, BATCH_SIZE):
+            cursor.execute(insert, [*params, start, start + BATCH_SIZE])
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        config = getattr(settings, 'CATALOG_SEARCH_CONFIG', 'english')
+        fill_search_index(schema_editor, POSTGRES_FILL, [config] * 4)
+        # Built after the rows are in, which is faster than maintaining it row by row
+        schema_editor.execute(
+            'CREATE INDEX catalog_booksearchdocument_document_gin '
+            'ON catalog_booksearchdocument USING GIN (document)')
+    elif vendor == 'sqlite':
+        connection = sqlite3.connect(':memory:')
+        has_fts5 = any(option == 'ENABLE_FTS5' for (option,) in connection.execute('PRAGMA compile_options'))
+        connection.close()
+        if has_fts5:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE catalog_book_fts USING fts5("
+                "title, isbn, authors, genres, summary, tokenize='porter unicode61')")
+            fill_search_index(schema_editor, SQLITE_FILL)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS catalog_booksearchdocument_document_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS catalog_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_bookinstance_loan_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchDocument',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='catalog.Book')),
+                ('document', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+        ),
+        # Creates the index and fills it for the existing books
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.6 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookinstance',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
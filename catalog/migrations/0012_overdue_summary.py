@@ -0,0 +1,30 @@
+# Generated by Django 3.0.6 on 2026-10-18 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_bookinstance_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('overdue_loans', models.PositiveIntegerField(default=0)),
+                ('borrowers', models.PositiveIntegerField(default=0, help_text='Borrowers with at least one overdue loan')),
+                ('oldest_due_back', models.DateField(blank=True, null=True)),
+                ('reminders_sent', models.PositiveIntegerField(default=0)),
+                ('swept_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'overdue summaries',
+                'ordering': ['-date'],
+                'get_latest_by': 'date',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.6 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_overdue_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageVisits',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.CharField(max_length=50)),
+                ('date', models.DateField()),
+                ('visits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'page visits',
+                'ordering': ['-date', 'page'],
+                'unique_together': {('page', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.0.6 on 2026-10-18 17:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0013_page_visits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('w', 'Waiting'), ('r', 'Ready for pickup'), ('f', 'Fulfilled'), ('c', 'Cancelled'), ('e', 'Expired')], default='w', max_length=1)),
+                ('sequence', models.PositiveIntegerField(editable=False)),
+                ('placed_at', models.DateTimeField(auto_now_add=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('pickup_by', models.DateField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.Book')),
+                ('copy', models.ForeignKey(blank=True, help_text='The copy set aside for the patron', null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.BookInstance')),
+                ('patron', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['placed_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='hold',
+            index=models.Index(fields=['book', 'status', 'sequence'], name='hold_queue_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hold',
+            constraint=models.UniqueConstraint(condition=models.Q(status__in=['w', 'r']), fields=('book', 'patron'), name='hold_one_active_per_patron'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 3.0.6 on 2026-10-18 17:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def create_loanevent_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.create_model(apps.get_model('catalog', 'LoanEvent'))
+        return
+    # Partitioned by month of occurred_at (PostgreSQL 11 or later), see catalog/ledger.py. The primary
+    # key of a partitioned table has to include the partition key; id alone is still unique.
+    schema_editor.execute(
+        'CREATE TABLE "catalog_loanevent" ('
+        '"id" bigserial NOT NULL, '
+        '"occurred_at" timestamp with time zone NOT NULL, '
+        '"kind" varchar(1) NOT NULL, '
+        '"due_back" date NULL, '
+        '"book_id" integer NULL, '
+        '"borrower_id" integer NULL, '
+        '"copy_id" uuid NOT NULL, '
+        'PRIMARY KEY ("id", "occurred_at")'
+        ') PARTITION BY RANGE ("occurred_at")')
+    schema_editor.execute('CREATE TABLE "catalog_loanevent_default" PARTITION OF "catalog_loanevent" DEFAULT')
+    for name, column in [('loanevent_copy_idx', 'copy_id'), ('loanevent_book_idx', 'book_id'),
+                         ('loanevent_borrower_idx', 'borrower_id')]:
+        schema_editor.execute(f'CREATE INDEX "{name}" ON "catalog_loanevent" ("{column}", "occurred_at")')
+
+
+def drop_loanevent_table(apps, schema_editor):
+    # Drops the partitions too on PostgreSQL
+    schema_editor.execute('DROP TABLE "catalog_loanevent"')
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0015_similar_books'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='LoanEvent',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('occurred_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('kind', models.CharField(choices=[('o', 'Checkout'), ('n', 'Renewal'), ('r', 'Return')], max_length=1)),
+                        ('due_back', models.DateField(help_text='The due date set by a checkout or renewal', null=True)),
+                        ('book', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.Book')),
+                        ('borrower', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                        ('copy', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='loan_events', to='catalog.BookInstance')),
+                    ],
+                    options={
+                        'ordering': ['occurred_at', 'id'],
+                    },
+                ),
+                migrations.AddIndex(
+                    model_name='loanevent',
+                    index=models.Index(fields=['copy', 'occurred_at'], name='loanevent_copy_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='loanevent',
+                    index=models.Index(fields=['book', 'occurred_at'], name='loanevent_book_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='loanevent',
+                    index=models.Index(fields=['borrower', 'occurred_at'], name='loanevent_borrower_idx'),
+                ),
+            ],
+        ),
+        # Create the monthly partitions with `manage.py maintain_loan_history`
+        migrations.RunPython(create_loanevent_table, drop_loanevent_table),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.6 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_loan_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogDeletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50, unique=True)),
+                ('deleted_at', models.DateTimeField()),
+            ],
+        ),
+    ]
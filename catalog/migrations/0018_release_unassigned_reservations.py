@@ -0,0 +1,43 @@
+from django.db import migrations
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+STATUS_COUNTER_FIELDS = {
+    'm': 'copies_maintenance',
+    'o': 'copies_on_loan',
+    'a': 'copies_available',
+    'r': 'copies_reserved',
+}
+
+
+def release_unassigned_reservations(apps, schema_editor):
+    """Put copies marked Reserved for nobody (from before the hold queue) back on the shelf.
+
+    checkout() only lends a reserved copy to the patron it is reserved for, so these could not
+    be lent at all. `manage.py process_holds` sets them aside for waiting holds afterwards.
+    """
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    copies = BookInstance.objects.filter(status='r', borrower__isnull=True)
+    book_ids = set(copies.values_list('book_id', flat=True)) - {None}
+    now = timezone.now()
+    copies.update(status='a', due_back=None, updated_at=now, version=F('version') + 1)
+    counts = {}
+    for status, field in STATUS_COUNTER_FIELDS.items():
+        copies = (BookInstance.objects.filter(book=OuterRef('pk'), status=status)
+                  .order_by().values('book').annotate(total=Count('pk')).values('total'))
+        counts[field] = Coalesce(Subquery(copies, output_field=IntegerField()), 0)
+    Book.objects.filter(pk__in=book_ids).update(updated_at=now, **counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0017_catalog_deletions'),
+    ]
+
+    operations = [
+        migrations.RunPython(release_unassigned_reservations, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from datetime import date
 # Create your models here.
 from django.urls import reverse
+from django.utils import timezone
 
 class Genre(models.Model):
     """Model representing a book genre"""
@@ -32,13 +34,23 @@ class Book(models.Model):
     author = models.ForeignKey('Author', on_delete=models.SET_NULL, null=True)
 
     summary = models.TextField(max_length=1000, help_text='Enter a brief description of the book')
-    isbn = models.CharField('ISBN', max_length=13, help_text='13 character <a href="https://www.isbn-international.org/content/what-isbn">ISBN number</a>')
+    isbn = models.CharField('ISBN', max_length=13, db_index=True, help_text='13 character <a href="https://www.isbn-international.org/content/what-isbn">ISBN number</a>')
 
     # ManyToManyField used because genre can contain many books. Books can cover many genres.
     # Genre class has already been defined so we can specify the object above.
     genre = models.ManyToManyField(Genre, help_text='Select a genre for this book')
     language = models.ForeignKey('Language', on_delete=models.SET_NULL, null=True)
 
+    # Denormalized counts of this book's copies by status, maintained by catalog/signals.py
+    # whenever a BookInstance is saved or deleted (rebuild with `manage.py rebuild_availability`)
+    copies_available = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    copies_on_loan = models.PositiveIntegerField(default=0, editable=False)
+    copies_maintenance = models.PositiveIntegerField(default=0, editable=False)
+    copies_reserved = models.PositiveIntegerField(default=0, editable=False)
+
+    # Last change to the book or anything shown on its page (its copies, genres...), for conditional GETs
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
     def display_genre(self):
         """Create a string for the Genre. This is required to display genre in Admin"""
         return ', '.join([genre.name for genre in self.genre.all()[:3]])
@@ -56,6 +68,26 @@ class Book(models.Model):
 import uuid
 from datetime import date
 
+
+class ConcurrentUpdate(Exception):
+    """Raised when saving a copy that was saved by someone else since it was loaded.
+
+    Nothing has been written: reload the copy and apply the change again (or give up).
+    """
+
+
+class BookInstanceQuerySet(models.QuerySet):
+    def on_loan(self):
+        return self.filter(status__exact='o')
+
+    def overdue(self, today=None):
+        """Copies on loan whose due date has passed, filtered in the database.
+
+        Served by the partial index of on-loan copies on (due_back, id).
+        """
+        return self.on_loan().filter(due_back__lt=today or date.today())
+
+
 class BookInstance(models.Model):
     """Model representing a specific copy of a book (i.e that can be borrowed from the library)."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, help_text='Unique ID for this particular book across whole library')
@@ -75,14 +107,85 @@ class BookInstance(models.Model):
         blank=True, default = 'm',
         help_text = 'Book availability'
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Incremented by every save; an UPDATE only applies while the row still has the version
+    # the instance was loaded with (optimistic locking, see save())
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = BookInstanceQuerySet.as_manager()
+
+    # The Book counter column that tracks copies in each status
+    STATUS_COUNTER_FIELDS = {
+        'm': 'copies_maintenance',
+        'o': 'copies_on_loan',
+        'a': 'copies_available',
+        'r': 'copies_reserved',
+    }
 
     class Meta:
         ordering = ['due_back']
         permissions = (("can_mark_returned", "Set book as returned"),)
+        indexes = [
+            # Copies by status ordered by due date (LoanedBooksView, the available-copies count)
+            models.Index(fields=['status', 'due_back'], name='bookinstance_status_due_idx'),
+            # A borrower's loans ordered by due date (LoanedBooksByUserListView)
+            models.Index(fields=['borrower', 'status', 'due_back'], name='bookinstance_borrower_idx'),
+            # Only the on-loan copies, in the (due_back, id) keyset order of the loan lists.
+            # Partial indexes are built on PostgreSQL and SQLite and skipped by other backends.
+            models.Index(fields=['due_back', 'id'], name='bookinstance_on_loan_idx',
+                         condition=models.Q(status='o')),
+        ]
         
     def __str__(self):
         """String for representing the Model object"""
         return f'{self.id} ({self.book.title})'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored book and status so a save can move the Book counters
+        instance._loaded_availability = (instance.__dict__.get('book_id'), instance.__dict__.get('status'))
+        instance._loaded_values = instance.field_values()
+        return instance
+
+    def field_values(self):
+        """{field name: value} for the concrete fields loaded on this instance"""
+        return {field.name: self.__dict__[field.attname] for field in self._meta.concrete_fields
+                if field.attname in self.__dict__}
+
+    def changed_fields(self):
+        """Names of the fields that differ from what was loaded from the database"""
+        loaded = getattr(self, '_loaded_values', {})
+        return [name for name, value in self.field_values().items()
+                if name != 'version' and (name not in loaded or loaded[name] != value)]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            # Only write the columns that changed, plus the version and timestamp
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = self.changed_fields()
+            kwargs['update_fields'] = set(update_fields) | {'version', 'updated_at'}
+        # Atomic so the Book availability counters (updated in post_save) commit with the copy
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+        self._loaded_values = self.field_values()
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """UPDATE ... WHERE version = <loaded version>, bumping the version.
+
+        Raises ConcurrentUpdate if the row exists but has been saved since it was loaded.
+        """
+        version = self.version
+        values = [(field, model, version + 1 if field.name == 'version' else value)
+                  for field, model, value in values]
+        updated = super()._do_update(base_qs.filter(version=version), using, pk_val, values,
+                                     update_fields, forced_update)
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            raise ConcurrentUpdate(f'Copy {pk_val} was changed by someone else')
+        if updated:
+            self.version = version + 1
+        return updated
     
     @property
     def is_overdue(self):
@@ -97,9 +200,14 @@ class Author(models.Model):
     last_name = models.CharField(max_length=100)
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField('Died', null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [
+            # Serves the default ordering and name lookups (e.g. de-duplicating authors on import)
+            models.Index(fields=['last_name', 'first_name'], name='author_name_idx'),
+        ]
 
     def get_absolute_url(self):
         """Return for representing the Model object"""
@@ -110,5 +218,202 @@ class Author(models.Model):
         return f'{self.last_name}, {self.first_name}'
     
 
+class HoldQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(status__in=(Hold.WAITING, Hold.READY))
+
+    def with_positions(self):
+        """Annotate each hold with the sequence at the head of its book's queue (one index lookup per hold)"""
+        head = (Hold.objects.filter(book=models.OuterRef('book'), status=Hold.WAITING)
+                .order_by('sequence').values('sequence')[:1])
+        return self.annotate(queue_head=models.Subquery(head))
+
+
+class Hold(models.Model):
+    """A patron's place in the queue for a copy of a book (see catalog/holds.py)"""
+    WAITING, READY, FULFILLED, CANCELLED, EXPIRED = 'w', 'r', 'f', 'c', 'e'
+    HOLD_STATUS = (
+        (WAITING, 'Waiting'),
+        (READY, 'Ready for pickup'),
+        (FULFILLED, 'Fulfilled'),
+        (CANCELLED, 'Cancelled'),
+        (EXPIRED, 'Expired'),
+    )
+
+    book = models.ForeignKey('Book', on_delete=models.CASCADE)
+    patron = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=1, choices=HOLD_STATUS, default=WAITING)
+    # The waiting holds of a book are numbered without gaps from the head of the queue, so a
+    # hold's position is its sequence minus the head's (see holds.position())
+    sequence = models.PositiveIntegerField(editable=False)
+    copy = models.ForeignKey('BookInstance', on_delete=models.SET_NULL, null=True, blank=True,
+                             help_text='The copy set aside for the patron')
+    placed_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    pickup_by = models.DateField(null=True, blank=True)
+
+    objects = HoldQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['placed_at']
+        indexes = [
+            # A book's queue in order: the head and a hold's position are index lookups
+            models.Index(fields=['book', 'status', 'sequence'], name='hold_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'patron'], condition=models.Q(status__in=['w', 'r']),
+                                    name='hold_one_active_per_patron'),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object"""
+        return f'{self.patron} for {self.book} ({self.get_status_display()})'
+
+    @property
+    def is_active(self):
+        return self.status in (self.WAITING, self.READY)
+
+    @property
+    def position(self):
+        """Place in the book's queue (1 is served next), or None unless waiting"""
+        if self.status != self.WAITING:
+            return None
+        head = getattr(self, 'queue_head', None)
+        if head is None:
+            head = (Hold.objects.filter(book=self.book_id, status=self.WAITING)
+                    .order_by('sequence').values_list('sequence', flat=True).first())
+        return self.sequence - head + 1
+
+
+class LoanEvent(models.Model):
+    """A checkout, renewal or return of a copy. The ledger is append-only (see catalog/ledger.py)"""
+    CHECKOUT = 'o'
+    RENEWAL = 'n'
+    RETURN = 'r'
+    KINDS = (
+        (CHECKOUT, 'Checkout'),
+        (RENEWAL, 'Renewal'),
+        (RETURN, 'Return'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    # The partition key on PostgreSQL
+    occurred_at = models.DateTimeField(default=timezone.now)
+    kind = models.CharField(max_length=1, choices=KINDS)
+    # Without database constraints: the history outlives deleted copies, books and users
+    copy = models.ForeignKey('BookInstance', on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                             related_name='loan_events')
+    # Null for copies whose book was deleted (BookInstance.book is SET_NULL)
+    book = models.ForeignKey('Book', on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                             null=True, related_name='+')
+    borrower = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                                 null=True, related_name='+')
+    due_back = models.DateField(null=True, help_text='The due date set by a checkout or renewal')
+
+    class Meta:
+        ordering = ['occurred_at', 'id']
+        indexes = [
+            # The history of a copy, a book or a borrower in time order
+            models.Index(fields=['copy', 'occurred_at'], name='loanevent_copy_idx'),
+            models.Index(fields=['book', 'occurred_at'], name='loanevent_book_idx'),
+            models.Index(fields=['borrower', 'occurred_at'], name='loanevent_borrower_idx'),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object"""
+        return f'{self.get_kind_display()} of {self.copy_id} at {self.occurred_at:%Y-%m-%d %H:%M}'
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise TypeError('Loan events cannot be changed once recorded')
+        super().save(*args, **kwargs)
+
+
+class SimilarBook(models.Model):
+    """One of the books most like a book, by shared genres and author (see catalog/recommendations.py)"""
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='similar_books')
+    similar = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    # Rows are only rewritten when the list changes, so the newest one dates the book's list
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['book', 'rank']
+        constraints = [
+            # Its index serves the book detail page: one range read of a book's rows in rank order
+            models.UniqueConstraint(fields=['book', 'rank'], name='similarbook_book_rank'),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object"""
+        return f'{self.similar} (#{self.rank} for {self.book})'
+
+
+class OverdueSummary(models.Model):
+    """Overdue loan counts recorded by `manage.py sweep_overdue`, one row per day.
+
+    Lets the librarian pages show how many loans are overdue without scanning the copies.
+    """
+    date = models.DateField(unique=True)
+    overdue_loans = models.PositiveIntegerField(default=0)
+    borrowers = models.PositiveIntegerField(default=0, help_text='Borrowers with at least one overdue loan')
+    oldest_due_back = models.DateField(null=True, blank=True)
+    reminders_sent = models.PositiveIntegerField(default=0)
+    swept_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        get_latest_by = 'date'
+        verbose_name_plural = 'overdue summaries'
+
+    def __str__(self):
+        """String for representing the Model object"""
+        return f'{self.overdue_loans} overdue loans on {self.date}'
+
+
+class PageVisits(models.Model):
+    """Visits of a page on one day, added in batches from the cache counters (see catalog/visits.py)"""
+    page = models.CharField(max_length=50)
+    date = models.DateField()
+    visits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date', 'page']
+        unique_together = [['page', 'date']]
+        verbose_name_plural = 'page visits'
+
+    def __str__(self):
+        """String for representing the Model object"""
+        return f'{self.visits} visits of {self.page} on {self.date}'
+
+
+class CatalogDeletion(models.Model):
+    """When a row of a catalog model was last deleted, one row per model (see catalog/cache.py).
+
+    A deleted row leaves no updated_at behind, so the list pages date their content with these too.
+    """
+    model = models.CharField(max_length=50, unique=True)
+    deleted_at = models.DateTimeField()
+
+    def __str__(self):
+        """String for representing the Model object"""
+        return f'{self.model} deleted at {self.deleted_at:%Y-%m-%d %H:%M}'
+
+
+class BookSearchDocument(models.Model):
+    """Weighted full-text search vector for a book (used on PostgreSQL, see catalog/search.py).
+
+    Kept out of the Book table so list and detail queries do not drag the tsvector along.
+    The GIN index on document is created by migration 0008 on PostgreSQL only.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    document = SearchVectorField(null=True)
+
+    def __str__(self):
+        """String for representing the Model object"""
+        return f'Search document for book {self.book_id}'
+
+
 # py manage.py makemigration
-# py manage.py migrate
\ No newline at end of file
+# py manage.py migrate
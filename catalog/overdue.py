@@ -0,0 +1,100 @@
+"""Overdue loans: reminder emails and the daily OverdueSummary row.
+
+sweep() walks the overdue loans in keyset order (borrower, due_back, id) a batch at a time,
+so memory use and query cost per batch stay flat however many loans are overdue. Each
+borrower gets one reminder listing all their overdue books; the reminders of a batch go
+out over one connection of the configured EMAIL_BACKEND with send_messages().
+"""
+import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+
+from catalog.models import BookInstance, OverdueSummary
+from catalog.pagination import CursorPaginator
+
+BATCH_SIZE = 1000
+
+
+def overdue_batches(today, batch_size=BATCH_SIZE):
+    """Yield lists of overdue copies (with their book and borrower) in keyset-ordered batches"""
+    queryset = BookInstance.objects.overdue(today).select_related('book', 'borrower')
+    paginator = CursorPaginator(queryset, batch_size, ('borrower', 'due_back', 'id'))
+    cursor = None
+    while True:
+        page = paginator.page(cursor)
+        if page.object_list:
+            yield page.object_list
+        if not page.has_next():
+            break
+        cursor = page.next_cursor
+
+
+def borrower_loans(batches):
+    """Regroup batches sorted by borrower into (borrower, [copies]) pairs, across batch boundaries.
+
+    Yields None between batches, as a cue to flush whatever was collected so far.
+    """
+    borrower_id, borrower, copies = None, None, []
+    for batch in batches:
+        for copy in batch:
+            if copies and copy.borrower_id != borrower_id:
+                yield borrower, copies
+                copies = []
+            borrower_id, borrower = copy.borrower_id, copy.borrower
+            copies.append(copy)
+        yield None
+    if copies:
+        yield borrower, copies
+
+
+def reminder(borrower, copies, today):
+    context = {'borrower': borrower, 'copies': copies, 'today': today}
+    return EmailMessage(
+        subject=render_to_string('catalog/email/overdue_reminder_subject.txt', context).strip(),
+        body=render_to_string('catalog/email/overdue_reminder.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[borrower.email],
+    )
+
+
+def sweep(today=None, batch_size=BATCH_SIZE, send=True):
+    """Email every borrower with overdue loans and record today's OverdueSummary; returns it"""
+    today = today or datetime.date.today()
+    connection = get_connection() if send else None
+    if connection is not None:
+        # One connection for every batch (a no-op for the console and locmem backends)
+        connection.open()
+    overdue_loans = borrowers = reminders_sent = 0
+    oldest_due_back = None
+    pending = []
+
+    for group in borrower_loans(overdue_batches(today, batch_size)):
+        if group is None:
+            if pending:
+                reminders_sent += connection.send_messages(pending) or 0
+                pending = []
+            continue
+        borrower, copies = group
+        overdue_loans += len(copies)
+        oldest = min(copy.due_back for copy in copies)
+        oldest_due_back = oldest if oldest_due_back is None else min(oldest_due_back, oldest)
+        if borrower is None:
+            # Loans without a borrower are counted but nobody can be reminded
+            continue
+        borrowers += 1
+        if send and borrower.email:
+            pending.append(reminder(borrower, copies, today))
+    if pending:
+        reminders_sent += connection.send_messages(pending) or 0
+    if connection is not None:
+        connection.close()
+
+    summary, created = OverdueSummary.objects.update_or_create(date=today, defaults={
+        'overdue_loans': overdue_loans,
+        'borrowers': borrowers,
+        'oldest_due_back': oldest_due_back,
+        'reminders_sent': reminders_sent,
+    })
+    return summary
@@ -0,0 +1,206 @@
+import collections.abc
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.translation import gettext as _
+
+
+class InvalidCursor(Exception):
+    """Raised when a cursor token cannot be decoded"""
+
+
+class CursorPage(collections.abc.Sequence):
+    """A page of results fetched by keyset (cursor) pagination.
+
+    Mirrors the parts of django.core.paginator.Page the templates use, but has no page
+    number or total count: it only knows whether there is a page before or after it.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page of %s items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Paginate a queryset by seeking past the last row seen instead of using OFFSET.
+
+    ordering is a sequence of ascending model field names that together are unique,
+    e.g. ('due_back', 'id'). Each page is one query of per_page + 1 rows and no COUNT(*),
+    so deep pages cost the same as the first one. Cursors are signed, opaque tokens.
+    """
+    is_cursor = True
+    salt = 'catalog.pagination.cursor'
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [queryset.model._meta.get_field(name) for name in self.ordering]
+
+    def encode_cursor(self, obj, direction):
+        """Build the token pointing just after (direction 'n') or before (direction 'p') obj"""
+        values = []
+        for field in self.fields:
+            # Rows may be model instances or values() dicts
+            value = obj[field.attname] if isinstance(obj, dict) else getattr(obj, field.attname)
+            values.append(None if value is None else str(value))
+        return signing.dumps([direction, values], salt=self.salt)
+
+    def decode_cursor(self, cursor):
+        """Return (direction, values) for a token produced by encode_cursor"""
+        try:
+            direction, raw_values = signing.loads(cursor, salt=self.salt)
+            if direction not in ('n', 'p') or len(raw_values) != len(self.fields):
+                raise ValueError(direction)
+            values = [None if raw is None else field.to_python(raw)
+                      for field, raw in zip(self.fields, raw_values)]
+        except (signing.BadSignature, ValueError, TypeError) as e:
+            raise InvalidCursor(_('Invalid cursor')) from e
+        return direction, values
+
+    def _seek(self, values, forward, index=0):
+        """Build the WHERE clause selecting rows strictly after (or before) values in the ordering.
+
+        NULLs sort first, so they come before every non-NULL value of the same column.
+        """
+        name, value = self.ordering[index], values[index]
+        rest = self._seek(values, forward, index + 1) if index + 1 < len(values) else None
+
+        if value is None:
+            same = Q(**{name + '__isnull': True})
+            beyond = Q(**{name + '__isnull': False}) if forward else None
+        else:
+            same = Q(**{name: value})
+            beyond = Q(**{name + ('__gt' if forward else '__lt'): value})
+            if not forward and self.fields[index].null:
+                beyond |= Q(**{name + '__isnull': True})
+
+        condition = same & rest if rest is not None else None
+        if beyond is not None:
+            condition = beyond if condition is None else beyond | condition
+        # A NULL cursor value with no tie-breaker left has nothing before it
+        return condition if condition is not None else Q(pk__in=[])
+
+    def _order(self, forward):
+        if forward:
+            return [F(name).asc(nulls_first=True) for name in self.ordering]
+        return [F(name).desc(nulls_last=True) for name in self.ordering]
+
+    def page(self, cursor=None):
+        """Return the CursorPage for cursor (the first page if cursor is empty)"""
+        queryset = self.queryset
+        forward = True
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+            forward = direction == 'n'
+            queryset = queryset.filter(self._seek(values, forward))
+
+        rows = list(queryset.order_by(*self._order(forward))[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = self.encode_cursor(rows[-1], 'n')
+            if cursor and (has_more or forward):
+                previous_cursor = self.encode_cursor(rows[0], 'p')
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """ListView mixin adding an opt-in keyset pagination mode.
+
+    Keyset pagination is used when the request carries a ``cursor`` parameter, or for every
+    request when settings.CATALOG_CURSOR_PAGINATION is True; otherwise the view keeps the
+    usual ?page=N offset pagination.
+    """
+    cursor_ordering = None
+    cursor_kwarg = 'cursor'
+
+    def use_cursor_pagination(self):
+        return (self.cursor_kwarg in self.request.GET
+                or getattr(settings, 'CATALOG_CURSOR_PAGINATION', False))
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+def estimated_count(model, using='default'):
+    """The database's own estimate of a table's row count, or None if it has none.
+
+    Reads the planner statistics (pg_class.reltuples on PostgreSQL, sqlite_stat1 on SQLite
+    once ANALYZE has run), which costs nothing compared to a COUNT(*) over a large table.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # Each index's stat string starts with the number of rows in its table
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    # reltuples is -1 (or 0) before the table is first analyzed
+    return estimate if estimate > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """A Paginator that trusts the table statistics for the size of an unfiltered, large table.
+
+    Filtered querysets, and tables under estimate_threshold rows, are counted exactly.
+    Used by the admin changelists, where the count only sizes the page links.
+    """
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = estimated_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return super().count
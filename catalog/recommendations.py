@@ -0,0 +1,167 @@
+"""Precomputed "similar books": the books sharing the most genres and authors with each book.
+
+build() scores every pair of books that share a feature (a genre or the author) and keeps
+the top CATALOG_SIMILAR_BOOKS of each book in the SimilarBook table, so the book detail page
+reads them with one indexed query. Scores are the cosine (shared / sqrt(|a| * |b|)) or the
+Jaccard index (shared / |a ∪ b|) of the books' feature sets; ties go to the lower book id.
+Both implementations below do the same floating point operations on the same integers, so
+they give identical scores and therefore identical lists.
+
+With NumPy and SciPy installed the scores come from a sparse book×feature matrix product,
+a chunk of books at a time. They are optional: without them an inverted index of the
+features gives the same lists in pure Python, which is fine for a few thousand books.
+
+refresh(book_ids) recomputes only what changes to those books can affect: their own lists,
+the lists showing them, and the lists they now score high enough to enter. Rows are only
+rewritten for lists that changed. A deleted book leaves the lists showing it through the
+foreign key cascade and touches their books (see catalog/signals.py), so the next refresh
+of the books changed since then, or the next build(), fills the gap.
+"""
+from collections import Counter, defaultdict
+import heapq
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from catalog.cache import bump_versions
+from catalog.models import Book, SimilarBook
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+MEASURES = ('cosine', 'jaccard')
+# Books scored per sparse matrix product, bounding the size of the dense-ish result
+CHUNK_SIZE = 1000
+
+
+def load_features():
+    """{book id: set of features}, a feature being ('author', id) or ('genre', id)"""
+    features = {}
+    for pk, author_id in Book.objects.values_list('pk', 'author_id'):
+        features[pk] = {('author', author_id)} if author_id is not None else set()
+    for book_id, genre_id in Book.genre.through.objects.values_list('book_id', 'genre_id'):
+        features.setdefault(book_id, set()).add(('genre', genre_id))
+    return features
+
+
+def score(shared, size, other_size, measure='cosine'):
+    """Similarity of two feature sets of sizes size and other_size with shared features in common"""
+    if measure == 'jaccard':
+        return shared / (size + other_size - shared)
+    return shared / math.sqrt(size * other_size)
+
+
+def top_similar(features, book_ids, k, measure='cosine'):
+    """{book id: [(similar id, score), ...]} with the k best of each of book_ids, best first"""
+    if sparse is None:
+        return top_similar_python(features, book_ids, k, measure)
+    return top_similar_scipy(features, book_ids, k, measure)
+
+
+def top_similar_python(features, book_ids, k, measure='cosine'):
+    index = defaultdict(list)
+    for pk, book_features in features.items():
+        for feature in book_features:
+            index[feature].append(pk)
+    results = {}
+    for pk in book_ids:
+        own = features.get(pk, set())
+        shared = Counter(other for feature in own for other in index[feature])
+        shared.pop(pk, None)
+        best = heapq.nsmallest(k, ((-score(count, len(own), len(features[other]), measure), other)
+                                   for other, count in shared.items()))
+        results[pk] = [(other, -value) for value, other in best]
+    return results
+
+
+def top_similar_scipy(features, book_ids, k, measure='cosine'):
+    ids = np.array(sorted(features))
+    row_of = {pk: row for row, pk in enumerate(ids.tolist())}
+    column_of = {}
+    rows, columns = [], []
+    for pk, book_features in features.items():
+        for feature in book_features:
+            rows.append(row_of[pk])
+            columns.append(column_of.setdefault(feature, len(column_of)))
+    matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(ids), len(column_of)))
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    transposed = matrix.T.tocsc()
+
+    # Books without a row (deleted since) have no similar books
+    results = {pk: [] for pk in book_ids if pk not in row_of}
+    book_ids = [pk for pk in book_ids if pk in row_of]
+    for start in range(0, len(book_ids), CHUNK_SIZE):
+        chunk = book_ids[start:start + CHUNK_SIZE]
+        # shared[i, j] = features book chunk[i] has in common with book ids[j]
+        shared = (matrix[[row_of[pk] for pk in chunk]] @ transposed).tocsr()
+        for i, pk in enumerate(chunk):
+            others = shared.indices[shared.indptr[i]:shared.indptr[i + 1]]
+            counts = shared.data[shared.indptr[i]:shared.indptr[i + 1]]
+            keep = ids[others] != pk
+            others, counts = others[keep], counts[keep]
+            size, other_sizes = sizes[row_of[pk]], sizes[others]
+            if measure == 'jaccard':
+                values = counts / (size + other_sizes - counts)
+            else:
+                values = counts / np.sqrt(size * other_sizes)
+            best = np.lexsort((ids[others], -values))[:k]
+            results[pk] = [(int(ids[others[j]]), float(values[j])) for j in best]
+    return results
+
+
+def build(k=None, measure='cosine'):
+    """Recompute the similar books of every book; returns the number of lists that changed"""
+    features = load_features()
+    return store(top_similar(features, list(features), k or settings.CATALOG_SIMILAR_BOOKS, measure))
+
+
+def refresh(book_ids, k=None, measure='cosine'):
+    """Recompute the lists that changes to the genres or author of the books of book_ids can affect;
+    returns the number of lists that changed"""
+    k = k or settings.CATALOG_SIMILAR_BOOKS
+    features = load_features()
+    changed = set(book_ids)
+    # The lists showing a changed book, where it may have to drop or move
+    stale = changed | set(SimilarBook.objects.filter(similar__in=changed).values_list('book', flat=True))
+    # The lists a changed book may now enter: it scores at least their current last entry (the
+    # scores are symmetric, so its own scores say), or they have room left
+    scores = top_similar(features, [pk for pk in changed if pk in features], len(features), measure)
+    candidates = {}
+    for pk in scores:
+        for other, value in scores[pk]:
+            candidates[other] = max(value, candidates.get(other, value))
+    thresholds = dict(SimilarBook.objects.filter(book__in=candidates, rank=k).values_list('book', 'score'))
+    stale |= {other for other, value in candidates.items() if value >= thresholds.get(other, 0)}
+    return store(top_similar(features, [pk for pk in stale if pk in features], k, measure))
+
+
+def store(results):
+    """Save the lists of results ({book id: [(similar id, score), ...]}) that differ from the stored
+    ones; returns how many did"""
+    book_ids = list(results)
+    current = defaultdict(list)
+    for book_id, similar_id, value in (SimilarBook.objects.filter(book__in=book_ids)
+                                       .order_by('book', 'rank').values_list('book', 'similar', 'score')):
+        current[book_id].append((similar_id, value))
+    changed = [pk for pk in book_ids if current.get(pk, []) != results[pk]]
+    if not changed:
+        return 0
+    now = timezone.now()
+    with transaction.atomic():
+        SimilarBook.objects.filter(book__in=changed).delete()
+        SimilarBook.objects.bulk_create([
+            SimilarBook(book_id=pk, similar_id=similar_id, rank=rank, score=value, computed_at=now)
+            for pk in changed for rank, (similar_id, value) in enumerate(results[pk], 1)
+        ], batch_size=1000)
+    bump_versions(*[f'book:{pk}' for pk in changed])
+    return len(changed)
+
+
+def changed_since(since):
+    """Ids of the books with updated_at since since (which includes any change of genres or author)"""
+    return list(Book.objects.filter(updated_at__gte=since).values_list('pk', flat=True))
@@ -0,0 +1,174 @@
+"""Read-replica routing.
+
+Writes, and every read by default, go to the `default` (primary) database. The read-only
+catalog pages opt in to the replicas of settings.CATALOG_REPLICAS with ReplicaReadMixin or
+the replica_reads decorator, for their GET and HEAD requests. Even there the primary is used:
+
+- after the request wrote anything, and inside a transaction on the primary;
+- for a while after the visitor's last write (CATALOG_REPLICA_STICKY_SECONDS, tracked with
+  a cookie by ReplicaRoutingMiddleware), so people see their own changes despite replication lag;
+- when no replica passed its last health check (see healthy_replicas()).
+
+A request keeps to one replica, picked at random among the healthy ones, so its queries do
+not mix snapshots of replicas that lag by different amounts.
+
+What a request read from a replica in the sticky period after any write is not stored in the
+shared page and count caches (see catalog.cache.cacheable_read()): a lagging replica would
+otherwise put the old data under the versions the write just bumped.
+"""
+import contextlib
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'catalog_primary'
+
+
+class RoutingState:
+    """What the router may do in the current request"""
+
+    def __init__(self, sticky=False):
+        self.sticky = sticky
+        self.replica_reads = False
+        self.wrote = False
+        self.replica = None
+
+
+_state = contextvars.ContextVar('catalog_routing_state', default=None)
+
+
+class ReplicaRouter:
+    """Send reads to a replica when the current request allows it; see the module docstring"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads or state.sticky or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            replicas = healthy_replicas()
+            state.replica = random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.CATALOG_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def read_from_replica():
+    """Whether the current request has read from a replica"""
+    state = _state.get()
+    return state is not None and state.replica not in (None, DEFAULT_DB_ALIAS)
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def check_replica(alias):
+    """Whether alias answers a trivial query"""
+    connection = connections[alias]
+    for attempt in range(2):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except DatabaseError:
+            # Possibly a stale persistent connection: try once more on a new one
+            connection.close()
+    logger.warning('Replica %s failed its health check', alias)
+    return False
+
+
+def healthy_replicas():
+    """The replicas that passed their last health check, re-checked every CATALOG_REPLICA_CHECK_INTERVAL seconds"""
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.CATALOG_REPLICAS:
+        with _health_lock:
+            checked_at, ok = _health.get(alias, (None, False))
+            due = checked_at is None or now - checked_at >= settings.CATALOG_REPLICA_CHECK_INTERVAL
+            if due:
+                # Claim the check so concurrent requests keep using the previous result
+                _health[alias] = (now, ok)
+        if due:
+            ok = check_replica(alias)
+            with _health_lock:
+                _health[alias] = (now, ok)
+        if ok:
+            healthy.append(alias)
+    return healthy
+
+
+def reset_health():
+    """Forget the health check results (the next request checks every replica again)"""
+    with _health_lock:
+        _health.clear()
+
+
+@contextlib.contextmanager
+def reading_from_replica(request):
+    """Let the router send the reads of request's view to a replica, if it is a GET or HEAD"""
+    state = _state.get()
+    if state is None or request.method not in ('GET', 'HEAD'):
+        yield
+        return
+    previous, state.replica_reads = state.replica_reads, True
+    try:
+        yield
+    finally:
+        state.replica_reads = previous
+
+
+def replica_reads(view):
+    """Decorator for read-only function views that may be served from a replica"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reading_from_replica(request):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaReadMixin:
+    """Class-based view mixin for read-only views that may be served from a replica (list it first)"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with reading_from_replica(request):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaRoutingMiddleware:
+    """Track the routing state of each request and make a visitor who wrote stick to the primary for a while"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(sticky=STICKY_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=settings.CATALOG_REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
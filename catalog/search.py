@@ -0,0 +1,213 @@
+"""Full-text search over books, their authors and genres.
+
+PostgreSQL keeps a weighted tsvector per book in BookSearchDocument (GIN indexed) and ranks
+with ts_rank. SQLite keeps the same text in an FTS5 virtual table and ranks with bm25, so search
+also works in development and tests. Any other database falls back to icontains filtering.
+
+The index is kept current by the receivers in catalog/signals.py; rebuild it from scratch with
+`manage.py rebuild_search_index` (e.g. after bulk loads that bypass signals).
+"""
+import functools
+import re
+import sqlite3
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections, router
+from django.db.models import F, OuterRef, Q, Subquery, TextField
+
+from catalog.models import Author, Book, BookSearchDocument, Genre
+
+# FTS5 table used by the SQLite backend, created by migration 0008
+FTS_TABLE = 'catalog_book_fts'
+
+# Largest number of ids bound into one statement (SQLite's default variable limit is 999)
+CHUNK_SIZE = 500
+
+
+def search_terms(text):
+    """Split a user query into plain word tokens"""
+    return re.findall(r'\w+', text or '')
+
+
+def chunked(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+class PostgresSearchBackend:
+    """tsvector search over BookSearchDocument.document"""
+
+    def __init__(self, using):
+        self.using = using
+        self.config = getattr(settings, 'CATALOG_SEARCH_CONFIG', 'english')
+
+    def document(self):
+        """The weighted search vector expression for a Book row"""
+        # Imported here because django.contrib.postgres.aggregates needs psycopg2
+        from django.contrib.postgres.aggregates import StringAgg
+
+        genre_names = (Genre.objects.filter(book=OuterRef('pk')).order_by().values('book')
+                       .annotate(names=StringAgg('name', ' ', output_field=TextField())).values('names'))
+        return (SearchVector('title', 'isbn', weight='A', config=self.config)
+                + SearchVector('author__first_name', 'author__last_name', weight='B', config=self.config)
+                + SearchVector(Subquery(genre_names, output_field=TextField()), weight='C', config=self.config)
+                + SearchVector('summary', weight='D', config=self.config))
+
+    def index(self, book_ids=None):
+        """Recompute the documents of book_ids (every book if None)"""
+        books = Book.objects.using(self.using)
+        documents = BookSearchDocument.objects.using(self.using)
+        chunks = [None] if book_ids is None else chunked(book_ids)
+        for chunk in chunks:
+            selected = books if chunk is None else books.filter(pk__in=chunk)
+            documents.bulk_create([BookSearchDocument(book_id=pk) for pk in selected.values_list('pk', flat=True)],
+                                  batch_size=CHUNK_SIZE, ignore_conflicts=True)
+            vectors = books.filter(pk=OuterRef('book_id')).annotate(vector=self.document()).values('vector')
+            targets = documents if chunk is None else documents.filter(book_id__in=chunk)
+            targets.update(document=Subquery(vectors))
+
+    def remove(self, book_ids):
+        # Documents are deleted with their book by the ON DELETE CASCADE foreign key
+        pass
+
+    def matching_ids(self, text):
+        query = SearchQuery(' '.join(search_terms(text)), config=self.config)
+        return (BookSearchDocument.objects.using(self.using).filter(document=query)
+                .annotate(rank=SearchRank(F('document'), query))
+                .order_by('-rank', 'book_id').values_list('book_id', flat=True))
+
+    def count(self, text):
+        return self.matching_ids(text).count()
+
+    def ids(self, text, offset, limit):
+        return list(self.matching_ids(text)[offset:offset + limit])
+
+
+class SQLiteSearchBackend:
+    """FTS5 search over the catalog_book_fts virtual table"""
+
+    # bm25 column weights for title, isbn, authors, genres, summary
+    WEIGHTS = (10.0, 10.0, 5.0, 2.0, 1.0)
+
+    def __init__(self, using):
+        self.using = using
+
+    def index(self, book_ids=None):
+        """Recompute the FTS rows of book_ids (every book if None)"""
+        select = f'''
+            INSERT INTO {FTS_TABLE} (rowid, title, isbn, authors, genres, summary)
+            SELECT b.id, b.title, b.isbn, COALESCE(a.first_name, '') || ' ' || COALESCE(a.last_name, ''),
+                   (SELECT group_concat(g.name, ' ') FROM {Book.genre.through._meta.db_table} bg
+                    JOIN {Genre._meta.db_table} g ON g.id = bg.genre_id WHERE bg.book_id = b.id),
+                   b.summary
+            FROM {Book._meta.db_table} b LEFT JOIN {Author._meta.db_table} a ON a.id = b.author_id'''
+        with connections[self.using].cursor() as cursor:
+            if book_ids is None:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+                cursor.execute(select)
+                return
+            for chunk in chunked(book_ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+                cursor.execute(f'{select} WHERE b.id IN ({placeholders})', chunk)
+
+    def remove(self, book_ids):
+        with connections[self.using].cursor() as cursor:
+            for chunk in chunked(book_ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+    def match_expression(self, text):
+        """Quote each term (so FTS5 syntax in user input is inert) and prefix-match it"""
+        return ' '.join('"%s"*' % term.replace('"', '""') for term in search_terms(text))
+
+    def count(self, text):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                           [self.match_expression(text)])
+            return cursor.fetchone()[0]
+
+    def ids(self, text, offset, limit):
+        weights = ', '.join(str(weight) for weight in self.WEIGHTS)
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}), rowid LIMIT %s OFFSET %s',
+                [self.match_expression(text), limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class FallbackSearchBackend:
+    """Unranked icontains search for databases without a full-text engine"""
+
+    def __init__(self, using):
+        self.using = using
+
+    def index(self, book_ids=None):
+        pass
+
+    def remove(self, book_ids):
+        pass
+
+    def matching_ids(self, text):
+        books = Book.objects.using(self.using)
+        for term in search_terms(text):
+            books = books.filter(Q(title__icontains=term) | Q(summary__icontains=term) | Q(isbn__icontains=term)
+                                 | Q(author__first_name__icontains=term) | Q(author__last_name__icontains=term)
+                                 | Q(genre__name__icontains=term))
+        return books.order_by('title', 'id').values_list('id', flat=True).distinct()
+
+    def count(self, text):
+        return self.matching_ids(text).count()
+
+    def ids(self, text, offset, limit):
+        return list(self.matching_ids(text)[offset:offset + limit])
+
+
+@functools.lru_cache()
+def sqlite_has_fts5():
+    connection = sqlite3.connect(':memory:')
+    try:
+        return any(option == 'ENABLE_FTS5' for (option,) in connection.execute('PRAGMA compile_options'))
+    finally:
+        connection.close()
+
+
+def get_search_backend(using=None, write=False):
+    """Return the search backend for the database Book is read from (or written to)"""
+    if using is None:
+        using = router.db_for_write(Book) if write else router.db_for_read(Book)
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        return PostgresSearchBackend(using)
+    if vendor == 'sqlite' and sqlite_has_fts5():
+        return SQLiteSearchBackend(using)
+    return FallbackSearchBackend(using)
+
+
+class SearchResults:
+    """Lazy, ranked search results that a Paginator can count and slice into Book pages"""
+
+    def __init__(self, text, backend=None):
+        self.text = text
+        self.backend = backend or get_search_backend()
+
+    def count(self):
+        if not search_terms(self.text):
+            return 0
+        return self.backend.count(self.text)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if not search_terms(self.text) or stop is None or stop <= start:
+            return []
+        ids = self.backend.ids(self.text, start, stop - start)
+        books = Book.objects.select_related('author').in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
@@ -0,0 +1,261 @@
+from django.utils import timezone
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from catalog import ledger
+from catalog.cache import bump_versions, mark_deleted
+from catalog.counters import invalidate_catalog_counts, recount_availability
+from catalog.models import Author, Book, BookInstance, Genre, Language, SimilarBook
+from catalog.search import get_search_backend
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def refresh_catalog_counts(sender, **kwargs):
+    """Keep the home page counter cache in step with writes to the counted models"""
+    invalidate_catalog_counts()
+
+
+@receiver(post_save, sender=BookInstance)
+def move_availability_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """Recount the Book availability counters when a copy's book or status changes"""
+    if update_fields is not None and not {'book', 'book_id', 'status'} & set(update_fields):
+        return
+
+    old = None if created else getattr(instance, '_loaded_availability', None)
+    new = (instance.book_id, instance.status)
+    if old != new:
+        # Recounted rather than moved by one: the instance may have loaded a stale status
+        recount_availability({old[0] if old else None, instance.book_id})
+    instance._loaded_availability = new
+
+
+@receiver(post_save, sender=BookInstance)
+def record_loan_events(sender, instance, update_fields=None, **kwargs):
+    """Add a saved checkout, renewal or return to the loan ledger"""
+    if update_fields is not None and not ledger.LOAN_FIELDS & set(update_fields):
+        return
+    ledger.record([instance])
+
+
+@receiver(post_delete, sender=BookInstance)
+def drop_availability_on_delete(sender, instance, **kwargs):
+    """Remove a deleted copy from its Book availability counters"""
+    recount_availability({getattr(instance, '_loaded_availability', (None, None))[0], instance.book_id})
+
+
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, **kwargs):
+    """Refresh the search index entry of a created or edited book"""
+    get_search_backend(write=True).index([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    get_search_backend(write=True).remove([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def index_regenred_books(sender, instance, action, reverse, pk_set, **kwargs):
+    """Refresh books whose genres were added, removed or cleared (from either side of the relation)"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        book_ids = [instance.pk]
+    elif action == 'post_clear':
+        book_ids = instance._cleared_book_ids
+    else:
+        book_ids = pk_set
+    get_search_backend(write=True).index(book_ids)
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def remember_cleared_genre_books(sender, instance, action, reverse, **kwargs):
+    # pk_set is None on clear, so note which books the genre had before it is cleared
+    if reverse and action == 'pre_clear':
+        instance._cleared_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Genre)
+def remember_related_books(sender, instance, **kwargs):
+    # Deleting an author or genre rewrites its books without signals, so note them first
+    instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def index_renamed_books(sender, instance, created, **kwargs):
+    """Refresh the books of an edited author or genre, whose names are part of the index"""
+    if not created:
+        get_search_backend(write=True).index(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def index_orphaned_books(sender, instance, **kwargs):
+    get_search_backend(write=True).index(instance._search_book_ids)
+
+
+# Page and fragment cache versions (see catalog/cache.py)
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def bump_book_versions(sender, instance, **kwargs):
+    bump_versions(f'book:{instance.pk}', 'books')
+
+
+@receiver(pre_delete, sender=Book)
+def remember_listing_books(sender, instance, **kwargs):
+    # The SimilarBook rows showing the book are deleted by the cascade before post_delete
+    instance._listing_book_ids = list(SimilarBook.objects.filter(similar=instance).values_list('book', flat=True))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def refresh_listing_books(sender, instance, signal, **kwargs):
+    """The pages listing a book among their similar books show its title and link"""
+    if signal is post_save:
+        book_ids = list(SimilarBook.objects.filter(similar=instance).values_list('book', flat=True))
+    else:
+        book_ids = getattr(instance, '_listing_book_ids', [])
+        # A rename shows in their Last-Modified through the similar book's updated_at; a removal
+        # only through their own (which also has `build_similar_books --since` refill the lists)
+        touch_books(Book.objects.filter(pk__in=book_ids))
+    bump_versions(*[f'book:{pk}' for pk in book_ids])
+
+
+@receiver(pre_save, sender=BookInstance)
+def remember_previous_book(sender, instance, **kwargs):
+    # Noted before the post_save receivers run, since they update _loaded_availability
+    instance._previous_book_id = getattr(instance, '_loaded_availability', (None, None))[0]
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def bump_copy_versions(sender, instance, signal, **kwargs):
+    """A copy appears on its book's page, and on its previous book's page if it was moved"""
+    if signal is post_save:
+        previous_book_id = getattr(instance, '_previous_book_id', None)
+    else:
+        previous_book_id = getattr(instance, '_loaded_availability', (None, None))[0]
+    book_ids = {instance.book_id, previous_book_id}
+    bump_versions(*[f'book:{pk}' for pk in book_ids if pk is not None])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def bump_genre_link_versions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_versions(f'book:{instance.pk}')
+    elif pk_set:
+        bump_versions(*[f'book:{pk}' for pk in pk_set])
+    else:
+        bump_versions('genres')
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def bump_author_versions(sender, instance, **kwargs):
+    bump_versions(f'author:{instance.pk}', 'authors')
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def bump_genres_version(sender, **kwargs):
+    bump_versions('genres')
+
+
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def bump_languages_version(sender, **kwargs):
+    bump_versions('languages')
+
+
+# updated_at timestamps for conditional GETs (see catalog/cache.py)
+
+def touch_books(books):
+    """Mark books (a queryset) as changed without going through save()"""
+    books.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def touch_copy_book(sender, instance, signal, **kwargs):
+    if signal is post_save:
+        previous_book_id = getattr(instance, '_previous_book_id', None)
+    else:
+        previous_book_id = getattr(instance, '_loaded_availability', (None, None))[0]
+    book_ids = {pk for pk in (instance.book_id, previous_book_id) if pk is not None}
+    if book_ids:
+        touch_books(Book.objects.filter(pk__in=book_ids))
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def touch_regenred_books(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_books(Book.objects.filter(pk=instance.pk))
+    elif action == 'post_clear':
+        touch_books(Book.objects.filter(pk__in=instance._cleared_book_ids))
+    else:
+        touch_books(Book.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Genre)
+def touch_genre_books(sender, instance, created, **kwargs):
+    if not created:
+        touch_books(Book.objects.filter(genre=instance))
+
+
+@receiver(post_save, sender=Language)
+def touch_language_books(sender, instance, created, **kwargs):
+    if not created:
+        touch_books(Book.objects.filter(language=instance))
+
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Language)
+@receiver(pre_delete, sender=Author)
+def touch_orphaned_books(sender, instance, **kwargs):
+    """The books lose this genre, language or author without being saved"""
+    touch_books(instance.book_set.all())
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+def note_deletion(sender, instance, **kwargs):
+    # The list pages lose a row, which no remaining updated_at records
+    mark_deleted(sender._meta.model_name)
+
+
+@receiver(pre_save, sender=Book)
+def remember_previous_author(sender, instance, raw=False, **kwargs):
+    # The stored author, before the save changes it
+    instance._previous_author_id = None
+    if instance.pk is not None and not raw:
+        instance._previous_author_id = (Book.objects.filter(pk=instance.pk)
+                                        .values_list('author_id', flat=True).first())
+
+
+@receiver(post_save, sender=Book)
+def touch_previous_author(sender, instance, **kwargs):
+    # A book moved to another author leaves its previous author's page, which no updated_at there records
+    previous_author_id = getattr(instance, '_previous_author_id', None)
+    if previous_author_id is not None and previous_author_id != instance.author_id:
+        Author.objects.filter(pk=previous_author_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Book)
+def touch_deleted_book_author(sender, instance, **kwargs):
+    # The author's page (and the list pages) must change when one of their books goes away
+    if instance.author_id is not None:
+        Author.objects.filter(pk=instance.author_id).update(updated_at=timezone.now())
@@ -0,0 +1,181 @@
+"""Template loading for production, and an optional render profiler.
+
+The loaders below strip dead comments from the project's own templates before they are
+compiled: {% comment %} blocks and {# #} comments, and HTML comments such as the
+commented-out sidebar of base_generic.html, whose template tags would otherwise still run
+on every render. With the cached loader around them (settings.CATALOG_TEMPLATE_CACHE)
+that happens once per process, and warm_templates() does it at startup, before the first
+request (see locallibrary/wsgi.py).
+
+profile_renders() times every template and {% block %} rendered inside it; the
+`profile_templates` command uses it to report on the catalog pages.
+"""
+import contextlib
+import contextvars
+import os
+import re
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.template import Engine, Template, TemplateSyntaxError
+from django.template.loader_tags import BlockNode
+from django.template.loaders import app_directories, filesystem
+
+DJANGO_COMMENT = re.compile(r'{%\s*comment\b.*?%}.*?{%\s*endcomment\s*%}|{#.*?#}', re.S)
+# Not the conditional comments of old IE (<!--[if ...]> and <!--<![endif]-->)
+HTML_COMMENT = re.compile(r'<!--(?!\[|<!)(.*?)-->', re.S)
+BLOCK_TAG = re.compile(r'{%\s*block\b')
+
+
+def strip_comments(source, engine=None):
+    """Remove comments from template source.
+
+    An HTML comment that holds a {% block %} is kept (the block would still be rendered
+    into its parent), and so are all of them if the template no longer compiles without them.
+    """
+    source = DJANGO_COMMENT.sub('', source)
+    stripped = HTML_COMMENT.sub(lambda match: match.group(0) if BLOCK_TAG.search(match.group(1)) else '', source)
+    if stripped == source:
+        return source
+    try:
+        Template(stripped, engine=engine)
+    except TemplateSyntaxError:
+        return source
+    return stripped
+
+
+def is_inside(path, directory):
+    return os.path.abspath(path).startswith(os.path.join(os.path.abspath(directory), ''))
+
+
+def project_template_dirs(engine):
+    """The directories of this project's templates: the DIRS of TEMPLATES, and the templates/
+    directory of each installed app that is part of the project.
+
+    An app counts as part of the project if it lives under BASE_DIR, but not in an installed
+    package: a virtualenv inside the project (or Heroku's /app/.heroku/python, with BASE_DIR
+    /app) puts Django's own apps under BASE_DIR too, in a site-packages directory.
+    """
+    dirs = list(engine.dirs)
+    for app_config in apps.get_app_configs():
+        path = os.path.abspath(app_config.path)
+        packaged = {'site-packages', 'dist-packages'} & set(path.split(os.sep))
+        if is_inside(path, settings.BASE_DIR) and not packaged:
+            dirs.append(os.path.join(path, 'templates'))
+    return dirs
+
+
+def is_project_template(origin, engine):
+    """Whether origin is one of this project's templates (rather than Django's or a package's)"""
+    return any(is_inside(origin.name, directory) for directory in project_template_dirs(engine))
+
+
+class StripCommentsMixin:
+    def get_contents(self, origin):
+        contents = super().get_contents(origin)
+        if not is_project_template(origin, self.engine):
+            return contents
+        return strip_comments(contents, self.engine)
+
+
+class FilesystemLoader(StripCommentsMixin, filesystem.Loader):
+    """Loads templates from the DIRS of TEMPLATES, without their comments"""
+
+
+class AppDirectoriesLoader(StripCommentsMixin, app_directories.Loader):
+    """Loads templates from the templates/ directory of each app, without their comments"""
+
+
+def template_names():
+    """The names of the HTML templates of the catalog app and of the project's DIRS"""
+    engine = Engine.get_default()
+    directories = list(engine.dirs) + [os.path.join(os.path.dirname(__file__), 'templates')]
+    names = set()
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith('.html'):
+                    names.add(os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def warm_templates():
+    """Compile every template of template_names() into the cached loader; returns how many were loaded"""
+    engine = Engine.get_default()
+    names = template_names()
+    for name in names:
+        engine.get_template(name)
+    return len(names)
+
+
+class RenderProfile:
+    """Render counts and inclusive times, per template and per {% block %}"""
+
+    def __init__(self):
+        self.templates = {}
+        self.blocks = {}
+        self.stack = []
+
+    def add(self, timings, name, seconds):
+        count, total = timings.get(name, (0, 0.0))
+        timings[name] = (count + 1, total + seconds)
+
+    def rows(self):
+        """(kind, name, renders, total ms) rows, slowest first"""
+        rows = [('template', name, count, total * 1000) for name, (count, total) in self.templates.items()]
+        rows += [('block', name, count, total * 1000) for name, (count, total) in self.blocks.items()]
+        return sorted(rows, key=lambda row: -row[3])
+
+
+_profile = contextvars.ContextVar('catalog_render_profile', default=None)
+_installed = False
+
+
+def _install():
+    """Wrap Template._render and BlockNode.render; the wrappers only time anything inside profile_renders()"""
+    global _installed
+    if _installed:
+        return
+    template_render, block_render = Template._render, BlockNode.render
+
+    def timed_template_render(self, context):
+        profile = _profile.get()
+        if profile is None:
+            return template_render(self, context)
+        name = self.name or '<string>'
+        profile.stack.append(name)
+        start = time.perf_counter()
+        try:
+            return template_render(self, context)
+        finally:
+            profile.add(profile.templates, name, time.perf_counter() - start)
+            profile.stack.pop()
+
+    def timed_block_render(self, context):
+        profile = _profile.get()
+        if profile is None:
+            return block_render(self, context)
+        start = time.perf_counter()
+        try:
+            return block_render(self, context)
+        finally:
+            # Blocks are reported under the page's own template, which is where they are overridden
+            page = profile.stack[0] if profile.stack else '<string>'
+            profile.add(profile.blocks, f'{page} {{% block {self.name} %}}', time.perf_counter() - start)
+
+    Template._render = timed_template_render
+    BlockNode.render = timed_block_render
+    _installed = True
+
+
+@contextlib.contextmanager
+def profile_renders():
+    """Collect a RenderProfile of the templates rendered in this block"""
+    _install()
+    profile = RenderProfile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
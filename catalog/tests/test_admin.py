@@ -0,0 +1,110 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import datetime
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.pagination import EstimatedCountPaginator, estimated_count
+
+
+class AdminPerformanceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_superuser(username='librarian', password='1X<ISRUkw+tuK', email='')
+        cls.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG')
+        for _ in range(3):
+            BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o', borrower=cls.librarian,
+                                        due_back=datetime.date.today())
+        User.objects.bulk_create([User(username=f'user{n}') for n in range(50)])
+
+    def setUp(self):
+        self.client.force_login(self.librarian)
+
+    def test_change_form_does_not_list_every_user(self):
+        copy = BookInstance.objects.first()
+        response = self.client.get(reverse('admin:catalog_bookinstance_change', args=[copy.pk]))
+        self.assertNotContains(response, 'user49')
+        self.assertContains(response, 'admin-autocomplete')
+
+    def test_estimated_count(self):
+        queryset = BookInstance.objects.order_by('pk')
+        self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 3)
+
+        if connection.vendor != 'sqlite':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_count(BookInstance), 3)
+
+        class SmallThreshold(EstimatedCountPaginator):
+            estimate_threshold = 1
+        BookInstance.objects.create(book=self.book, imprint='Imprint')
+        # Unfiltered: the stale statistics are trusted; filtered: counted exactly
+        self.assertEqual(SmallThreshold(queryset, 10).count, 3)
+        self.assertEqual(SmallThreshold(queryset.filter(status='m'), 10).count, 1)
+
+
+class PaginatedInlineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_superuser(username='librarian', password='1X<ISRUkw+tuK', email='')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.language = Language.objects.create(name='English')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                       author=cls.author, language=cls.language)
+        cls.book.genre.set([cls.genre])
+        cls.copies = [BookInstance.objects.create(book=cls.book, imprint=f'Imprint {n}', status='a')
+                      for n in range(45)]
+        BookInstance.objects.filter(pk=cls.copies[0].pk).update(status='o')
+
+    def setUp(self):
+        self.client.force_login(self.librarian)
+        self.url = reverse('admin:catalog_book_change', args=[self.book.pk])
+
+    def test_pages_and_summary(self):
+        response = self.client.get(self.url)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(len(formset.forms), 20)
+        self.assertContains(response, '1&ndash;20 of 45 book instances')
+        self.assertContains(response, '45 available, 0 on loan')
+
+        response = self.client.get(self.url + '?bookinstance_set-page=3')
+        self.assertEqual(len(response.context['inline_admin_formsets'][0].formset.forms), 5)
+        self.assertContains(response, '41&ndash;45 of 45')
+
+    def test_query_count_is_bounded_by_the_page(self):
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(self.url)
+        for n in range(30):
+            BookInstance.objects.create(book=self.book, imprint='More', status='a')
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(self.url)
+        self.assertEqual(len(before), len(after))
+
+    def test_saving_a_page_edits_only_its_rows(self):
+        response = self.client.get(self.url + '?bookinstance_set-page=2')
+        formset = response.context['inline_admin_formsets'][0].formset
+        data = {
+            'title': 'Book Title', 'summary': 'My book summary', 'isbn': 'ABCDEFG',
+            'author': self.author.pk, 'language': self.language.pk, 'genre': [self.genre.pk],
+            'bookinstance_set-TOTAL_FORMS': len(formset.forms),
+            'bookinstance_set-INITIAL_FORMS': len(formset.forms),
+            'bookinstance_set-MIN_NUM_FORMS': 0,
+            'bookinstance_set-MAX_NUM_FORMS': 1000,
+        }
+        for i, form in enumerate(formset.forms):
+            copy = form.instance
+            data.update({f'bookinstance_set-{i}-{name}': value for name, value in (
+                ('id', copy.pk), ('book', self.book.pk), ('imprint', copy.imprint), ('status', copy.status),
+                ('due_back', ''), ('borrower', ''))})
+        data['bookinstance_set-0-imprint'] = 'Edited'
+        # A copy added after the page was shown must not shift the rows being saved
+        BookInstance.objects.create(book=self.book, imprint='Added meanwhile', status='m')
+
+        response = self.client.post(self.url + '?bookinstance_set-page=2', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(BookInstance.objects.get(pk=formset.forms[0].instance.pk).imprint, 'Edited')
+        self.assertEqual(BookInstance.objects.filter(book=self.book).count(), 46)
@@ -0,0 +1,77 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import Permission, User
+import datetime
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class CatalogApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+        cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        english = Language.objects.create(name='English')
+        fantasy = Genre.objects.create(name='Fantasy')
+        cls.books = []
+        for number in range(5):
+            book = Book.objects.create(title=f'Book {number}', summary='Summary', isbn=f'978000000000{number}',
+                                       author=cls.author, language=english)
+            book.genre.set([fantasy])
+            cls.books.append(book)
+        cls.loan = BookInstance.objects.create(book=cls.books[0], imprint='Imprint', status='o',
+                                               borrower=cls.reader, due_back=datetime.date(2020, 6, 1))
+        BookInstance.objects.create(book=cls.books[1], imprint='Imprint', status='o',
+                                    borrower=cls.librarian, due_back=datetime.date(2020, 6, 2))
+
+    def get(self, resource, **params):
+        return self.client.get(reverse('api-list', args=[resource]), params)
+
+    def test_sparse_fields(self):
+        data = self.get('books', fields='title,author.last_name').json()['data']
+        self.assertEqual(data[0], {'id': self.books[0].pk, 'title': 'Book 0',
+                                   'author': {'id': self.author.pk, 'last_name': 'Le Guin'}})
+
+    def test_one_query_per_relation_whatever_the_depth(self):
+        with self.assertNumQueries(3):
+            shallow = self.get('books', include='author,genres', page_size=5).json()['data']
+        self.assertEqual(shallow[4]['genres'], [{'id': shallow[4]['genres'][0]['id'], 'name': 'Fantasy'}])
+
+        with self.assertNumQueries(4):
+            deep = self.get('authors', include='books.copies.book').json()['data']
+        copies = deep[0]['books'][0]['copies']
+        self.assertEqual(copies[0]['book']['title'], 'Book 0')
+        self.assertEqual(len(deep[0]['books']), 5)
+
+    def test_cursor_pagination(self):
+        response = self.get('books', fields='title', page_size=2).json()
+        titles = [book['title'] for book in response['data']]
+        while response['next']:
+            response = self.client.get(response['next']).json()
+            titles += [book['title'] for book in response['data']]
+        self.assertEqual(titles, [f'Book {number}' for number in range(5)])
+
+    def test_detail(self):
+        response = self.client.get(reverse('api-detail', args=['copies', self.loan.pk]), {'include': 'book'})
+        self.assertEqual(response.json()['data']['book']['language'], 'English')
+        self.assertNotIn('borrower', response.json()['data'])
+        self.assertEqual(self.client.get(reverse('api-detail', args=['books', 999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api-detail', args=['copies', 'abc'])).status_code, 404)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get('books', fields='title,nope').status_code, 400)
+        self.assertEqual(self.get('books', include='borrower').status_code, 400)
+        self.assertEqual(self.get('books', cursor='garbage').status_code, 400)
+
+    def test_loans_are_private(self):
+        self.assertEqual(self.get('loans').status_code, 403)
+
+        self.client.force_login(self.reader)
+        loans = self.get('loans', fields='borrower').json()['data']
+        self.assertEqual(loans, [{'id': str(self.loan.pk), 'borrower': 'reader'}])
+
+        self.client.force_login(self.librarian)
+        self.assertEqual(len(self.get('loans').json()['data']), 2)
@@ -0,0 +1,100 @@
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.urls import get_resolver
+from unittest import mock
+import datetime
+import io
+
+from catalog.benchmarks import (CatalogGenerator, Scenario, compare_reports, default_scenarios, load_test,
+                                run_benchmarks)
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class CatalogGeneratorTest(TestCase):
+    def generate(self):
+        CatalogGenerator(200, seed=7, batch_size=64, today=datetime.date(2020, 6, 1)).run()
+        return list(BookInstance.objects.order_by('id').values_list('id', 'book__isbn', 'status', 'due_back'))
+
+    def test_same_seed_same_catalog(self):
+        first = self.generate()
+        self.assertEqual(len(first), 200)
+        self.assertEqual(Book.objects.count(), 20)
+
+        for model in (BookInstance, Book, Author, Genre, Language, User):
+            model.objects.all().delete()
+        self.assertEqual(self.generate(), first)
+
+    def test_second_run_keeps_users(self):
+        first = self.generate()
+        # As with a reused database: the catalog is cleared, the users are left behind
+        for model in (BookInstance, Book, Author, Genre, Language):
+            model.objects.all().delete()
+        self.assertEqual(self.generate(), first)
+        self.assertEqual(User.objects.filter(is_superuser=True).count(), 1)
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_counters_are_rebuilt(self):
+        self.generate()
+        book = Book.objects.order_by('-copies_available').first()
+        self.assertEqual(book.copies_available, book.bookinstance_set.filter(status='a').count())
+
+
+class BenchmarkRunTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        CatalogGenerator(100, seed=1).run()
+
+    def test_scenarios_cover_every_catalog_url(self):
+        catalog_names = {pattern.name for pattern in get_resolver('catalog.urls').url_patterns}
+        self.assertEqual(catalog_names - {scenario.url_name for scenario in default_scenarios()}, set())
+
+    def test_report(self):
+        scenarios = [scenario for scenario in default_scenarios()
+                     if scenario.name in ('book-detail', 'all-borrowed', 'admin-bookinstance-changelist')]
+        report = run_benchmarks(scenarios, repeat=3, warmup=1)
+        self.assertEqual(report['meta']['rows']['bookinstance'], 100)
+        for result in report['scenarios'].values():
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_compare_reports(self):
+        baseline = run_benchmarks([Scenario('index', '/catalog/')], repeat=1, warmup=0)
+        current = {'meta': baseline['meta'], 'scenarios': {'index': dict(baseline['scenarios']['index'])}}
+        self.assertEqual(compare_reports(baseline, current), [])
+
+        current['scenarios']['index']['queries'] += 1
+        current['scenarios']['index']['p95_ms'] = baseline['scenarios']['index']['p95_ms'] * 2 + 5
+        self.assertEqual(len(compare_reports(baseline, current)), 2)
+
+
+class LoadTest(LiveServerTestCase):
+    def test_load_test(self):
+        CatalogGenerator(20, seed=1).run()
+        result = load_test(self.live_server_url, ['/catalog/', '/catalog/books/', '/catalog/nowhere/'],
+                           concurrency=2, duration=0.5, workers=2)
+        self.assertGreater(result['requests'], 0)
+        self.assertEqual(list(result['errors']), [404])
+        self.assertAlmostEqual(result['requests_per_second_per_worker'], result['requests_per_second'] / 2, delta=0.1)
+
+
+class LoanIndexBenchmarkTest(TransactionTestCase):
+    def index_names(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, BookInstance._meta.db_table)
+        return {index.name for index in BookInstance._meta.indexes} & set(constraints)
+
+    def test_indexes_survive_a_failed_run(self):
+        out = io.StringIO()
+        call_command('benchmark_loan_indexes', '--copies', '50', '--books', '5', '--borrowers', '3',
+                     '--repeat', '1', stdout=out)
+        self.assertIn('without indexes', out.getvalue())
+        self.assertEqual(len(self.index_names()), 3)
+
+        with mock.patch('catalog.management.commands.benchmark_loan_indexes.Command.measure',
+                        side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('benchmark_loan_indexes', '--no-seed', stdout=io.StringIO())
+        self.assertEqual(len(self.index_names()), 3)
@@ -0,0 +1,143 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        author=self.author)
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def test_repeat_anonymous_request_is_served_from_cache(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        first = self.client.get(url)
+        # Only the Last-Modified lookup
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+
+    def test_copy_change_invalidates_book_page(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.assertContains(self.client.get(url), 'Available')
+        self.copy.status = 'o'
+        self.copy.save()
+        self.assertContains(self.client.get(url), 'On Loan')
+
+    def test_related_changes_invalidate_pages(self):
+        book_url = reverse('book-detail', args=[self.book.pk])
+        author_url = reverse('author-detail', args=[self.author.pk])
+        self.client.get(book_url)
+        self.client.get(author_url)
+        self.client.get(reverse('books'))
+
+        self.author.last_name = 'Jones'
+        self.author.save()
+        self.assertContains(self.client.get(book_url), 'Jones')
+        self.assertContains(self.client.get(reverse('books')), 'Jones')
+
+        genre = Genre.objects.create(name='Fantasy')
+        self.book.genre.add(genre)
+        self.assertContains(self.client.get(book_url), 'Fantasy')
+        genre.name = 'Science Fiction'
+        genre.save()
+        self.assertContains(self.client.get(book_url), 'Science Fiction')
+
+        self.book.language = Language.objects.create(name='Yoruba')
+        self.book.title = 'Renamed Title'
+        self.book.save()
+        self.assertContains(self.client.get(book_url), 'Yoruba')
+        self.assertContains(self.client.get(author_url), 'Renamed Title')
+
+    def test_signed_in_users_are_not_served_cached_pages(self):
+        url = reverse('books')
+        self.client.get(url)
+        self.client.force_login(User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK'))
+        self.assertContains(self.client.get(url), 'My Borrowed')
+
+    def test_copies_fragment_cached_for_signed_in_users(self):
+        self.client.force_login(User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK'))
+        url = reverse('book-detail', args=[self.book.pk])
+        self.client.get(url)
+        with self.assertNumQueries(6):
+            # Session, user, Last-Modified, the book, its genres and similar books; the copies come from
+            # the fragment cache
+            self.client.get(url)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        author=self.author)
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def test_matching_etag_is_304_after_one_query(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        url = reverse('author-detail', args=[self.author.pk])
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_copy_change_changes_book_etag(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        etag = self.client.get(url)['ETag']
+        updated_at = Book.objects.get(pk=self.book.pk).updated_at
+
+        self.copy.status = 'o'
+        self.copy.save()
+        self.assertGreater(Book.objects.get(pk=self.book.pk).updated_at, updated_at)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_deleting_book_changes_list_and_author_etags(self):
+        other = Book.objects.create(title='Other Title', summary='', isbn='ABCDEFH', author=self.author)
+        urls = [reverse('books'), reverse('authors'), reverse('author-detail', args=[self.author.pk])]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        other.delete()
+        for url, etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200, url)
+
+    def test_deleting_author_without_books_changes_list_etag(self):
+        authors = [Author.objects.create(first_name='Jane', last_name=f'Doe {n}') for n in range(3)]
+        url = reverse('authors')
+        etag = self.client.get(url)['ETag']
+        # Neither MAX(updated_at) moves: the author is not the newest and has no books
+        authors[0].delete()
+        # As seen from another process, whose cache holds nothing of the delete
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_moving_a_book_changes_previous_author_etag(self):
+        authors = [Author.objects.create(first_name='Jane', last_name=f'Doe {n}') for n in range(2)]
+        book = Book.objects.create(title='Moving', summary='', isbn='9780000000009', author=authors[0])
+        # The newest row of the page, before and after the other book leaves
+        Book.objects.create(title='Staying', summary='', isbn='9780000000010', author=authors[0])
+        url = reverse('author-detail', args=[authors[0].pk])
+        etag = self.client.get(url)['ETag']
+
+        book.author = authors[1]
+        book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Moving')
+
+    def test_etag_differs_per_user(self):
+        url = reverse('books')
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
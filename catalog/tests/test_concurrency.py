@@ -0,0 +1,60 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from django.db import connection
+import threading
+
+from catalog.concurrency import gather
+from catalog.counters import compute_catalog_counts
+from catalog.metrics import RequestMetrics, _current
+from catalog.models import Author, Book, Genre
+
+
+def thread_name():
+    return threading.current_thread().name
+
+
+class GatherInTransactionTest(TestCase):
+    def test_runs_in_order_on_the_callers_connection(self):
+        # Other connections could not see this test's uncommitted rows
+        self.assertTrue(connection.in_atomic_block)
+        self.assertEqual(gather(thread_name, thread_name), [thread_name()] * 2)
+
+
+class GatherTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.genre = Genre.objects.create(name='Fantasy')
+        self.book = Book.objects.create(title='The Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        author=self.author)
+        self.book.genre.set([self.genre])
+
+    def test_runs_in_pool_threads(self):
+        names = gather(thread_name, thread_name, thread_name)
+        self.assertEqual(names[0], thread_name())
+        self.assertTrue(all(name.startswith('catalog-query') for name in names[1:]))
+
+    @override_settings(CATALOG_QUERY_THREADS=0)
+    def test_can_be_turned_off(self):
+        self.assertEqual(gather(thread_name, thread_name), [thread_name()] * 2)
+
+    def test_pool_queries_counted_in_request_metrics(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics.execute):
+                counts = compute_catalog_counts()
+        finally:
+            _current.reset(token)
+        self.assertEqual(counts['num_books'], 1)
+        self.assertEqual(counts['num_genre'], 1)
+        self.assertEqual(metrics.queries, 4)
+
+    def test_detail_pages(self):
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertContains(response, 'Fantasy')
+        self.assertEqual(response.context['book'].author, self.author)
+        response = self.client.get(reverse('author-detail', args=[self.author.pk]))
+        self.assertContains(response, 'The Book Title')
+        self.assertEqual(self.client.get(reverse('book-detail', args=[self.book.pk + 1])).status_code, 404)
@@ -0,0 +1,62 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.management import call_command
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+
+from catalog.models import Author, Book, BookInstance
+from catalog.exports import export
+
+
+class CatalogExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_superuser(username='librarian', password='1X<ISRUkw+tuK', email='')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Book, "Title"', summary='My book summary', isbn='ABCDEFG', author=author)
+        cls.copy = BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='o',
+                                               borrower=cls.librarian, due_back=datetime.date(2020, 6, 1))
+
+    def test_csv_export(self):
+        rows = list(csv.reader(io.StringIO(''.join(export('copies', 'csv')))))
+        self.assertEqual(rows[0][:3], ['id', 'book_id', 'title'])
+        self.assertEqual(rows[1][2], 'Book, "Title"')
+        self.assertEqual(rows[1][6:], ['2020-06-01', str(self.librarian.pk), 'librarian'])
+
+    def test_json_export(self):
+        books = json.loads(''.join(export('books', 'json')))
+        self.assertEqual(books[0]['author_last_name'], 'Smith')
+        self.assertEqual(books[0]['copies_on_loan'], 1)
+        self.assertEqual(json.loads(''.join(export('authors', 'json', chunk_size=1)))[0]['first_name'], 'John')
+
+        Author.objects.all().delete()
+        self.assertEqual(json.loads(''.join(export('authors', 'json'))), [])
+
+    def test_gzip_export(self):
+        data = gzip.decompress(b''.join(export('copies', 'jsonl', compress=True)))
+        self.assertEqual(json.loads(data.decode().splitlines()[0])['id'], str(self.copy.pk))
+
+    def test_view_streams(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('export-catalog-gzip', kwargs={'dataset': 'books', 'format': 'csv'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="books.csv.gz"')
+        self.assertIn(b'Smith', gzip.decompress(b''.join(response.streaming_content)))
+
+    def test_view_requires_permission(self):
+        response = self.client.get('/catalog/export/copies.csv')
+        self.assertEqual(response.status_code, 302)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'authors.csv.gz')
+            call_command('export_catalog', 'authors', output=path, gzip=True)
+            with gzip.open(path, 'rt') as handle:
+                self.assertEqual(list(csv.reader(handle))[1][1:3], ['Smith', 'John'])
@@ -0,0 +1,170 @@
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+import datetime
+import io
+
+from catalog import holds, loans
+from catalog.models import Book, BookInstance, Hold
+
+
+class HoldQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patrons = [User.objects.create_user(username=f'patron{n}', password='1X<ISRUkw+tuK') for n in range(4)]
+        cls.book = Book.objects.create(title='Popular Book', summary='Summary', isbn='9780000000001')
+        cls.copies = [BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o', borrower=cls.patrons[3],
+                                                  due_back=datetime.date.today()) for n in range(2)]
+
+    def place(self, *patrons):
+        return [holds.place_hold(self.book, patron) for patron in patrons]
+
+    def positions(self):
+        return {hold.patron.username: hold.position
+                for hold in Hold.objects.active().filter(book=self.book).select_related('patron').with_positions()}
+
+    def test_first_come_first_served(self):
+        self.place(*self.patrons[:3])
+        self.assertEqual(self.positions(), {'patron0': 1, 'patron1': 2, 'patron2': 3})
+
+        result = loans.return_copies([self.copies[0].pk])
+        self.assertEqual(result.copies[0].status, 'r')
+        first = Hold.objects.get(patron=self.patrons[0])
+        self.assertEqual((first.status, first.copy_id), (Hold.READY, self.copies[0].pk))
+        copy = BookInstance.objects.get(pk=self.copies[0].pk)
+        self.assertEqual((copy.status, copy.borrower), ('r', self.patrons[0]))
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_reserved, 1)
+        self.assertEqual(self.positions(), {'patron0': None, 'patron1': 1, 'patron2': 2})
+
+    def test_copies_returned_together_go_to_different_patrons(self):
+        self.place(*self.patrons[:3])
+        loans.return_copies([copy.pk for copy in self.copies])
+        ready = Hold.objects.filter(status=Hold.READY)
+        self.assertEqual(sorted(ready.values_list('patron__username', flat=True)), ['patron0', 'patron1'])
+        self.assertEqual(len(set(ready.values_list('copy', flat=True))), 2)
+
+    def test_cancel_closes_the_gap(self):
+        waiting = self.place(*self.patrons[:3])
+        holds.cancel_hold(waiting[1])
+        self.assertEqual(self.positions(), {'patron0': 1, 'patron2': 2})
+        # A new hold joins at the back
+        self.place(self.patrons[1])
+        self.assertEqual(self.positions(), {'patron0': 1, 'patron2': 2, 'patron1': 3})
+
+    def test_cancelled_ready_hold_passes_the_copy_on(self):
+        first, second = self.place(*self.patrons[:2])
+        loans.return_copies([self.copies[0].pk])
+        holds.cancel_hold(first)
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.copy_id), (Hold.READY, self.copies[0].pk))
+        self.assertEqual(BookInstance.objects.get(pk=self.copies[0].pk).borrower, self.patrons[1])
+
+    def test_one_active_hold_per_patron(self):
+        self.place(self.patrons[0])
+        with self.assertRaises(ValidationError):
+            self.place(self.patrons[0])
+
+    def test_copy_on_the_shelf_is_set_aside_at_once(self):
+        loans.return_copies([self.copies[0].pk])
+        hold, = self.place(self.patrons[0])
+        self.assertEqual((hold.status, hold.copy_id), (Hold.READY, self.copies[0].pk))
+
+    def test_reserved_copy_only_lent_to_its_patron(self):
+        hold, = self.place(self.patrons[0])
+        loans.return_copies([self.copies[0].pk])
+
+        result = loans.checkout([self.copies[0].pk], self.patrons[1])
+        self.assertEqual(result.skipped, {self.copies[0].pk: 'Copy is reserved for another patron'})
+        self.assertIsNone(loans.lend_copy(self.copies[0].pk, self.patrons[1]))
+
+        result = loans.checkout([self.copies[0].pk], self.patrons[0])
+        self.assertEqual(len(result.copies), 1)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, Hold.FULFILLED)
+
+    def test_uncollected_copies_expire(self):
+        first, second = self.place(*self.patrons[:2])
+        loans.return_copies([self.copies[0].pk])
+        # Still collectable on the pickup_by day itself
+        self.assertEqual(holds.expire_holds(datetime.date.today() + holds.HOLD_PICKUP_PERIOD), 0)
+        self.assertEqual(holds.expire_holds(datetime.date.today() + holds.HOLD_PICKUP_PERIOD
+                                            + datetime.timedelta(days=1)), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), (Hold.EXPIRED, Hold.READY))
+
+    def test_admin_returns_are_served_by_the_command(self):
+        hold, = self.place(self.patrons[0])
+        copy = BookInstance.objects.get(pk=self.copies[0].pk)
+        copy.status = 'a'
+        copy.save()
+        out = io.StringIO()
+        call_command('process_holds', stdout=out)
+        self.assertIn('1 copies set aside', out.getvalue())
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, Hold.READY)
+
+    def test_position_lookup_does_not_scan_the_queue(self):
+        for n in range(40):
+            patron = User.objects.create_user(username=f'reader{n}')
+            holds.place_hold(self.book, patron)
+        last = Hold.objects.get(patron__username='reader39')
+        with self.assertNumQueries(1):
+            self.assertEqual(last.position, 40)
+        with self.assertNumQueries(1):
+            self.assertEqual([hold.position for hold in Hold.objects.with_positions().filter(book=self.book)],
+                             list(range(1, 41)))
+
+
+class BookHoldViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patron = User.objects.create_user(username='patron', password='1X<ISRUkw+tuK')
+        cls.book = Book.objects.create(title='Popular Book', summary='Summary', isbn='9780000000001')
+
+    def test_redirect_if_not_logged_in(self):
+        response = self.client.get(reverse('book-hold', args=[self.book.pk]))
+        self.assertRedirects(response, f"/accounts/login/?next={reverse('book-hold', args=[self.book.pk])}")
+
+    def test_place_and_cancel(self):
+        self.client.force_login(self.patron)
+        url = reverse('book-hold', args=[self.book.pk])
+        self.assertContains(self.client.get(url), 'Place a hold')
+
+        self.assertRedirects(self.client.post(url, {'action': 'place'}), reverse('my-borrowed'))
+        self.assertContains(self.client.get(reverse('my-borrowed')), 'number 1 in the queue')
+        self.assertContains(self.client.get(url), 'You are number 1 in the queue')
+        self.assertContains(self.client.post(url, {'action': 'place'}), 'You already have a hold on this book.')
+
+        self.client.post(url, {'action': 'cancel'})
+        self.assertEqual(Hold.objects.get().status, Hold.CANCELLED)
+
+
+class UnassignedReservationMigrationTest(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('catalog', target)])
+        return executor.loader.project_state(('catalog', target)).apps
+
+    def test_unassigned_reserved_copies_are_released(self):
+        apps = self.migrate('0017_catalog_deletions')
+        try:
+            patron = apps.get_model('auth', 'User').objects.create(username='patron')
+            book = apps.get_model('catalog', 'Book').objects.create(title='Old Book', summary='Summary',
+                                                                    isbn='9780000000001')
+            copies = apps.get_model('catalog', 'BookInstance').objects
+            unassigned = copies.create(book=book, imprint='Imprint', status='r')
+            copies.create(book=book, imprint='Imprint', status='r', borrower=patron)
+            self.migrate('0018_release_unassigned_reservations')
+        finally:
+            self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('catalog')[0][1])
+
+        book = Book.objects.get(pk=book.pk)
+        self.assertEqual((book.copies_available, book.copies_reserved), (1, 1))
+        result = loans.checkout([unassigned.pk], User.objects.create_user(username='borrower'))
+        self.assertEqual([copy.pk for copy in result.copies], [unassigned.pk])
@@ -0,0 +1,125 @@
+from django.test import TestCase
+from django.core.management import call_command
+from django.utils import timezone
+from io import StringIO, BytesIO
+import datetime
+import json
+import os
+import tempfile
+
+from catalog.cache import get_version
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.imports import CatalogImporter, read_csv, read_jsonl, read_marc
+from catalog.search import SearchResults
+
+
+def marc_record(fields, leader_encoding='a'):
+    """Build an ISO 2709 record from [(tag, data)] where data is a str (control field) or [(code, value)]"""
+    directory, body = b'', b''
+    for tag, data in fields:
+        if isinstance(data, str):
+            raw = data.encode('utf-8')
+        else:
+            raw = b'  ' + b''.join(b'\x1f' + code.encode() + value.encode('utf-8') for code, value in data)
+        raw += b'\x1e'
+        directory += tag.encode() + b'%04d%05d' % (len(raw), len(body))
+        body += raw
+    base_address = 24 + len(directory) + 1
+    length = base_address + len(body) + 1
+    leader = b'%05dnam %s22%05d   4500' % (length, leader_encoding.encode(), base_address)
+    return leader + directory + b'\x1e' + body + b'\x1d'
+
+
+class CatalogImportTest(TestCase):
+    def setUp(self):
+        self.existing = Book.objects.create(title='Existing', summary='', isbn='9780000000001')
+
+    def test_csv_import_deduplicates(self):
+        data = StringIO(
+            'title,author,isbn,summary,genre,language,copies,status\n'
+            'A Wizard of Earthsea,"Le Guin, Ursula",978-0-547-77374-2,Mages,Fantasy; Classic,English,3,a\n'
+            'The Tombs of Atuan,"Le Guin, Ursula",9780689845369,Tombs,Fantasy,English,2,\n'
+            'A Wizard of Earthsea,"Le Guin, Ursula",9780547773742,Mages,Fantasy,English,1,a\n'
+            'Existing again,Someone Else,9780000000001,,,,4,a\n'
+            'No ISBN,Someone Else,,,,,1,a\n'
+        )
+        stats = CatalogImporter(batch_size=2).run(read_csv(data))
+
+        self.assertEqual(stats['records'], 5)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(Book.objects.count(), 3)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Genre.objects.count(), 2)
+        self.assertEqual(Language.objects.count(), 1)
+        self.assertEqual(BookInstance.objects.count(), 10)
+
+        wizard = Book.objects.get(isbn='9780547773742')
+        self.assertEqual(str(wizard.author), 'Le Guin, Ursula')
+        self.assertEqual(sorted(genre.name for genre in wizard.genre.all()), ['Classic', 'Fantasy'])
+        self.assertEqual((wizard.copies_available, wizard.copies_on_loan), (4, 0))
+        self.assertEqual(BookInstance.objects.filter(book__isbn='9780689845369', status='m').count(), 2)
+        self.assertEqual(self.existing.bookinstance_set.count(), 4)
+        self.assertEqual([book.title for book in SearchResults('tombs')[0:10]], ['The Tombs of Atuan'])
+
+    def test_malformed_records_are_skipped(self):
+        data = StringIO(
+            'title,isbn,copies,status\n'
+            'Two copies,9780000000002,2 copies,a\n'
+            'Negative,9780000000003,-1,a\n'
+            'None at all,9780000000004,0,a\n'
+            'On loan to nobody,9780000000005,1,o\n'
+            'Reserved for nobody,9780000000006,1,r\n'
+            'Unknown status,9780000000007,1,available\n'
+            'Fine,9780000000008,2,a\n'
+        )
+        stats = CatalogImporter(batch_size=3).run(read_csv(data))
+
+        self.assertEqual((stats['records'], stats['skipped'], stats['books'], stats['copies']), (7, 6, 1, 2))
+        self.assertEqual(list(BookInstance.objects.values_list('book__title', 'status')), [('Fine', 'a')] * 2)
+
+    def test_import_refreshes_existing_books(self):
+        Book.objects.filter(pk=self.existing.pk).update(updated_at=timezone.now() - datetime.timedelta(days=1))
+        before = Book.objects.get(pk=self.existing.pk).updated_at
+        versions = (get_version('books'), get_version(f'book:{self.existing.pk}'))
+        CatalogImporter().run(read_csv(StringIO('title,isbn,copies,status\nExisting,9780000000001,2,a\n')))
+
+        self.assertGreater(Book.objects.get(pk=self.existing.pk).updated_at, before)
+        self.assertNotEqual((get_version('books'), get_version(f'book:{self.existing.pk}')), versions)
+
+    def test_jsonl_reader(self):
+        line = json.dumps({'title': 'Lagos Nights', 'author_first_name': 'Ibukun', 'author_last_name': 'Demehin',
+                           'isbn': '1234567890123', 'genres': ['Drama'], 'copies': 2})
+        records = list(read_jsonl(StringIO(line + '\n\n')))
+        self.assertEqual(records[0]['author'], ('Demehin', 'Ibukun'))
+        self.assertEqual(records[0]['genres'], ['Drama'])
+        self.assertEqual(records[0]['copies'], 2)
+
+    def test_marc_reader(self):
+        record = marc_record([
+            ('008', '200517s2012    xxu           000 1 eng d'),
+            ('020', [('a', '9780547773742 (pbk.)')]),
+            ('100', [('a', 'Le Guin, Ursula K.,')]),
+            ('245', [('a', 'A wizard of Earthsea /'), ('c', 'Ursula K. Le Guin.')]),
+            ('264', [('b', 'Houghton Mifflin,'), ('c', '2012.')]),
+            ('520', [('a', 'A young mage on Gont.')]),
+            ('650', [('a', 'Wizards.')]),
+            ('655', [('a', 'Fantasy fiction.')]),
+            ('952', [('p', '0001')]),
+            ('952', [('p', '0002')]),
+        ])
+        records = list(read_marc(BytesIO(record + record)))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0], {
+            'title': 'A wizard of Earthsea', 'summary': 'A young mage on Gont.', 'isbn': '9780547773742',
+            'author': ('Le Guin', 'Ursula K.'), 'genres': ['Wizards', 'Fantasy fiction'], 'language': 'English',
+            'copies': 2, 'imprint': 'Houghton Mifflin, 2012', 'status': None,
+        })
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as handle:
+            handle.write(json.dumps({'title': 'Lagos Nights', 'author': 'Ibukun Demehin', 'isbn': '1234567890123'}))
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('import_catalog', handle.name, status='a', stdout=out)
+        self.assertIn('1 new books', out.getvalue())
+        self.assertEqual(Book.objects.get(isbn='1234567890123').copies_available, 1)
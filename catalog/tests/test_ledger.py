@@ -0,0 +1,121 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.db import connection
+from unittest import skipUnless
+import datetime
+import io
+
+from catalog import ledger, loans
+from catalog.models import Book, BookInstance, LoanEvent
+
+today = datetime.date.today()
+
+
+class LoanEventTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patrons = [User.objects.create_user(username=f'patron{n}', password='1X<ISRUkw+tuK') for n in range(2)]
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='9780000000001')
+        cls.copies = [BookInstance.objects.create(book=cls.book, imprint='Imprint', status='a') for n in range(2)]
+
+    def events(self):
+        return list(LoanEvent.objects.values_list('kind', 'copy', 'borrower', 'due_back'))
+
+    def test_batch_operations(self):
+        ids = [copy.pk for copy in self.copies]
+        due_back = today + datetime.timedelta(days=7)
+        loans.checkout(ids, self.patrons[0], due_back)
+        loans.renew(ids[:1], due_back + datetime.timedelta(days=7))
+        loans.return_copies(ids)
+        patron = self.patrons[0].pk
+        self.assertCountEqual(self.events(), [
+            ('o', ids[0], patron, due_back), ('o', ids[1], patron, due_back),
+            ('n', ids[0], patron, due_back + datetime.timedelta(days=7)),
+            ('r', ids[0], patron, None), ('r', ids[1], patron, None),
+        ])
+        self.assertEqual(list(LoanEvent.objects.filter(copy=ids[0]).values_list('kind', flat=True)), ['o', 'n', 'r'])
+
+    def test_saves(self):
+        copy = loans.lend_copy(self.copies[0].pk, self.patrons[0])
+        copy.imprint = 'Other imprint'
+        copy.save()
+        self.assertEqual(LoanEvent.objects.count(), 1)
+
+        # Handing a copy on loan to someone else returns it first
+        copy.borrower = self.patrons[1]
+        copy.save()
+        self.assertEqual([(kind, borrower) for kind, _, borrower, _ in self.events()],
+                         [('o', self.patrons[0].pk), ('r', self.patrons[0].pk), ('o', self.patrons[1].pk)])
+
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='o', borrower=self.patrons[0],
+                                    due_back=today)
+        self.assertEqual(LoanEvent.objects.count(), 4)
+
+    def test_renew_view(self):
+        librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        copy = loans.lend_copy(self.copies[0].pk, self.patrons[0])
+        self.client.force_login(librarian)
+        due_back = today + datetime.timedelta(weeks=2)
+        self.client.post(reverse('renew-book-librarian', args=[copy.pk]),
+                         {'renewal_date': due_back, 'version': copy.version})
+        self.assertEqual(self.events()[-1], ('n', copy.pk, self.patrons[0].pk, due_back))
+
+    def test_history_outlives_copies(self):
+        patron = User.objects.create_user(username='leaving', password='1X<ISRUkw+tuK')
+        loans.lend_copy(self.copies[0].pk, patron).delete()
+        patron.delete()
+        self.assertEqual(LoanEvent.objects.count(), 1)
+
+    def test_copy_without_book(self):
+        book = Book.objects.create(title='Withdrawn', summary='Summary', isbn='9780000000002')
+        copy = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        loans.checkout([copy.pk], self.patrons[0])
+        book_id = book.pk
+        book.delete()
+        result = loans.return_copies([copy.pk])
+        self.assertEqual(len(result.copies), 1)
+        self.assertEqual(list(LoanEvent.objects.filter(copy=copy.pk).values_list('kind', 'book')),
+                         [('o', book_id), ('r', None)])
+
+    def test_append_only(self):
+        loans.lend_copy(self.copies[0].pk, self.patrons[0])
+        event = LoanEvent.objects.get()
+        event.kind = LoanEvent.RETURN
+        with self.assertRaises(TypeError):
+            event.save()
+
+    def test_drop_history(self):
+        now = datetime.datetime(2026, 3, 15, tzinfo=datetime.timezone.utc)
+        for occurred_at in (datetime.datetime(2025, 12, 31, 23, tzinfo=datetime.timezone.utc),
+                            datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc), now):
+            LoanEvent.objects.create(kind=LoanEvent.CHECKOUT, copy=self.copies[0], book=self.book, occurred_at=occurred_at)
+        # This month and the two before it
+        ledger.drop_history(months=2, now=now)
+        self.assertEqual(LoanEvent.objects.count(), 2)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('maintain_loan_history', stdout=out)
+        self.assertIn('0 older events deleted', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Loan events are only partitioned on PostgreSQL')
+class PartitionTest(TestCase):
+    def test_partitions(self):
+        book = Book.objects.create(title='Book Title', summary='Summary', isbn='9780000000001')
+        copy = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        now = datetime.datetime(2026, 3, 15, tzinfo=datetime.timezone.utc)
+        # Lands in the default partition, and moves with ensure_partitions()
+        LoanEvent.objects.create(kind=LoanEvent.CHECKOUT, copy=copy, book=book, occurred_at=now)
+        self.assertEqual(ledger.ensure_partitions(1, now=now), ['catalog_loanevent_p202603', 'catalog_loanevent_p202604'])
+        self.assertEqual(ledger.ensure_partitions(1, now=now), [])
+        LoanEvent.objects.create(kind=LoanEvent.RETURN, copy=copy, book=book, occurred_at=now)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM catalog_loanevent_p202603')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+        self.assertEqual(ledger.drop_history(0, now=now + datetime.timedelta(days=31)), (1, 0))
+        self.assertEqual(LoanEvent.objects.count(), 0)
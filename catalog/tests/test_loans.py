@@ -0,0 +1,188 @@
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.contrib.auth.models import Permission, User
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+import datetime
+import threading
+import time
+import uuid
+
+from catalog import loans
+from catalog.cache import get_version
+from catalog.models import Book, BookInstance, ConcurrentUpdate
+
+
+class BatchLoanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        cls.books = [Book.objects.create(title=f'Book {n}', summary='Summary', isbn=f'97800000000{n:02d}')
+                     for n in range(10)]
+        cls.copies = [BookInstance.objects.create(book=cls.books[n % 10], imprint='Imprint', status='a')
+                      for n in range(60)]
+
+    def ids(self, copies):
+        return [copy.pk for copy in copies]
+
+    def test_checkout_a_cart_in_constant_queries(self):
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        with self.assertNumQueries(9):
+            # Savepoint, lock, bulk update, loan events, book lock, counters, book timestamps, release,
+            # holds fulfilled
+            result = loans.checkout(self.ids(self.copies), self.borrower, due_back)
+        self.assertEqual(len(result.copies), 60)
+        self.assertEqual(result.skipped, {})
+        self.assertEqual(BookInstance.objects.filter(status='o', borrower=self.borrower, due_back=due_back).count(), 60)
+
+        book = Book.objects.get(pk=self.books[0].pk)
+        self.assertEqual((book.copies_available, book.copies_on_loan), (0, 6))
+
+    def test_skipped_copies_are_explained(self):
+        loans.checkout(self.ids(self.copies[:2]), self.borrower)
+        missing = uuid.uuid4()
+        result = loans.checkout(self.ids(self.copies[:3]) + [missing], self.borrower)
+        self.assertEqual(self.ids(result.copies), [self.copies[2].pk])
+        self.assertEqual(result.skipped, {self.copies[0].pk: 'Copy is on loan', self.copies[1].pk: 'Copy is on loan',
+                                          missing: 'No such copy'})
+
+    def test_return_and_renew(self):
+        loans.checkout(self.ids(self.copies[:10]), self.borrower)
+        version = get_version(f'book:{self.books[0].pk}')
+
+        renewed = datetime.date.today() + datetime.timedelta(weeks=4)
+        self.assertEqual(len(loans.renew(self.ids(self.copies), renewed).copies), 10)
+        self.assertEqual(BookInstance.objects.get(pk=self.copies[0].pk).due_back, renewed)
+        self.assertNotEqual(get_version(f'book:{self.books[0].pk}'), version)
+
+        result = loans.return_copies(self.ids(self.copies[:5]))
+        self.assertEqual(len(result.copies), 5)
+        self.assertEqual(BookInstance.objects.filter(status='a', borrower=None).count(), 55)
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).copies_available, 6)
+
+    def test_due_date_rules(self):
+        with self.assertRaises(ValidationError):
+            loans.renew(self.ids(self.copies), datetime.date.today() - datetime.timedelta(days=1))
+        with self.assertRaises(ValidationError):
+            loans.checkout(self.ids(self.copies), self.borrower, datetime.date.today() + datetime.timedelta(weeks=5))
+        self.assertFalse(BookInstance.objects.filter(status='o').exists())
+
+    def test_circulation_desk(self):
+        librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.client.force_login(librarian)
+
+        cart = '\n'.join(str(pk) for pk in self.ids(self.copies[:50]))
+        response = self.client.post(reverse('circulation-desk'), {'action': 'checkout', 'copies': cart,
+                                                                  'borrower': 'borrower'})
+        self.assertEqual(len(response.context['result'].copies), 50)
+
+        response = self.client.post(reverse('circulation-desk'), {'action': 'checkout', 'copies': 'nope'})
+        self.assertFormError(response, 'form', 'copies', 'Not copy IDs: nope')
+        self.assertFormError(response, 'form', 'borrower', 'Check outs need a borrower')
+
+
+class OptimisticLockingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        cls.book = Book.objects.create(title='Book', summary='Summary', isbn='9780000000000')
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o', borrower=cls.borrower,
+                                               due_back=datetime.date.today())
+
+    def test_save_writes_only_changed_fields(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        BookInstance.objects.filter(pk=copy.pk).update(imprint='Changed elsewhere')
+        copy.due_back = datetime.date.today() + datetime.timedelta(days=7)
+        copy.save()
+        copy.refresh_from_db()
+        self.assertEqual((copy.imprint, copy.version), ('Changed elsewhere', 1))
+
+    def test_stale_save_raises_and_writes_nothing(self):
+        first = BookInstance.objects.get(pk=self.copy.pk)
+        second = BookInstance.objects.get(pk=self.copy.pk)
+        first.status = 'a'
+        first.save()
+        second.due_back = datetime.date.today() + datetime.timedelta(days=7)
+        with self.assertRaises(ConcurrentUpdate):
+            second.save()
+        self.assertEqual(BookInstance.objects.get(pk=self.copy.pk).due_back, datetime.date.today())
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_available, 1)
+
+    def test_renewal_form_detects_intervening_change(self):
+        librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.client.force_login(librarian)
+        url = reverse('renew-book-librarian', args=[self.copy.pk])
+        shown = self.client.get(url).context['form'].initial['version']
+
+        loans.renew([self.copy.pk], datetime.date.today() + datetime.timedelta(days=1))
+        response = self.client.post(url, {'renewal_date': datetime.date.today() + datetime.timedelta(weeks=2),
+                                          'version': shown})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('changed by someone else', str(response.context['form'].non_field_errors()))
+        self.assertEqual(response.context['form']['version'].value(), shown + 1)
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    """Many threads lending the same copy: exactly one wins and nothing is lost"""
+    threads = 8
+
+    def setUp(self):
+        self.book = Book.objects.create(title='Book', summary='Summary', isbn='9780000000000')
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        self.borrowers = [User.objects.create_user(username=f'borrower-{n}') for n in range(self.threads)]
+
+    def run_threads(self, target):
+        barrier = threading.Barrier(self.threads)
+        results = [None] * self.threads
+
+        def run(n):
+            try:
+                barrier.wait()
+                results[n] = target(n)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=run, args=(n,)) for n in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results
+
+    def retry_locked(self, func):
+        # SQLite's shared-cache test database fails a second writer at once rather than waiting
+        while True:
+            try:
+                return func()
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                time.sleep(0.001)
+
+    def test_stale_copies_conflict(self):
+        loaded = [BookInstance.objects.get(pk=self.copy.pk) for _ in range(self.threads)]
+
+        def lend(n):
+            loaded[n].status = 'o'
+            loaded[n].borrower = self.borrowers[n]
+            try:
+                self.retry_locked(loaded[n].save)
+            except ConcurrentUpdate:
+                return False
+            return True
+
+        self.assertEqual(sorted(self.run_threads(lend)), [False] * (self.threads - 1) + [True])
+        self.assertEqual(BookInstance.objects.get(pk=self.copy.pk).version, 1)
+
+    def test_lend_copy_from_many_threads(self):
+        results = self.run_threads(lambda n: self.retry_locked(
+            lambda: loans.lend_copy(self.copy.pk, self.borrowers[n])))
+
+        winners = [copy for copy in results if copy is not None]
+        self.assertEqual(len(winners), 1)
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        self.assertEqual((copy.status, copy.borrower_id, copy.version), ('o', winners[0].borrower_id, 1))
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertEqual((book.copies_available, book.copies_on_loan), (0, 1))
@@ -0,0 +1,58 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+import re
+
+from catalog.metrics import RequestMetrics, registry
+from catalog.models import Author, Book
+
+
+class RequestMetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', author=author)
+
+    def setUp(self):
+        registry.reset()
+        # Render the pages rather than serving them from the anonymous page cache
+        cache.clear()
+
+    def test_counts_repeated_statements(self):
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics.execute):
+            for pk in (1, 2, 3):
+                Book.objects.filter(pk=pk).first()
+            Author.objects.count()
+        self.assertEqual(metrics.queries, 4)
+        self.assertEqual(metrics.duplicates, 2)
+        self.assertEqual(metrics.repeated()[0][1], 3)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries, \d+ repeated", template;dur=[\d.]+$')
+        self.assertNotEqual(re.search(r'template;dur=([\d.]+)', header).group(1), '0.0')
+
+    def test_prometheus_endpoint(self):
+        self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.client.get('/catalog/no-such-page/')
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE catalog_db_queries_total counter', body)
+        self.assertIn('catalog_requests_total{view="book-detail"} 2', body)
+        self.assertIn('catalog_requests_total{view="unmatched"} 1', body)
+
+    def test_endpoint_is_private(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.8')
+        self.assertEqual(response.status_code, 403)
+
+        User.objects.create_user(username='staff', password='1X<ISRUkw+tuK', is_staff=True)
+        self.client.login(username='staff', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.8')
+        self.assertEqual(response.status_code, 200)
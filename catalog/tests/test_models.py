@@ -1,5 +1,7 @@
 from django.test import TestCase
-from catalog.models import Author
+from django.core.management import call_command
+from io import StringIO
+from catalog.models import Author, Book, BookInstance
 
 # Create your tests here
 
@@ -59,4 +61,67 @@ class AuthorModelTest(TestCase):
         self.assertEquals(author.get_absolute_url(), '/catalog/author/1')
 
     # python manage.py test catalog.tests
-    # python manage.py test catalog.tests --verbosity 2
\ No newline at end of file
+    # python manage.py test catalog.tests --verbosity 2
+
+class BookAvailabilityCountersTest(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG')
+        self.other_book = Book.objects.create(title='Other Title', summary='My book summary', isbn='ABCDEFH')
+
+    def counters(self, book):
+        book.refresh_from_db()
+        return (book.copies_available, book.copies_on_loan, book.copies_maintenance, book.copies_reserved)
+
+    def test_create_counts_copy(self):
+        BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016')
+        self.assertEqual(self.counters(self.book), (1, 0, 1, 0))
+
+    def test_status_change_moves_copy(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.status = 'o'
+        copy.save()
+        copy.status = 'r'
+        copy.save()
+        self.assertEqual(self.counters(self.book), (0, 0, 0, 1))
+
+    def test_book_change_moves_copy(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+        copy.book = self.other_book
+        copy.save()
+        self.assertEqual(self.counters(self.book), (0, 0, 0, 0))
+        self.assertEqual(self.counters(self.other_book), (1, 0, 0, 0))
+
+    def test_delete_removes_copy(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='o')
+        BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='o')
+        copy.delete()
+        self.assertEqual(self.counters(self.book), (0, 1, 0, 0))
+        BookInstance.objects.filter(book=self.book).delete()
+        self.assertEqual(self.counters(self.book), (0, 0, 0, 0))
+
+    def test_stale_counter_does_not_block_delete(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='o')
+        # Bypasses the signals: copies_available stays 0 for a copy that is now available
+        BookInstance.objects.filter(pk=copy.pk).update(status='a')
+        BookInstance.objects.get(pk=copy.pk).delete()
+        self.assertEqual(self.counters(self.book), (0, 0, 0, 0))
+
+    def test_stale_instance_does_not_skew_counters(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+        stale = BookInstance.objects.get(pk=copy.pk)
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.status = 'o'
+        copy.save()
+        # Still loaded as available: taking one off copies_available would leave copies_on_loan at 1
+        stale.delete()
+        self.assertEqual(self.counters(self.book), (0, 0, 0, 0))
+
+    def test_rebuild_command(self):
+        BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='o')
+        # Bulk updates bypass the signals, leaving the counters stale until rebuilt
+        BookInstance.objects.update(status='r')
+        call_command('rebuild_availability', stdout=StringIO())
+        self.assertEqual(self.counters(self.book), (0, 0, 0, 2))
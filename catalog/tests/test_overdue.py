@@ -0,0 +1,53 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import Permission, User
+from django.core import mail
+from django.core.management import call_command
+import datetime
+import io
+
+from catalog.models import Book, BookInstance, OverdueSummary
+from catalog.overdue import sweep
+
+
+class OverdueSweepTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date(2020, 6, 15)
+        book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG')
+        cls.borrowers = [User.objects.create_user(username=f'borrower{n}', email=f'borrower{n}@example.com')
+                         for n in range(4)]
+        User.objects.filter(username='borrower3').update(email='')
+        # Each borrower has n + 1 overdue copies, and one copy due today
+        for n, borrower in enumerate(cls.borrowers):
+            for days in range(n + 1):
+                BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=borrower,
+                                            due_back=cls.today - datetime.timedelta(days=days + 1))
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=borrower,
+                                        due_back=cls.today)
+        BookInstance.objects.create(book=book, imprint='Imprint', status='o', due_back=datetime.date(2020, 1, 1))
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a', due_back=datetime.date(2020, 1, 1))
+
+    def test_overdue_queryset(self):
+        self.assertEqual(BookInstance.objects.overdue(self.today).count(), 11)
+        self.assertEqual(BookInstance.objects.overdue(self.today + datetime.timedelta(days=1)).count(), 15)
+
+    def test_one_reminder_per_borrower_across_batches(self):
+        summary = sweep(self.today, batch_size=3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(sorted(message.subject for message in mail.outbox),
+                         ['2 library books are overdue', '3 library books are overdue', 'A library book is overdue'])
+        self.assertEqual(mail.outbox[2].body.count('(due '), 3)
+        self.assertEqual((summary.overdue_loans, summary.borrowers, summary.reminders_sent), (11, 4, 3))
+        self.assertEqual(summary.oldest_due_back, datetime.date(2020, 1, 1))
+
+    def test_command_and_librarian_page(self):
+        call_command('sweep_overdue', '--no-email', stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OverdueSummary.objects.count(), 1)
+
+        librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.client.force_login(librarian)
+        response = self.client.get(reverse('all-borrowed'))
+        self.assertContains(response, 'overdue loans for 4 borrowers')
@@ -0,0 +1,86 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.core.cache import cache
+import datetime
+
+from catalog.models import Author, BookInstance, Book
+from catalog.pagination import CursorPaginator, InvalidCursor
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG')
+        # 10 copies, several sharing a due date and two with no due date at all
+        for copy in range(10):
+            due_back = None if copy < 2 else datetime.date.today() + datetime.timedelta(days=copy % 3)
+            BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', due_back=due_back)
+
+    def walk(self, paginator):
+        """Follow next cursors from the first page, returning the pages seen"""
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def test_forward_walk_matches_full_ordering(self):
+        paginator = CursorPaginator(BookInstance.objects.all(), 3, ('due_back', 'id'))
+        pages = self.walk(paginator)
+        seen = [copy.pk for page in pages for copy in page]
+
+        expected = sorted(BookInstance.objects.all(), key=lambda c: (c.due_back is not None, c.due_back, c.id))
+        self.assertEqual(seen, [copy.pk for copy in expected])
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        self.assertFalse(pages[0].has_previous())
+        self.assertFalse(pages[-1].has_next())
+
+    def test_backward_walk_returns_same_pages(self):
+        paginator = CursorPaginator(BookInstance.objects.all(), 3, ('due_back', 'id'))
+        pages = self.walk(paginator)
+
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual([copy.pk for copy in page], [copy.pk for copy in expected])
+        self.assertFalse(page.has_previous())
+
+    def test_no_count_query(self):
+        paginator = CursorPaginator(BookInstance.objects.all(), 3, ('due_back', 'id'))
+        first = paginator.page()
+        with self.assertNumQueries(1):
+            paginator.page(first.next_cursor)
+
+    def test_tampered_cursor_rejected(self):
+        paginator = CursorPaginator(BookInstance.objects.all(), 3, ('due_back', 'id'))
+        with self.assertRaises(InvalidCursor):
+            paginator.page(paginator.page().next_cursor + 'x')
+
+
+class CursorListViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        for author_id in range(13):
+            Author.objects.create(first_name=f'Ibukun {author_id}', last_name='Demehin')
+
+    def test_cursor_mode_walks_all_authors(self):
+        response = self.client.get(reverse('authors') + '?cursor=')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_paginated'])
+
+        seen = list(response.context['author_list'])
+        while response.context['page_obj'].has_next():
+            response = self.client.get(reverse('authors'), {'cursor': response.context['page_obj'].next_cursor})
+            seen.extend(response.context['author_list'])
+        self.assertEqual(seen, list(Author.objects.order_by('last_name', 'first_name', 'id')))
+
+    def test_offset_mode_is_default(self):
+        response = self.client.get(reverse('authors') + '?page=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].number, 5)
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('authors') + '?cursor=nonsense')
+        self.assertEqual(response.status_code, 404)
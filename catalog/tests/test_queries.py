@@ -0,0 +1,77 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.cache import cache
+import datetime
+
+from catalog import recommendations
+from catalog.models import Author, BookInstance, Book, Genre, Language
+from catalog.tests.utils import QueryBudgetMixin
+
+
+class ViewQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Every catalog page should cost the same number of queries however many rows it shows"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser(username='librarian', password='1X<ISRUkw+tuK', email='')
+        self.language = Language.objects.create(name='English')
+        self.genres = [Genre.objects.create(name=name) for name in ('Fantasy', 'Action')]
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.book = self.make_book()
+        self.make_copies(self.book, 2)
+
+    def make_book(self):
+        book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                   author=Author.objects.create(first_name='Jane', last_name='Doe'),
+                                   language=self.language)
+        book.genre.set(self.genres)
+        return book
+
+    def make_copies(self, book, count):
+        for _ in range(count):
+            BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='o',
+                                        borrower=self.user,
+                                        due_back=datetime.date.today() + datetime.timedelta(days=3))
+
+    def grow(self):
+        for _ in range(3):
+            self.make_copies(self.make_book(), 3)
+        self.make_copies(self.book, 5)
+        Book.objects.update(author=self.author)
+        recommendations.build()
+
+    # The list pages' Last-Modified takes three MAX() lookups (see catalog_last_modified())
+    def test_book_list(self):
+        self.assertQueryBudget(reverse('books'), 5, self.grow)
+
+    def test_book_detail(self):
+        self.assertQueryBudget(reverse('book-detail', args=[self.book.pk]), 5, self.grow)
+
+    def test_author_list(self):
+        self.assertQueryBudget(reverse('authors'), 5, self.grow)
+
+    def test_author_detail(self):
+        self.assertQueryBudget(reverse('author-detail', args=[self.author.pk]), 3, self.grow)
+
+    def test_my_borrowed(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('my-borrowed'), 5, self.grow)
+
+    def test_all_borrowed(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('all-borrowed'), 5, self.grow)
+
+    def test_renew(self):
+        self.client.force_login(self.user)
+        copy = BookInstance.objects.first()
+        self.assertQueryBudget(reverse('renew-book-librarian', args=[copy.pk]), 3, self.grow)
+
+    def test_admin_book_changelist(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('admin:catalog_book_changelist'), 6, self.grow)
+
+    def test_admin_bookinstance_changelist(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('admin:catalog_bookinstance_changelist'), 5, self.grow)
+        self.assertQueryBudget(reverse('admin:catalog_bookinstance_changelist') + '?status__exact=o', 5, self.grow)
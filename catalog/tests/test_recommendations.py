@@ -0,0 +1,147 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.core.management import call_command
+from django.utils import timezone
+from unittest import mock, skipIf
+import datetime
+import io
+import random
+
+from catalog import recommendations
+from catalog.models import Author, Book, Genre, SimilarBook
+
+
+def stored_lists():
+    lists = {}
+    for book_id, similar_id, score in SimilarBook.objects.order_by('book', 'rank').values_list('book', 'similar', 'score'):
+        lists.setdefault(book_id, []).append((similar_id, score))
+    return lists
+
+
+class SimilarBooksTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.genres = [Genre.objects.create(name=f'Genre {n}') for n in range(3)]
+        cls.authors = [Author.objects.create(first_name='Author', last_name=str(n)) for n in range(2)]
+        cls.books = {}
+        for title, author, genres in [('A', 0, (0, 1)), ('B', 0, (0,)), ('C', 1, (0, 1)), ('D', 1, (2,)), ('E', 1, (2,))]:
+            book = Book.objects.create(title=title, summary='Summary', isbn=f'978000000000{len(cls.books)}',
+                                       author=cls.authors[author])
+            book.genre.set([cls.genres[n] for n in genres])
+            cls.books[title] = book
+
+    def titles(self, title):
+        return [row.similar.title for row in SimilarBook.objects.filter(book=self.books[title]).select_related('similar')]
+
+    def test_build(self):
+        self.assertEqual(recommendations.build(k=2), 5)
+        # A = {author 0, genre 0, genre 1}: B shares two of its two features, C two of its three
+        self.assertEqual(self.titles('A'), ['B', 'C'])
+        self.assertEqual(self.titles('D'), ['E', 'C'])
+        self.assertAlmostEqual(SimilarBook.objects.get(book=self.books['A'], rank=1).score, 2 / 6 ** 0.5)
+
+        recommendations.build(k=2, measure='jaccard')
+        self.assertEqual(SimilarBook.objects.get(book=self.books['D'], rank=1).score, 1.0)
+        # Unchanged lists are not rewritten
+        self.assertEqual(recommendations.build(k=2, measure='jaccard'), 0)
+
+    def test_refresh(self):
+        recommendations.build(k=2)
+        self.books['B'].genre.set([self.genres[2]])
+        self.books['B'].author = self.authors[1]
+        self.books['B'].save()
+        # B, A (which listed B) and D and E (which B now enters) change
+        self.assertEqual(recommendations.refresh([self.books['B'].pk], k=2), 4)
+        self.assertEqual(self.titles('D'), ['B', 'E'])
+        self.assertEqual(self.titles('A'), ['C'])
+        refreshed = stored_lists()
+        SimilarBook.objects.all().delete()
+        recommendations.build(k=2)
+        self.assertEqual(stored_lists(), refreshed)
+
+    def test_book_detail(self):
+        url = reverse('book-detail', args=[self.books['A'].pk])
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Similar books')
+        last_modified = response['Last-Modified']
+
+        with mock.patch('catalog.recommendations.timezone.now', return_value=timezone.now() + datetime.timedelta(hours=1)):
+            recommendations.build(k=2)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Similar books')
+        self.assertContains(response, self.books['B'].get_absolute_url())
+
+    def test_renamed_or_deleted_similar_book(self):
+        recommendations.build(k=2)
+        url = reverse('book-detail', args=[self.books['A'].pk])
+        etag = self.client.get(url)['ETag']
+
+        self.books['B'].title = 'B, revised'
+        self.books['B'].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'B, revised')
+
+        etag = response['ETag']
+        link = self.books['B'].get_absolute_url()
+        Book.objects.get(pk=self.books['B'].pk).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, link)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('build_similar_books', '--top', '1', stdout=out)
+        self.assertIn('5 similar book lists changed', out.getvalue())
+        self.assertEqual(SimilarBook.objects.count(), 5)
+
+        out = io.StringIO()
+        call_command('build_similar_books', '--since', '1', '--top', '1', stdout=out)
+        self.assertIn('0 similar book lists changed', out.getvalue())
+
+
+class IncrementalRefreshTest(TestCase):
+    """refresh() after random changes gives the lists a full build() would"""
+
+    def test_random_changes(self):
+        rng = random.Random(3)
+        genres = [Genre.objects.create(name=f'Genre {n}') for n in range(6)]
+        authors = [Author.objects.create(first_name='Author', last_name=str(n)) for n in range(5)]
+        books = []
+        for n in range(40):
+            book = Book.objects.create(title=f'Book {n}', summary='Summary', isbn=f'97800000{n:05d}',
+                                       author=rng.choice(authors))
+            book.genre.set(rng.sample(genres, rng.randint(1, 3)))
+            books.append(book)
+        for measure in recommendations.MEASURES:
+            with self.subTest(measure=measure):
+                recommendations.build(k=4, measure=measure)
+                changed = rng.sample(books, 3)
+                for book in changed:
+                    book.genre.set(rng.sample(genres, rng.randint(0, 3)))
+                    book.author = rng.choice(authors + [None])
+                    book.save()
+                recommendations.refresh([book.pk for book in changed], k=4, measure=measure)
+                refreshed = stored_lists()
+                SimilarBook.objects.all().delete()
+                recommendations.build(k=4, measure=measure)
+                self.assertEqual(stored_lists(), refreshed)
+
+
+class ImplementationsTest(TestCase):
+    def test_same_lists(self):
+        rng = random.Random(5)
+        features = {pk: {(kind, rng.randint(1, 8)) for kind in ('author', 'genre', 'genre')} for pk in range(1, 300)}
+        features[300] = set()
+        for measure in recommendations.MEASURES:
+            python = recommendations.top_similar_python(features, list(features), 5, measure)
+            self.assertEqual(python[300], [])
+            if recommendations.sparse is not None:
+                self.assertEqual(recommendations.top_similar_scipy(features, list(features), 5, measure), python)
+
+    @skipIf(recommendations.sparse is None, 'NumPy and SciPy are not installed')
+    def test_fallback(self):
+        features = {1: {('genre', 1)}, 2: {('genre', 1)}}
+        with mock.patch.object(recommendations, 'sparse', None):
+            self.assertEqual(recommendations.top_similar(features, [1], 5), {1: [(2, 1.0)]})
@@ -0,0 +1,110 @@
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.conf import settings
+from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
+import datetime
+
+from catalog.counters import CATALOG_COUNTS_KEY
+from catalog.models import Author, Book, BookInstance
+from catalog.routers import STICKY_COOKIE, reset_health
+
+
+class StickinessTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_reads_set_no_cookie(self):
+        response = self.client.get(reverse('books'))
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_writes_make_the_visitor_sticky(self):
+        User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.post(reverse('login'), {'username': 'testuser1', 'password': '1X<ISRUkw+tuK'})
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], settings.CATALOG_REPLICA_STICKY_SECONDS)
+
+
+@skipUnless(settings.CATALOG_REPLICAS, 'needs a replica, see locallibrary/replica_test_settings.py')
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        cache.clear()
+        reset_health()
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        author=self.author)
+        self.replicate()
+
+    def replicate(self):
+        """Bring the replica up to date with the primary"""
+        for alias in ('default', 'replica1'):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(connections['replica1'].connection)
+
+    def test_catalog_pages_read_from_the_replica(self):
+        Book.objects.create(title='Not Replicated Yet', summary='Summary', isbn='ABCDEFH', author=self.author)
+        with CaptureQueriesContext(connections['replica1']) as replica_queries:
+            response = self.client.get(reverse('books'))
+        self.assertNotContains(response, 'Not Replicated Yet')
+        self.assertGreater(len(replica_queries), 0)
+
+        self.replicate()
+        cache.clear()
+        self.assertContains(self.client.get(reverse('books')), 'Not Replicated Yet')
+
+    def test_other_pages_read_from_the_primary(self):
+        user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        self.client.force_login(user)
+        with CaptureQueriesContext(connections['replica1']) as replica_queries:
+            response = self.client.get(reverse('my-borrowed'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(replica_queries), 0)
+
+    def test_read_your_writes(self):
+        librarian = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK')
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='o', borrower=librarian,
+                                           due_back=datetime.date.today())
+        self.replicate()
+        self.client.force_login(librarian)
+
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        response = self.client.post(reverse('renew-book-librarian', args=[copy.pk]),
+                                    {'renewal_date': due_back, 'version': copy.version})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(BookInstance.objects.using('replica1').get(pk=copy.pk).due_back, datetime.date.today())
+
+        # The replica has not caught up, but this visitor reads from the primary for now
+        with CaptureQueriesContext(connections['replica1']) as replica_queries:
+            self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertEqual(len(replica_queries), 0)
+
+    def test_unhealthy_replica_skipped(self):
+        with mock.patch('catalog.routers.check_replica', return_value=False) as check:
+            with CaptureQueriesContext(connections['replica1']) as replica_queries:
+                self.assertEqual(self.client.get(reverse('authors')).status_code, 200)
+                cache.clear()
+                self.client.get(reverse('authors'))
+        self.assertEqual(len(replica_queries), 0)
+        # Checked once per CATALOG_REPLICA_CHECK_INTERVAL, not per request
+        self.assertEqual(check.call_count, 1)
+
+    def test_lagging_replica_reads_are_not_cached(self):
+        url = reverse('books')
+        self.client.get(url)
+        self.client.get(reverse('index'))
+        Book.objects.create(title='Not Replicated Yet', summary='Summary', isbn='ABCDEFH', author=self.author)
+
+        # Rendered from the replica, which has not caught up: shown, but not stored under the new versions
+        self.assertNotContains(self.client.get(url), 'Not Replicated Yet')
+        self.assertEqual(self.client.get(reverse('index')).context['num_books'], 1)
+        self.assertIsNone(cache.get(CATALOG_COUNTS_KEY))
+
+        self.replicate()
+        self.assertContains(self.client.get(url), 'Not Replicated Yet')
+        self.assertEqual(self.client.get(reverse('index')).context['num_books'], 2)
@@ -0,0 +1,86 @@
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from unittest import skipUnless
+
+from catalog.models import Author, Book, Genre
+from catalog.search import FallbackSearchBackend, SearchResults, get_search_backend
+
+
+class BookSearchTest(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        self.genre = Genre.objects.create(name='Fantasy')
+        self.wizard = Book.objects.create(title='A Wizard of Earthsea', summary='A young mage on Gont.',
+                                          isbn='9780547773742', author=self.author)
+        self.wizard.genre.set([self.genre])
+        self.other = Book.objects.create(title='Lagos Nights', summary='Not about any wizard at all.',
+                                         isbn='1234567890123')
+
+    def titles(self, text):
+        return [book.title for book in SearchResults(text)[0:10]]
+
+    def test_matches_title_author_genre_and_isbn(self):
+        self.assertEqual(self.titles('Earthsea'), ['A Wizard of Earthsea'])
+        self.assertEqual(self.titles('ursula'), ['A Wizard of Earthsea'])
+        self.assertEqual(self.titles('fantasy'), ['A Wizard of Earthsea'])
+        self.assertEqual(self.titles('9780547773742'), ['A Wizard of Earthsea'])
+
+    def test_title_match_ranks_above_summary_match(self):
+        self.assertEqual(self.titles('wizard'), ['A Wizard of Earthsea', 'Lagos Nights'])
+
+    def test_index_follows_related_edits(self):
+        self.author.last_name = 'Tolkien'
+        self.author.save()
+        self.assertEqual(self.titles('tolkien'), ['A Wizard of Earthsea'])
+
+        self.wizard.genre.clear()
+        self.assertEqual(self.titles('fantasy'), [])
+        self.genre.book_set.add(self.other)
+        self.assertEqual(self.titles('fantasy'), ['Lagos Nights'])
+
+        self.other.delete()
+        self.assertEqual(self.titles('lagos'), [])
+
+    def test_query_syntax_is_inert(self):
+        self.assertEqual(self.titles('"earthsea*'), ['A Wizard of Earthsea'])
+        self.assertEqual(self.titles('earthsea NEAR('), [])
+        self.assertEqual(self.titles('  '), [])
+
+    def test_fallback_backend(self):
+        results = SearchResults('wizard earthsea', backend=FallbackSearchBackend('default'))
+        self.assertEqual(results.count(), 1)
+        self.assertEqual(list(results[0:10]), [self.wizard])
+
+    def test_search_view_paginates(self):
+        for number in range(12):
+            Book.objects.create(title=f'Wizard {number}', summary='', isbn=f'{number:013d}')
+        response = self.client.get(reverse('search'), {'q': 'wizard'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_search.html')
+        self.assertEqual(response.context['paginator'].count, 14)
+        self.assertEqual(len(response.context['book_list']), 10)
+
+        response = self.client.get(reverse('search'), {'q': 'wizard', 'page': 2})
+        self.assertEqual(len(response.context['book_list']), 4)
+
+
+@skipUnless(not isinstance(get_search_backend(), FallbackSearchBackend), 'No full-text search on this database')
+class SearchMigrationTest(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('catalog', target)])
+        return executor.loader.project_state(('catalog', target)).apps
+
+    def test_existing_books_are_indexed(self):
+        apps = self.migrate('0007_bookinstance_loan_indexes')
+        try:
+            author = apps.get_model('catalog', 'Author').objects.create(first_name='Ursula', last_name='Le Guin')
+            apps.get_model('catalog', 'Book').objects.create(title='A Wizard of Earthsea', summary='', isbn='9780547773742',
+                                                               author=author)
+            self.migrate('0008_book_search')
+            self.assertEqual(get_search_backend().count('ursula wizard'), 1)
+        finally:
+            self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('catalog')[0][1])
@@ -0,0 +1,72 @@
+from django.test import TestCase
+from django.conf import settings
+from django.template import Engine
+from django.template.base import Origin
+from unittest import mock
+import os
+from django.urls import reverse
+from django.core.cache import cache
+
+from catalog.models import Author, Book
+from catalog.templating import is_project_template, profile_renders, strip_comments, template_names, warm_templates
+
+
+class StripCommentsTest(TestCase):
+    def test_comments_removed(self):
+        source = ('<p>{# note #}kept</p>{% comment "old" %}{% url "gone" %}{% endcomment %}'
+                  '<!-- <li>{% url "index" %}</li> -->')
+        self.assertEqual(strip_comments(source), '<p>kept</p>')
+
+    def test_comments_kept(self):
+        conditional = '<!--[if IE]><p>old browser</p><![endif]-->'
+        self.assertEqual(strip_comments(conditional), conditional)
+        block = '{% extends "base_generic.html" %}<!-- {% block title %}x{% endblock %} -->'
+        self.assertEqual(strip_comments(block), block)
+        # Without the comments the {% if %} would lose its {% endif %}
+        unbalanced = '{% if a %}<!-- x -->{% if b %}<!-- {% endif %} -->{% endif %}'
+        self.assertEqual(strip_comments(unbalanced), unbalanced)
+
+
+class TemplateLoadingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_project_templates_served_without_comments(self):
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, '<!--')
+        self.assertNotContains(response, 'sidebar-nav')
+
+    def test_project_templates(self):
+        engine = Engine.get_default()
+        for name, expected in [(os.path.join(settings.BASE_DIR, 'templates', 'base_generic.html'), True),
+                               (os.path.join(settings.BASE_DIR, 'catalog', 'templates', 'catalog', 'book_list.html'), True),
+                               (os.path.join(settings.BASE_DIR, 'catalog', 'static', 'css', 'styles.css'), False),
+                               (os.path.join(settings.BASE_DIR, '..', 'elsewhere', 'templates', 'page.html'), False)]:
+            self.assertEqual(is_project_template(Origin(name), engine), expected, name)
+
+        # Django installed in a virtualenv (or Heroku's Python) inside the project directory
+        venv = os.path.join(settings.BASE_DIR, '.heroku', 'python', 'lib', 'python3.8', 'site-packages')
+        admin = os.path.join(venv, 'django', 'contrib', 'admin')
+        admin_config = mock.Mock(path=admin)
+        with mock.patch('catalog.templating.apps.get_app_configs', return_value=[admin_config]):
+            self.assertFalse(is_project_template(Origin(os.path.join(admin, 'templates', 'admin', 'base.html')), engine))
+
+    def test_warm_templates(self):
+        self.assertIn('base_generic.html', template_names())
+        self.assertIn('catalog/book_detail.html', template_names())
+        self.assertEqual(warm_templates(), len(template_names()))
+
+
+class RenderProfileTest(TestCase):
+    def test_templates_and_blocks_timed(self):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', author=author)
+        cache.clear()
+        with profile_renders() as profile:
+            self.client.get(reverse('book-detail', args=[book.pk]))
+        self.client.get(reverse('author-detail', args=[author.pk]))
+
+        self.assertEqual(set(profile.templates), {'catalog/book_detail.html', 'base_generic.html'})
+        self.assertEqual(profile.blocks['catalog/book_detail.html {% block content %}'][0], 1)
+        kind, name, count, total_ms = profile.rows()[0]
+        self.assertEqual((kind, name, count), ('template', 'catalog/book_detail.html', 1))
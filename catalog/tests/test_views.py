@@ -5,9 +5,55 @@ import datetime
 from django.utils import timezone
 from django.contrib.auth.models import User, Permission
 import uuid
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class IndexViewTest(TestCase):
+    def setUp(self):
+        # The counts live in the cache, so start every test from a cold cache
+        cache.clear()
+
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        Genre.objects.create(name='Fantasy')
+        test_book = Book.objects.create(title='The Book Title', summary='My book summary',
+                                        isbn='ABCDEFG', author=test_author)
+        Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFH', author=test_author)
+        BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', status='a')
+        BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', status='o')
+
+    def test_counts_in_context(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['num_books'], 2)
+        self.assertEqual(response.context['num_books_count'], 1)
+        self.assertEqual(response.context['num_instances'], 2)
+        self.assertEqual(response.context['num_instances_available'], 1)
+        self.assertEqual(response.context['num_authors'], 1)
+        self.assertEqual(response.context['num_genre'], 1)
+
+    def test_counts_not_queried_on_cache_hit(self):
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        catalog_queries = [q['sql'] for q in queries.captured_queries if 'catalog_' in q['sql']]
+        self.assertEqual(catalog_queries, [])
+
+    def test_counts_refreshed_after_write(self):
+        self.client.get(reverse('index'))
+        Genre.objects.create(name='Science Fiction')
+        BookInstance.objects.filter(status='o').delete()
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_genre'], 2)
+        self.assertEqual(response.context['num_instances'], 1)
 
 
 class AuthorListViewTest(TestCase):
+    def setUp(self):
+        # Anonymous list pages are cached; these tests inspect the rendered context
+        cache.clear()
+
     @classmethod
     def setUpTestData(cls):
         # Create 13 authors for pagination tests
@@ -0,0 +1,95 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+import datetime
+import io
+import tempfile
+
+from catalog.models import PageVisits
+from catalog.visits import (FLUSH_LOCK_KEY, VISITS_COOKIE, cache_is_shared, flush_visits, local_counts, pending_key,
+                            record_visit)
+
+
+class VisitCounterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_visitor_count_in_signed_cookie(self):
+        for expected in range(3):
+            response = self.client.get(reverse('index'))
+            self.assertEqual(response.context['num_visits'], expected)
+        self.assertEqual(response.cookies[VISITS_COOKIE].value.split(':')[0], '3')
+
+        self.client.cookies[VISITS_COOKIE] = '1000'
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 0)
+
+    def test_no_session_writes(self):
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertEqual([q['sql'] for q in queries.captured_queries if 'django_session' in q['sql']], [])
+        self.assertNotIn('sessionid', response.cookies)
+
+    @override_settings(CATALOG_VISITS_FLUSH_EVERY=3)
+    def test_flushed_in_batches(self):
+        today = datetime.date.today()
+        for n in range(2):
+            self.client.get(reverse('index'))
+        self.assertFalse(PageVisits.objects.exists())
+
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.assertEqual(PageVisits.objects.get(page='index', date=today).visits, 3)
+        self.assertEqual(cache.get(pending_key('index', today)), 1)
+
+        self.assertEqual(flush_visits(), 1)
+        self.assertEqual(PageVisits.objects.get(page='index', date=today).visits, 4)
+        self.assertEqual(flush_visits(), 0)
+
+    def test_flush_command(self):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        record_visit('index', yesterday)
+        record_visit('index', yesterday)
+        with self.assertRaises(CommandError):
+            call_command('flush_visits', stdout=io.StringIO())
+
+        out = io.StringIO()
+        with mock.patch('catalog.management.commands.flush_visits.cache_is_shared', return_value=True):
+            call_command('flush_visits', stdout=out)
+        self.assertIn('2 visits flushed', out.getvalue())
+        self.assertEqual(PageVisits.objects.get(date=yesterday).visits, 2)
+
+    def test_one_flush_at_a_time(self):
+        today = datetime.date.today()
+        for n in range(3):
+            record_visit('index', today)
+        cache.add(FLUSH_LOCK_KEY, True)
+        self.assertEqual(flush_visits(), 0)
+        self.assertEqual(cache.get(pending_key('index', today)), 3)
+
+        cache.delete(FLUSH_LOCK_KEY)
+        self.assertEqual(flush_visits(), 3)
+        self.assertEqual(PageVisits.objects.get(date=today).visits, 3)
+        self.assertEqual(cache.get(pending_key('index', today)), 0)
+
+    def test_file_based_cache_counts_per_process(self):
+        today = datetime.date.today()
+        local_counts.clear()
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                      'LOCATION': directory}}
+            with override_settings(CACHES=file_cache):
+                # Its incr() is a get() and a set(), which loses visits when processes race
+                self.assertFalse(cache_is_shared())
+                record_visit('index', today)
+                record_visit('index', today)
+                self.assertIsNone(cache.get(pending_key('index', today)))
+                self.assertEqual(local_counts.get(pending_key('index', today)), 2)
+                self.assertEqual(flush_visits(), 2)
+                with self.assertRaises(CommandError):
+                    call_command('flush_visits', stdout=io.StringIO())
@@ -0,0 +1,23 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """TestCase mixin for checking that a page costs a fixed number of queries"""
+
+    def count_queries(self, url):
+        """GET url with the test client and return the number of queries it ran, uncached"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertQueryBudget(self, url, budget, grow):
+        """Assert url stays within budget queries, and costs the same before and after grow() adds rows"""
+        before = self.count_queries(url)
+        grow()
+        after = self.count_queries(url)
+        self.assertLessEqual(before, budget, f'{url} ran {before} queries (budget {budget})')
+        self.assertEqual(before, after, f'{url} ran {before} queries, then {after} after adding rows')
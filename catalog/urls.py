@@ -1,10 +1,11 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
     path("", views.index, name='index'),
     path('books/', views.BookListView.as_view(),name='books'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
+    path('search/', views.BookSearchView.as_view(), name='search'),
     path('authors/', views.AuthorListView.as_view(), name='authors'),
     path('author/<int:pk>', views.AuthorDetailView.as_view(), name='author-detail'),
 ]
@@ -12,10 +13,12 @@ urlpatterns = [
 urlpatterns += [
     path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
     path('borrowed/', views.LoanedBooksView.as_view(), name='all-borrowed' ),
+    path('book/<int:pk>/hold', views.book_hold, name='book-hold'),
 ]
 
 urlpatterns += [
     path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
+    path('circulation/', views.circulation_desk, name='circulation-desk'),
 ]
 # We must use pk as the name for our captured primary key value, as this is the parameter name expected by the view classes.
 urlpatterns +=[
@@ -29,3 +32,19 @@ urlpatterns += [
     path('book/<int:pk>/update', views.BookUpdate.as_view(), name='book-update'),
     path('book/<int:pk>/delete', views.BookDelete.as_view(), name='book-delete'),
 ]
+
+urlpatterns += [
+    re_path(r'^export/(?P<dataset>books|copies|authors)\.(?P<format>csv|json|jsonl)$',
+            views.export_catalog, name='export-catalog'),
+    re_path(r'^export/(?P<dataset>books|copies|authors)\.(?P<format>csv|json|jsonl)\.gz$',
+            views.export_catalog, {'compress': True}, name='export-catalog-gzip'),
+]
+
+urlpatterns += [
+    re_path(r'^api/(?P<resource>books|authors|copies|loans)/$', views.api_list, name='api-list'),
+    re_path(r'^api/(?P<resource>books|authors|copies|loans)/(?P<pk>[0-9a-f-]+)$', views.api_detail, name='api-detail'),
+]
+
+urlpatterns += [
+    path('_metrics', views.metrics, name='metrics'),
+]
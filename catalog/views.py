@@ -1,53 +1,74 @@
 from django.shortcuts import render
-from catalog.models import Book, BookInstance, Author, Genre
+from catalog.models import Book, BookInstance, Author, Genre, ConcurrentUpdate, Hold, OverdueSummary, SimilarBook
 from django.views import generic
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 import datetime
-from django.contrib.auth.decorators import permission_required
+from django.contrib.auth.decorators import login_required, permission_required
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse, JsonResponse
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.urls import reverse, reverse_lazy
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
-
-from catalog.forms import RenewBookForm
+from django.db.models import Max
+
+from catalog.forms import CirculationForm, RenewBookForm
+from catalog import holds, loans
+from catalog.concurrency import gather, set_prefetched
+from catalog.counters import get_catalog_counts
+from catalog.pagination import CursorPaginationMixin, InvalidCursor
+from catalog.routers import ReplicaReadMixin, replica_reads
+from catalog.search import SearchResults
+from catalog.exports import CONTENT_TYPES, export
+from catalog import api
+from catalog.metrics import registry
+from catalog.visits import record_visit, set_visitor_count, visitor_count
+from django.conf import settings
+from catalog.cache import (AnonymousPageCacheMixin, ConditionalGetMixin, cacheable_read, get_version, last_deleted,
+                           latest)
 from catalog.models import Author
 
 # Create your views here.
+@replica_reads
 def index(request):
 
     """View function for home page of site"""
 
-    # Generate counts of some of the main objects
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-    num_authors = Author.objects.count()
-
-    num_genre = Genre.objects.all().count()
-    num_books_count = Book.objects.filter(title__contains='The').count()
+    # Generate counts of some of the main objects (served from the counter cache, see catalog/counters.py)
+    counts = get_catalog_counts()
 
-    num_visits = request.session.get('num_visits',0)
-    request.session['num_visits'] = num_visits + 1
+    # Counted in a signed cookie and the cache rather than the session, so a visit costs no session write
+    num_visits = visitor_count(request)
+    record_visit('index')
 
     # wild_books = Book.objects.filter(title__contains='wild')
 
     context={
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
-        'num_genre': num_genre,
-        'num_books_count': num_books_count,
+        'num_books': counts['num_books'],
+        'num_instances': counts['num_instances'],
+        'num_instances_available': counts['num_instances_available'],
+        'num_authors': counts['num_authors'],
+        'num_genre': counts['num_genre'],
+        'num_books_count': counts['num_books_count'],
         'num_visits': num_visits,
     }
 
     # Render the HTML template index.html with the data in the context variable
-    return render(request, 'index.html', context=context)
+    response = render(request, 'index.html', context=context)
+    set_visitor_count(response, num_visits + 1)
+    return response
 
-class BookListView(generic.ListView):
+class BookListView(ReplicaReadMixin, ConditionalGetMixin, AnonymousPageCacheMixin, CursorPaginationMixin, generic.ListView):
     model=Book
     paginate_by = 3
+    cursor_ordering = ('title', 'id')
+    # Each row renders book.author, so join it rather than querying it per row
+    queryset = Book.objects.select_related('author')
+
+    def get_cache_scopes(self):
+        return ['books', 'authors']
+
+    def get_last_modified(self):
+        return catalog_last_modified()
 
 # The view passes the context (list of books) by default as object_list and book_list aliases; either will work.
 
@@ -66,41 +87,137 @@ class BookListView(generic.ListView):
     #     context["some_data"] = 'This is just some data'
     #     return context
 
-class BookDetailView(generic.DetailView):
+class BookDetailView(ReplicaReadMixin, ConditionalGetMixin, AnonymousPageCacheMixin, generic.DetailView):
     model = Book
+    # The template reads the author, language and genres. The copies are loaded by the cached
+    # "copies" fragment in the template, so they are only queried when that fragment is stale.
+    queryset = Book.objects.select_related('author', 'language')
+
+    def get_object(self, queryset=None):
+        # The genres and similar books only need the pk from the URL, so load them alongside the book
+        get_book = super().get_object
+        pk = self.kwargs['pk']
+        book, genres, self.similar_books = gather(
+            lambda: get_book(queryset), lambda: list(Genre.objects.filter(book=pk)),
+            lambda: list(SimilarBook.objects.filter(book=pk).select_related('similar')))
+        set_prefetched(book, 'genre', genres)
+        return book
+
+    def get_cache_scopes(self):
+        return [f"book:{self.kwargs['pk']}", 'authors', 'genres', 'languages']
+
+    def get_last_modified(self):
+        # Changes to copies, genres and the language touch Book.updated_at; the author has its own.
+        # The newest SimilarBook row dates the list of similar books, and their updated_at their titles.
+        row = (Book.objects.filter(pk=self.kwargs['pk'])
+               .annotate(similar_at=Max('similar_books__computed_at'),
+                         similar_updated_at=Max('similar_books__similar__updated_at'))
+               .values_list('updated_at', 'author__updated_at', 'similar_at', 'similar_updated_at').first())
+        return latest(*row) if row else None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['book_version'] = get_version(f'book:{self.object.pk}')
+        # 0 renders the copies fragment without storing it, as for a cached page (see cacheable_read())
+        context['copies_cache_timeout'] = 600 if cacheable_read() else 0
+        context['similar_books'] = self.similar_books
+        return context
 
 # All you need to do now is create a template called /locallibrary/catalog/templates/catalog/book_detail.html, and the view will pass it the database information for the specific Book record extracted by the URL mapper. Within the template you can access the list of books with the template variable named object OR book (i.e. generically "the_model_name").
 
-class AuthorListView(generic.ListView):
+class BookSearchView(ReplicaReadMixin, generic.ListView):
+    """Ranked full-text search over book titles, summaries, ISBNs, authors and genres"""
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
+
+    def get_queryset(self):
+        return SearchResults(self.request.GET.get('q', ''))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
+
+class AuthorListView(ReplicaReadMixin, ConditionalGetMixin, AnonymousPageCacheMixin, CursorPaginationMixin, generic.ListView):
     model = Author
     paginate_by = 3
+    # Author.Meta.ordering plus the primary key as a tie-breaker
+    cursor_ordering = ('last_name', 'first_name', 'id')
 
-class AuthorDetailView(generic.DetailView):
+    def get_cache_scopes(self):
+        return ['authors']
+
+    def get_last_modified(self):
+        return catalog_last_modified()
+
+class AuthorDetailView(ReplicaReadMixin, ConditionalGetMixin, AnonymousPageCacheMixin, generic.DetailView):
     model = Author
 
+    def get_object(self, queryset=None):
+        # The books only need the pk from the URL, so load them alongside the author
+        get_author = super().get_object
+        author, books = gather(lambda: get_author(queryset), lambda: list(Book.objects.filter(author=self.kwargs['pk'])))
+        set_prefetched(author, 'book_set', books)
+        return author
+
+    def get_cache_scopes(self):
+        return [f"author:{self.kwargs['pk']}", 'books']
+
+    def get_last_modified(self):
+        # Deleting one of the author's books touches the author, so the newest row covers the page
+        row = (Author.objects.filter(pk=self.kwargs['pk']).annotate(books_updated_at=Max('book__updated_at'))
+               .values_list('updated_at', 'books_updated_at').first())
+        return latest(*row) if row else None
+
     
-class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
+def catalog_last_modified():
+    """Newest change to any book or author, for the list pages.
+
+    Two index-backed MAX() lookups, and the time of the last book or author deletion, which
+    the post_delete receivers record in CatalogDeletion (see catalog/signals.py).
+    """
+    return latest(*gather(lambda: Book.objects.aggregate(latest=Max('updated_at'))['latest'],
+                          lambda: Author.objects.aggregate(latest=Max('updated_at'))['latest'],
+                          lambda: last_deleted('book', 'author')))
+
+class LoanedBooksByUserListView(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     """Generic class-based view listing books on loan to current user. """
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
     paginate_by = 3
+    cursor_ordering = ('due_back', 'id')
 
     def get_queryset(self):
-        return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back')
+        return (BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o')
+                .select_related('book', 'borrower').order_by('due_back'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['hold_list'] = (Hold.objects.active().filter(patron=self.request.user)
+                                .select_related('book').with_positions())
+        return context
 
-class LoanedBooksView(PermissionRequiredMixin, generic.ListView):
+class LoanedBooksView(PermissionRequiredMixin, CursorPaginationMixin, generic.ListView):
     model = BookInstance
     permission_required = 'catalog.can_mark_returned'
     template_name = 'catalog/all_books_borrowed.html'
     paginate_by = 3
+    cursor_ordering = ('due_back', 'id')
 
     def get_queryset(self):
-        return BookInstance.objects.filter(status__exact='o').order_by('due_back')
+        return BookInstance.objects.filter(status__exact='o').select_related('book', 'borrower').order_by('due_back')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Recorded by `manage.py sweep_overdue`, rather than counted here on every request
+        context['overdue_summary'] = OverdueSummary.objects.first()
+        return context
 
 @permission_required('catalog.can_mark_returned')
 def renew_book_librarian(request, pk):
     """View function for renewing a specific BookInstance by librarian"""
-    book_instance = get_object_or_404(BookInstance, pk=pk)
+    book_instance = get_object_or_404(BookInstance.objects.select_related('book', 'borrower'), pk=pk)
 
     # If this is a POST request then process the Form data
     if request.method =='POST':
@@ -111,14 +228,27 @@ def renew_book_librarian(request, pk):
         if form.is_valid():
             # process the data in form.cleaned_data as required (here we just write it to the model due_back field)
             book_instance.due_back = form.cleaned_data['renewal_date']
-            book_instance.save()
-
-            # redirect to a new URL
-            return HttpResponseRedirect(reverse('all-borrowed'))
+            if form.cleaned_data['version'] is not None:
+                # Only save over the version the form was shown with
+                book_instance.version = form.cleaned_data['version']
+            try:
+                book_instance.save()
+            except ConcurrentUpdate:
+                # Show the copy as it is now and let the librarian decide again
+                book_instance = get_object_or_404(BookInstance.objects.select_related('book', 'borrower'), pk=pk)
+                data = request.POST.copy()
+                data['version'] = book_instance.version
+                form = RenewBookForm(data)
+                form.is_valid()
+                form.add_error(None, 'This copy was changed by someone else while you were renewing it. '
+                                     'Check the details below and submit again.')
+            else:
+                # redirect to a new URL
+                return HttpResponseRedirect(reverse('all-borrowed'))
         # If this is a GET (or any other method) create the default form.
     else:
         proposed_renewal_data = datetime.date.today() + datetime.timedelta(weeks=3)
-        form = RenewBookForm(initial={'renewal_date': proposed_renewal_data})
+        form = RenewBookForm(initial={'renewal_date': proposed_renewal_data, 'version': book_instance.version})
 
     context = {
         'form': form,
@@ -127,6 +257,56 @@ def renew_book_librarian(request, pk):
 
     return render(request, 'catalog/book_renew_librarian.html', context)
 
+@login_required
+def book_hold(request, pk):
+    """Place or cancel the current user's hold on a book"""
+    book = get_object_or_404(Book, pk=pk)
+    hold = Hold.objects.active().filter(book=book, patron=request.user).first()
+    error = None
+    if request.method == 'POST':
+        try:
+            if request.POST.get('action') == 'cancel':
+                if hold is not None:
+                    holds.cancel_hold(hold)
+            else:
+                holds.place_hold(book, request.user)
+        except ValidationError as e:
+            error = ' '.join(e.messages)
+        else:
+            return HttpResponseRedirect(reverse('my-borrowed'))
+
+    context = {
+        'book': book,
+        'hold': hold,
+        'error': error,
+    }
+    return render(request, 'catalog/book_hold.html', context)
+
+@permission_required('catalog.can_mark_returned')
+def circulation_desk(request):
+    """Check out, return or renew a cart of scanned copies in one go"""
+    result = None
+    if request.method == 'POST':
+        form = CirculationForm(request.POST)
+        if form.is_valid():
+            action = form.cleaned_data['action']
+            copy_ids = form.cleaned_data['copies']
+            if action == 'checkout':
+                result = loans.checkout(copy_ids, form.cleaned_data['borrower'], form.cleaned_data['due_back'])
+            elif action == 'return':
+                result = loans.return_copies(copy_ids)
+            else:
+                result = loans.renew(copy_ids, form.cleaned_data['due_back'])
+            form = CirculationForm(initial={'action': action})
+    else:
+        form = CirculationForm(initial={'due_back': datetime.date.today() + loans.LOAN_PERIOD})
+
+    context = {
+        'form': form,
+        'result': result,
+    }
+    return render(request, 'catalog/circulation_desk.html', context)
+
 class AuthorCreate(CreateView):
     model = Author
     fields = '__all__'
@@ -156,4 +336,60 @@ class BookUpdate(UpdateView):
 
 class BookDelete(DeleteView):
     model = Book
-    success_url = reverse_lazy('books')
\ No newline at end of file
+    success_url = reverse_lazy('books')
+
+@permission_required('catalog.can_mark_returned')
+def export_catalog(request, dataset, format, compress=False):
+    """Stream a catalog dataset (books, copies with their borrowers, or authors) as CSV or JSON"""
+    filename = f'{dataset}.{format}' + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        export(dataset, format, compress=compress),
+        content_type='application/gzip' if compress else f'{CONTENT_TYPES[format]}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def api_response(data, status=200):
+    # Compact separators keep the payloads small
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+@replica_reads
+def api_list(request, resource):
+    """One page of a resource as JSON, with ?fields=, ?include=, ?page_size= and ?cursor="""
+    try:
+        data, next_cursor, previous_cursor = api.list_page(request, resource)
+    except (api.ApiError, InvalidCursor) as e:
+        return api_response({'error': str(e)}, status=400)
+    except PermissionDenied as e:
+        return api_response({'error': str(e)}, status=403)
+
+    def link(cursor):
+        if cursor is None:
+            return None
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        return f'{request.path}?{params.urlencode()}'
+
+    return api_response({'data': data, 'next': link(next_cursor), 'previous': link(previous_cursor)})
+
+
+@replica_reads
+def api_detail(request, resource, pk):
+    """A single object of a resource as JSON, with ?fields= and ?include="""
+    try:
+        data = api.detail(request, resource, pk)
+    except api.ApiError as e:
+        return api_response({'error': str(e)}, status=400)
+    except PermissionDenied as e:
+        return api_response({'error': str(e)}, status=403)
+    if data is None:
+        return api_response({'error': 'Not found'}, status=404)
+    return api_response({'data': data})
+
+
+def metrics(request):
+    """Request totals in the Prometheus text format, for staff and scrapers on INTERNAL_IPS"""
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,135 @@
+"""Page visit counters that never write the session.
+
+Each visitor's own count lives in a signed cookie, so a page view costs no django_session
+UPDATE (and none of the row contention that comes with it). Site-wide totals are counted in
+the cache and added to the PageVisits table in batches: by the request that takes a pending
+count past CATALOG_VISITS_FLUSH_EVERY, and by `manage.py flush_visits` (run it from cron so
+quiet pages are flushed too). Visits still pending in a cache that is lost are not recorded.
+
+Counting for every process takes a cache server with an atomic incr(), such as memcached or
+Redis (through django-redis). The file-based and database caches implement incr() as a get()
+followed by a set(), which loses visits when processes count at the same time, so with them
+(as with the default local-memory cache) each process counts in a cache of its own and
+flushes its own visits. The command's process then has nothing pending, so it refuses to run.
+"""
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from catalog.models import PageVisits
+
+VISITS_COOKIE = 'num_visits'
+VISITS_COOKIE_SALT = 'catalog.visits'
+VISITS_COOKIE_MAX_AGE = 60 * 60 * 24 * 365
+# Pending counts older than this many days are not flushed any more
+VISITS_KEY_TIMEOUT = 60 * 60 * 24 * 3
+
+PAGES = ('index',)
+
+FLUSH_LOCK_KEY = 'catalog:visits:flushing'
+# Seconds after which the lock of a flush that died is given up
+FLUSH_LOCK_TIMEOUT = 60
+
+# This process's counts, when the default cache cannot keep them for every process
+local_counts = LocMemCache('catalog-visits', {})
+
+
+def pending_key(page, date):
+    return f'catalog:visits:{page}:{date.isoformat()}'
+
+
+def visitor_count(request):
+    """This visitor's previous visits, from the signed cookie (0 if missing or tampered with)"""
+    try:
+        return max(0, int(request.get_signed_cookie(VISITS_COOKIE, default=0, salt=VISITS_COOKIE_SALT)))
+    except (ValueError, signing.BadSignature):
+        return 0
+
+
+def set_visitor_count(response, count):
+    response.set_signed_cookie(VISITS_COOKIE, count, salt=VISITS_COOKIE_SALT, max_age=VISITS_COOKIE_MAX_AGE,
+                               httponly=True, samesite='Lax')
+
+
+def record_visit(page, today=None):
+    """Count one visit of page in the cache, flushing the page's pending visits once enough have built up"""
+    today = today or datetime.date.today()
+    key = pending_key(page, today)
+    cache = counter_cache()
+    cache.add(key, 0, VISITS_KEY_TIMEOUT)
+    try:
+        pending = cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, VISITS_KEY_TIMEOUT)
+        pending = 1
+    if pending >= settings.CATALOG_VISITS_FLUSH_EVERY:
+        flush_visits([page], [today])
+
+
+def flush_visits(pages=PAGES, dates=None):
+    """Move the pending visit counts of pages into PageVisits; returns the number of visits moved.
+
+    By default the counts of today and yesterday are flushed, so visits counted just before
+    midnight are not left behind. Returns 0 without flushing while another flush is running.
+    """
+    if dates is None:
+        today = datetime.date.today()
+        dates = [today - datetime.timedelta(days=1), today]
+    cache = counter_cache()
+    # One flush at a time: two flushes reading the same pending count would both add it
+    if not cache.add(FLUSH_LOCK_KEY, True, FLUSH_LOCK_TIMEOUT):
+        return 0
+    flushed = 0
+    try:
+        for page in pages:
+            for date in dates:
+                key = pending_key(page, date)
+                pending = cache.get(key) or 0
+                if not pending:
+                    continue
+                # Take only what was read: visits counted meanwhile stay pending for the next flush
+                try:
+                    cache.decr(key, pending)
+                except ValueError:
+                    # Evicted since it was read, so nothing was taken
+                    continue
+                add_visits(page, date, pending)
+                flushed += pending
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return flushed
+
+
+def has_atomic_incr(backend):
+    return type(backend).incr is not BaseCache.incr
+
+
+def cache_is_shared():
+    """Whether the pending counts are kept for every process, without losing any"""
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    return has_atomic_incr(backend) and not isinstance(backend, LocMemCache)
+
+
+def counter_cache():
+    """The cache counting visits: the default one if its incr() is atomic, else local_counts"""
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    return backend if has_atomic_incr(backend) else local_counts
+
+
+def add_visits(page, date, visits):
+    """Add visits to the PageVisits row of page and date, creating it if needed"""
+    if PageVisits.objects.filter(page=page, date=date).update(visits=F('visits') + visits):
+        return
+    try:
+        with transaction.atomic():
+            PageVisits.objects.create(page=page, date=date, visits=visits)
+    except IntegrityError:
+        # Created by a concurrent flush
+        PageVisits.objects.filter(page=page, date=date).update(visits=F('visits') + visits)
@@ -0,0 +1,7 @@
+# Gunicorn settings (see the Procfile)
+import os
+
+# DJANGO_SERVER=asgi serves locallibrary.asgi with uvicorn workers instead of the default sync
+# workers, so a worker keeps answering other requests while one waits on the database
+if os.environ.get('DJANGO_SERVER') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
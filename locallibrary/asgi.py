@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+
+Served by uvicorn workers when DJANGO_SERVER=asgi (see gunicorn.conf.py). Django 3.0 runs
+each request's (synchronous) views in a thread of asgiref's executor, so a slow query holds
+up that one request rather than the whole worker. That relies on asgiref 3.2's
+sync_to_async() defaulting to thread_sensitive=False: keep the asgiref pin of
+requirements.txt until Django is upgraded.
 """
 
 import os
@@ -14,3 +20,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'locallibrary.settings')
 
 application = get_asgi_application()
+
+# Compile the templates now rather than during the first requests
+from catalog.templating import warm_templates  # noqa: E402
+warm_templates()
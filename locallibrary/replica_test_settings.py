@@ -0,0 +1,25 @@
+"""Settings for the read-replica tests: two SQLite files stand in for a primary and a replica.
+
+    python manage.py test catalog.tests.test_routers --settings=locallibrary.replica_test_settings
+
+Nothing replicates between them on its own; the tests copy the primary over the replica
+when they want the replica to catch up.
+"""
+from locallibrary.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test-primary.sqlite3')},
+    },
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test-replica.sqlite3')},
+    },
+}
+CATALOG_REPLICAS = ['replica1']
+
+# The tests do not need collectstatic's manifest
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
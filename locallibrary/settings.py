@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'catalog.metrics.RequestMetricsMiddleware', # Query counts and timings per request (Server-Timing, /catalog/_metrics)
+    'catalog.routers.ReplicaRoutingMiddleware', # Lets the read-only catalog views read from replicas
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware', #Manages sessions across requests
     'django.middleware.common.CommonMiddleware',
@@ -58,14 +60,22 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'locallibrary.urls'
 
+# Project templates are loaded without their comments (see catalog/templating.py). With
+# CATALOG_TEMPLATE_CACHE they are compiled once per process, so edits need a restart.
+CATALOG_TEMPLATE_LOADERS = ['catalog.templating.FilesystemLoader', 'catalog.templating.AppDirectoriesLoader']
+CATALOG_TEMPLATE_CACHE = os.environ.get('CATALOG_TEMPLATE_CACHE', str(not DEBUG)) == 'True'
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The standard Django backend, timing renders for catalog.metrics.RequestMetricsMiddleware
+        'BACKEND': 'catalog.metrics.DjangoTemplates',
         'DIRS': [
             os.path.join(BASE_DIR, 'templates')
         ],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': (
+                [('django.template.loaders.cached.Loader', CATALOG_TEMPLATE_LOADERS)]
+                if CATALOG_TEMPLATE_CACHE else CATALOG_TEMPLATE_LOADERS),
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -90,6 +100,54 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Local-memory by default; set DJANGO_CACHE_DIR to share a file-based cache between worker processes
+# (page visits are still counted per process with it, see catalog/visits.py).
+
+if os.environ.get('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['DJANGO_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'locallibrary',
+        }
+    }
+
+# Seconds an anonymous catalog page stays cached (it is also invalidated by any relevant write)
+CATALOG_PAGE_CACHE_TIMEOUT = 60 * 10
+
+# Record query counts and timings for each request (see catalog/metrics.py). The totals
+# at /catalog/_metrics are readable by staff and from INTERNAL_IPS (e.g. a local Prometheus).
+CATALOG_REQUEST_METRICS = os.environ.get('CATALOG_REQUEST_METRICS', 'True') == 'True'
+INTERNAL_IPS = ['127.0.0.1']
+
+# Threads (each with its own database connection) running the independent queries of a
+# page concurrently, see catalog/concurrency.py; 0 runs them one after the other. Cut down
+# below to fit DATABASE_MAX_CONNECTIONS.
+CATALOG_QUERY_THREADS = int(os.environ.get('CATALOG_QUERY_THREADS', 4))
+
+# Page visits are counted in the cache and added to the PageVisits table once this many are
+# pending (and by `manage.py flush_visits`, which needs memcached or Redis: the file-based
+# cache is shared but cannot count atomically, so each process counts on its own, see
+# catalog/visits.py)
+CATALOG_VISITS_FLUSH_EVERY = int(os.environ.get('CATALOG_VISITS_FLUSH_EVERY', 100))
+
+# Similar books listed on a book's page, as computed by `manage.py build_similar_books`
+# (see catalog/recommendations.py)
+CATALOG_SIMILAR_BOOKS = 5
+
+# Months of loan history kept besides the current one; `manage.py maintain_loan_history` drops
+# older months (see catalog/ledger.py)
+CATALOG_LOAN_HISTORY_MONTHS = int(os.environ.get('CATALOG_LOAN_HISTORY_MONTHS', 7 * 12))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -140,9 +198,44 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 LOGIN_REDIRECT_URL = '/'
 
+# Use keyset (cursor) pagination on the catalog list views for every request, not just
+# for requests carrying a ?cursor= parameter. Avoids COUNT(*) and deep OFFSET scans.
+CATALOG_CURSOR_PAGINATION = os.environ.get('CATALOG_CURSOR_PAGINATION', '') == 'True'
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 # Heroku: Update database configuration from $DATABASE_URL
 import dj_database_url
 db_from_env = dj_database_url.config(conn_max_age=500)
-DATABASES['default'].update(db_from_env)
\ No newline at end of file
+DATABASES['default'].update(db_from_env)
+
+# Read replicas: DATABASE_REPLICA_URLS="postgres://...,postgres://..." adds the databases
+# replica1, replica2, ... The read-only catalog pages read from them (see catalog/routers.py).
+CATALOG_REPLICAS = []
+for n, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{n}'] = dj_database_url.parse(url.strip(), conn_max_age=500)
+    CATALOG_REPLICAS.append(f'replica{n}')
+DATABASE_ROUTERS = ['catalog.routers.ReplicaRouter']
+
+# Connections are kept open for CONN_MAX_AGE (500s), one per thread that has queried, so each
+# worker process holds up to this many connections to each database (replicas included):
+#   request threads + CATALOG_QUERY_THREADS
+# where the request threads are 1 for the sync workers and ASGI_THREADS under DJANGO_SERVER=asgi
+# (asgiref's executor, by default min(32, CPUs + 4)). The WEB_CONCURRENCY workers together must
+# stay under the database's max_connections, e.g. 20 on Heroku's hobby Postgres:
+#   WEB_CONCURRENCY * (request threads + CATALOG_QUERY_THREADS) <= DATABASE_MAX_CONNECTIONS
+# Set DATABASE_MAX_CONNECTIONS to what is left for the web workers (after manage.py, cron, ...)
+# and the pool is cut down to fit, down to 0 (no pool) if the request threads alone fill it.
+DATABASE_MAX_CONNECTIONS = int(os.environ.get('DATABASE_MAX_CONNECTIONS', 0))
+if DATABASE_MAX_CONNECTIONS:
+    web_concurrency = int(os.environ.get('WEB_CONCURRENCY', 1))
+    if os.environ.get('DJANGO_SERVER') == 'asgi':
+        request_threads = int(os.environ.get('ASGI_THREADS', min(32, (os.cpu_count() or 1) + 4)))
+    else:
+        request_threads = 1
+    CATALOG_QUERY_THREADS = max(0, min(CATALOG_QUERY_THREADS,
+                                       DATABASE_MAX_CONNECTIONS // web_concurrency - request_threads))
+# Seconds a visitor reads from the primary after writing (should exceed the replication lag)
+CATALOG_REPLICA_STICKY_SECONDS = 10
+# Seconds between health checks of each replica
+CATALOG_REPLICA_CHECK_INTERVAL = 10
\ No newline at end of file
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'locallibrary.settings')
 
 application = get_wsgi_application()
+
+# Compile the templates now rather than during the first requests
+from catalog.templating import warm_templates  # noqa: E402
+warm_templates()